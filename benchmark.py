@@ -0,0 +1,187 @@
+# End-to-end benchmark of the receive, classify and key output path
+# Runs the server's UDP receiver, action engine and output dispatcher in this
+# process, with the "null" output backend so no keys reach the desktop, and
+# drives them with loadgen.py from separate processes. Each step of the sweep
+# simulates a number of players for a while and reports:
+#   - packets per second offered and received, and packets lost on the way
+#     in (socket buffer overruns, undecodable packets, rejected devices);
+#     packets the jitter delayed past newer ones are counted as stale
+#   - loss seen by the per-device link tracking, simulated loss included
+#   - receive-to-enqueue latency percentiles (datagram received to key press
+#     queued for the outputs) and the output queue latency (queued to delivered)
+#   - server CPU time, in total and per device
+# The sweep stops at the first step that drops packets or saturates a core;
+# the last healthy step is the throughput ceiling of this machine.
+#
+#   python benchmark.py --devices 1 10 50 100 200 --duration 10
+#   python benchmark.py --devices 20 --rate 100 --batch 4 --loss 0.01 --jitter 0.005
+#   python benchmark.py --classifier gesture --receiver asyncio --output results.json
+
+import argparse
+import json
+import threading
+import time
+from typing import Dict
+
+import config
+from config import *
+from devices import DeviceRegistry
+from loadgen import GESTURES, run_processes
+from outputs import create_dispatcher
+from pipeline import LatencyStats, create_engine
+from receiver import create_receiver
+from settings import RuntimeSettings
+
+# A step with more receive loss than this, or more CPU than this fraction of
+# one core, is past the ceiling
+MAX_RECEIVE_LOSS = 0.001
+MAX_CPU = 0.9
+
+
+def _ms(stats: LatencyStats, p: float):
+    value = stats.percentile(p)
+    return round(value * 1000, 3) if value is not None else None
+
+
+def run_step(devices: int, args, port: int) -> Dict:
+    """Start a fresh server stack, load it with `devices` players and measure it"""
+    settings = RuntimeSettings.from_module(config)
+    registry = DeviceRegistry(max(MAX_DEVICES, devices), DEVICE_HISTORY, DEVICE_IDLE_TIMEOUT,
+                              KEY_BINDINGS, DEVICE_KEY_BINDINGS)
+    output = create_dispatcher(["null"], sorted(set(KEY_BINDINGS.values())), OUTPUT_QUEUE_SIZE)
+    # Players start uncalibrated and nothing is written to the live CALIBRATION_PATH
+    engine = create_engine(registry, output.press, args.classifier, verbose=False,
+                           calibration_path=None, settings=settings)
+    engine.latency = LatencyStats(size=1_000_000)
+    output.latency["null"] = LatencyStats(size=1_000_000)
+    receiver = create_receiver(args.receiver, registry, engine, port, UDP_RCVBUF, float('inf'),
+                               RECEIVER_BULK_DRAIN, RECEIVER_DRAIN_BATCH, settings=settings)
+
+    output.start()
+    threads = [threading.Thread(target=receiver.run, name="receiver", daemon=True),
+               threading.Thread(target=engine.run, name="engine", daemon=True)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.5)  # Let the receiver bind before anything is sent
+
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    sent = run_processes("127.0.0.1", port, devices, args.duration, args.processes,
+                         rate=args.rate, batch=args.batch, loss=args.loss, jitter=args.jitter,
+                         gestures=args.gestures, gestures_per_minute=args.gesture_rate,
+                         wire_format=args.format, seed=args.seed)
+    time.sleep(args.settle)  # Let the queues drain
+    cpu = time.process_time() - cpu_started
+    elapsed = time.perf_counter() - started
+
+    stats = receiver.stats
+    links = [device.link for device in registry.devices()]
+    link_received = sum(link.received for link in links)
+    link_lost = sum(link.lost for link in links)
+    presses = engine.latency.count
+
+    receiver.stop()
+    engine.stop()
+    output.stop()
+    for thread in threads:
+        thread.join(timeout=2.0)
+
+    dropped = stats.invalid + stats.rejected + stats.overruns
+    missing = max(0, sent.packets - stats.packets)
+    result = {
+        "devices": devices,
+        "offered_pps": round(sent.packets_per_sec, 1),
+        "received_pps": round(stats.packets / sent.duration, 1) if sent.duration else 0.0,
+        "sent": sent.packets,
+        "received": stats.packets,
+        "receive_loss": round((missing + dropped) / sent.packets, 5) if sent.packets else 0.0,
+        "overruns": stats.overruns,
+        "stale": stats.stale,
+        "duplicates": stats.duplicates,
+        "link_loss": round(link_lost / (link_received + link_lost), 5) if link_received + link_lost else 0.0,
+        "generator_late": sent.late,
+        "gestures": sum(sent.gestures.values()),
+        "keypresses": presses,
+        "enqueue_p50_ms": _ms(engine.latency, 50),
+        "enqueue_p90_ms": _ms(engine.latency, 90),
+        "enqueue_p99_ms": _ms(engine.latency, 99),
+        "enqueue_max_ms": _ms(engine.latency, 100),
+        "output_p99_ms": _ms(output.latency["null"], 99),
+        "cpu_percent": round(100 * cpu / elapsed, 1),
+        "cpu_ms_per_device_second": round(1000 * cpu / elapsed / devices, 3),
+    }
+    result["saturated"] = result["receive_loss"] > MAX_RECEIVE_LOSS or cpu / elapsed > MAX_CPU
+    return result
+
+
+def _cell(value) -> str:
+    return "-" if value is None else str(value)
+
+
+def print_table(results):
+    columns = [("devices", "devices"), ("offered_pps", "offered/s"), ("received_pps", "received/s"),
+               ("receive_loss", "rx loss"), ("link_loss", "link loss"), ("stale", "stale"),
+               ("gestures", "gestures"), ("keypresses", "presses"),
+               ("enqueue_p50_ms", "p50 ms"), ("enqueue_p99_ms", "p99 ms"), ("output_p99_ms", "out p99 ms"),
+               ("cpu_percent", "cpu %"), ("cpu_ms_per_device_second", "cpu ms/dev/s")]
+    rows = [[title for _, title in columns]] + [[_cell(result[key]) for key, _ in columns] for result in results]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+    for row in rows:
+        print("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the receive, classify and key output path")
+    parser.add_argument('--devices', type=int, nargs='+', default=[1, 10, 50, 100],
+                        help="device counts to sweep through")
+    parser.add_argument('--rate', type=float, default=50.0, help="samples per second per device")
+    parser.add_argument('--batch', type=int, default=1, help="samples per datagram")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds per step")
+    parser.add_argument('--settle', type=float, default=1.0, help="seconds to wait for queues to drain")
+    parser.add_argument('--loss', type=float, default=0.0, help="fraction of datagrams dropped at random")
+    parser.add_argument('--jitter', type=float, default=0.0, help="mean extra network delay in seconds")
+    parser.add_argument('--gestures', nargs='+', choices=sorted(GESTURES), default=sorted(GESTURES))
+    parser.add_argument('--gesture-rate', type=float, default=20.0, help="gestures per minute per player")
+    parser.add_argument('--format', choices=['binary', 'json'], default='binary')
+    parser.add_argument('--classifier', choices=['threshold', 'gesture'], default=CLASSIFIER)
+    parser.add_argument('--receiver', choices=['thread', 'asyncio'], default=RECEIVER_MODE)
+    parser.add_argument('--processes', type=int, default=1, help="load generator processes")
+    parser.add_argument('--port', type=int, default=SERVER_PORT + 100,
+                        help="UDP port for the benchmark (not the live server's)")
+    parser.add_argument('--keep-going', action='store_true', help="run every step even past the ceiling")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="write the results to this JSON file")
+    args = parser.parse_args()
+
+    print(f"[INFO] {args.classifier} classifier, {args.receiver} receiver, {args.rate:g} Hz, "
+          f"batch {args.batch}, {args.duration:g}s per step, output stubbed")
+    results = []
+    for devices in args.devices:
+        result = run_step(devices, args, args.port)
+        results.append(result)
+        print(f"[INFO] {devices} devices: {result['received_pps']:.0f} packets/s, "
+              f"receive loss {result['receive_loss']:.2%}, enqueue p99 {_cell(result['enqueue_p99_ms'])} ms, "
+              f"CPU {result['cpu_percent']}%")
+        if result["generator_late"]:
+            print(f"[WARN] The load generator fell behind {result['generator_late']} times, "
+                  f"raise --processes to offer the full rate")
+        if result["saturated"] and not args.keep_going:
+            break
+
+    print()
+    print_table(results)
+    healthy = [result for result in results if not result["saturated"]]
+    if healthy:
+        best = healthy[-1]
+        print(f"\n[INFO] Throughput ceiling: at least {best['devices']} devices "
+              f"({best['received_pps']:.0f} packets/s, {best['received_pps'] * args.batch:.0f} samples/s)")
+    if len(healthy) < len(results):
+        print(f"[INFO] Saturated at {results[len(healthy)]['devices']} devices")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"arguments": vars(args), "results": results}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
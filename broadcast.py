@@ -0,0 +1,64 @@
+# One-producer, many-subscriber broadcaster
+# The producer publishes each payload once; every subscriber receives the same
+# bytes object, so adding viewers costs neither rendering nor copying. Slow
+# subscribers simply skip to the newest payload instead of stalling the producer.
+
+import threading
+from typing import Iterator, Optional, Tuple
+
+
+class Broadcaster:
+    """Holds the latest payload and wakes subscribers when it changes"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._payload: Optional[bytes] = None
+        self._sequence = 0
+        self.subscribers = 0
+        self.published = 0
+        self.closed = False
+
+    def publish(self, payload: bytes):
+        """Replace the latest payload and wake all waiting subscribers"""
+        with self._cond:
+            self._payload = payload
+            self._sequence += 1
+            self.published += 1
+            self._cond.notify_all()
+
+    def close(self):
+        """End every subscription, for shutdown"""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def wait(self, last_sequence: int, timeout: Optional[float] = None) -> Tuple[int, Optional[bytes]]:
+        """Block until a payload newer than last_sequence exists
+
+        Returns (sequence, payload); on timeout the sequence is unchanged.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._sequence > last_sequence or self.closed, timeout)
+            return self._sequence, self._payload
+
+    def subscribe(self, keepalive: Optional[float] = None) -> Iterator[bytes]:
+        """Yield payloads as they are published, skipping ones missed while busy
+
+        With `keepalive`, the latest payload is repeated if nothing new was
+        published for that many seconds, so dead clients are noticed.
+        """
+        with self._cond:
+            self.subscribers += 1
+        try:
+            sequence = 0
+            while not self.closed:
+                latest, payload = self.wait(sequence, keepalive)
+                if self.closed:
+                    break
+                if payload is None:
+                    continue
+                sequence = latest
+                yield payload
+        finally:
+            with self._cond:
+                self.subscribers -= 1
@@ -0,0 +1,201 @@
+# Per-player adaptive calibration
+# The fixed X/Y/Z thresholds in config.py suit some players and not others:
+# kids move the sensor far less than adults, and sensor bias drifts over a
+# session. Each player's profile tracks, per axis, the bias (the mean of the
+# samples taken at rest) and the spread of the whole signal around it with
+# streaming statistics: exact running means (Welford's update) while warming
+# up, then exponentially weighted updates so the profile keeps following
+# drift. Thresholds are set a fixed number of standard deviations from the
+# bias, within configured multiples of the X/Y/Z thresholds, so a very still
+# player never ends up with thresholds a twitch can cross.
+#
+# Profiles are keyed by device id (or IP address for JSON senders) and saved
+# to CALIBRATION_PATH, so a reconnecting player gets their profile instantly.
+
+import json
+import logging
+import math
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+
+class AxisStats:
+    """Streaming bias and variance of one axis
+
+    Only resting samples move the bias, otherwise a player holding a tilt
+    would slowly calibrate it away. The variance covers every sample, since
+    it is the size of the player's movements that sets their thresholds.
+    """
+
+    __slots__ = ("count", "rest_count", "mean", "variance")
+
+    def __init__(self, mean: float = 0.0, variance: float = 0.0, count: int = 0):
+        self.count = count
+        self.rest_count = count
+        self.mean = mean
+        self.variance = variance
+
+    def update(self, value: float, warmup: int, bias_alpha: float, variance_alpha: float,
+               resting: bool) -> None:
+        if resting:
+            self.rest_count += 1
+            # Exact running mean while warming up, exponentially weighted afterwards
+            weight = 1.0 / self.rest_count if self.rest_count <= warmup else bias_alpha
+            self.mean += weight * (value - self.mean)
+
+        self.count += 1
+        deviation = value - self.mean
+        weight = 1.0 / self.count if self.count <= warmup else variance_alpha
+        self.variance += weight * (deviation * deviation - self.variance)
+
+
+class PlayerProfile:
+    """Bias and adapted thresholds of one player"""
+
+    def __init__(self, key: str, axes: Optional[Tuple[AxisStats, AxisStats, AxisStats]] = None):
+        self.key = key
+        self.axes = axes or (AxisStats(), AxisStats(), AxisStats())
+        self.base = None                    # Thresholds the adapted ones are bounded by
+        self.thresholds = (0.0, 0.0, 0.0)   # Adapted thresholds within the bounds of `base`
+        self.updated = 0.0
+
+    @property
+    def samples(self) -> int:
+        return self.axes[0].count
+
+    def to_dict(self) -> Dict:
+        return {
+            "bias": [axis.mean for axis in self.axes],
+            "variance": [axis.variance for axis in self.axes],
+            "samples": self.samples,
+            "updated": self.updated,
+        }
+
+    @classmethod
+    def from_dict(cls, key: str, data: Dict) -> "PlayerProfile":
+        axes = tuple(AxisStats(float(mean), float(variance), int(data.get("samples", 0)))
+                     for mean, variance in zip(data["bias"], data["variance"]))
+        if not all(math.isfinite(axis.mean) and math.isfinite(axis.variance) for axis in axes):
+            raise ValueError(f"non-finite calibration for {key}")
+        profile = cls(key, axes)
+        profile.updated = float(data.get("updated", 0.0))
+        return profile
+
+
+class AdaptiveCalibration:
+    """Keeps a profile per player and applies it to each classified sample
+
+    `base_thresholds` are used until a player's first `warmup` samples have
+    been seen; afterwards each threshold is `sigma` standard deviations of the
+    player's signal, clamped to [min_scale, max_scale] times its base threshold.
+    apply() can be given other base thresholds, e.g. the current runtime or
+    per-device ones, which then take the constructor's place.
+    """
+
+    def __init__(self, base_thresholds: Tuple[float, float, float], warmup: int = 200,
+                 bias_alpha: float = 0.002, variance_alpha: float = 0.001, sigma: float = 1.0,
+                 min_scale: float = 0.75, max_scale: float = 2.0, path: Optional[str] = None):
+        self.base_thresholds = base_thresholds
+        self.warmup = warmup
+        self.bias_alpha = bias_alpha
+        self.variance_alpha = variance_alpha
+        self.sigma = sigma
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.path = path
+        self.profiles: Dict[str, PlayerProfile] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        if path:
+            self.load()
+
+    @staticmethod
+    def player_key(device) -> str:
+        """Stable identity of a player across reconnects (the source port changes)"""
+        if device.device_id is not None:
+            return f"id:{device.device_id}"
+        return f"addr:{device.address[0]}"
+
+    def profile_for(self, device) -> PlayerProfile:
+        profile = device.calibration
+        if profile is None:
+            key = self.player_key(device)
+            with self._lock:
+                profile = self.profiles.get(key)
+                if profile is None:
+                    profile = self.profiles[key] = PlayerProfile(key)
+                elif profile.samples >= self.warmup:
+                    log.info("Loaded calibration for %s (%d samples)", device.name, profile.samples)
+            self._update_thresholds(profile, self.base_thresholds)
+            device.calibration = profile
+        return profile
+
+    def apply(self, device, x: float, y: float, z: float,
+              base_thresholds: Optional[Tuple[float, float, float]] = None):
+        """Update the player's profile with a sample; returns the bias-corrected
+        sample and the thresholds to classify it with
+
+        `base_thresholds` replaces the constructor's ones, both while warming
+        up and as the bounds of the adapted thresholds.
+        """
+        profile = self.profile_for(device)
+        base = base_thresholds or self.base_thresholds
+        if base != profile.base:
+            self._update_thresholds(profile, base)
+        thresholds = profile.thresholds
+        if not (math.isfinite(x) and math.isfinite(y) and math.isfinite(z)):
+            # One NaN would poison the streaming statistics for good, and be saved
+            bx, by, bz = (axis.mean for axis in profile.axes)
+            return x - bx, y - by, z - bz, thresholds
+        for axis, value, threshold in zip(profile.axes, (x, y, z), thresholds):
+            resting = abs(value - axis.mean) < threshold
+            axis.update(value, self.warmup, self.bias_alpha, self.variance_alpha, resting)
+        profile.updated = time.time()
+        self._dirty = True
+        if profile.samples <= self.warmup or profile.samples % 16 == 0:
+            self._update_thresholds(profile, base)
+
+        bx, by, bz = (axis.mean for axis in profile.axes)
+        return x - bx, y - by, z - bz, thresholds
+
+    def _update_thresholds(self, profile: PlayerProfile, base: Tuple[float, float, float]):
+        profile.base = base
+        if profile.samples < self.warmup:
+            profile.thresholds = base
+            return
+        profile.thresholds = tuple(
+            min(limit * self.max_scale, max(limit * self.min_scale, self.sigma * math.sqrt(axis.variance)))
+            for axis, limit in zip(profile.axes, base))
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.profiles = {key: PlayerProfile.from_dict(key, value) for key, value in data.items()}
+            log.info("Loaded %d calibration profiles from %s", len(self.profiles), self.path)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            log.warning("Ignoring unreadable calibration file %s: %s", self.path, e)
+
+    def save(self):
+        """Write all profiles if anything changed; atomic, so a crash never leaves half a file"""
+        if not self.path or not self._dirty:
+            return
+        self._dirty = False
+        with self._lock:
+            data = {key: profile.to_dict() for key, profile in self.profiles.items()}
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        try:
+            with open(temporary, "w") as f:
+                json.dump(data, f, indent=1)
+            os.replace(temporary, self.path)
+        except OSError as e:
+            log.warning("Could not save calibration to %s: %s", self.path, e)
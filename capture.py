@@ -0,0 +1,107 @@
+# Session capture format
+# Every received sample is appended as a fixed-size little-endian record after a
+# small header, so a capture can be memory-mapped straight into a NumPy
+# structured array (see load_capture) without parsing.
+#
+#   header  magic 'TRCAP' | version u8 | record size u16 | reserved (8 bytes)
+#   record  sample time f64 | device u32 | sequence u32 | x f32 | y f32 | z f32
+#
+# The sample time is when the sample was taken, on the server clock: client
+# timestamps are mapped through the link's clock offset, and senders without
+# timestamps are spaced back from the receive time one interval per sample.
+# `device` is the device id for binary packets. Legacy JSON senders have no id
+# and are recorded as 0x10000 + their UDP source port.
+
+import os
+import struct
+import time
+
+import numpy as np
+
+MAGIC = b'TRCAP'
+VERSION = 1
+HEADER = struct.Struct('<5sBH8x')
+
+RECORD = np.dtype([
+    ('time', '<f8'),
+    ('device', '<u4'),
+    ('sequence', '<u4'),
+    ('x', '<f4'),
+    ('y', '<f4'),
+    ('z', '<f4'),
+])
+
+JSON_DEVICE_BASE = 0x10000
+
+
+def capture_id(device) -> int:
+    """Identifier a device is recorded under"""
+    if device.device_id is not None:
+        return device.device_id
+    return JSON_DEVICE_BASE + device.address[1]
+
+
+class CaptureWriter:
+    """Appends samples to a capture file; not thread safe"""
+
+    def __init__(self, path: str, flush_interval: float = 1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.records = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        if not new_file:
+            check_header(path)
+        self.file = open(path, 'ab', buffering=1 << 20)
+        if new_file:
+            self.file.write(HEADER.pack(MAGIC, VERSION, RECORD.itemsize))
+        self._buffer = np.zeros(0, dtype=RECORD)
+        self._last_flush = time.time()
+
+    def append(self, device: int, sequence: int, samples: np.ndarray, timestamps: np.ndarray):
+        """Record a batch of (n, 3) samples with their sample times (server clock)"""
+        count = len(samples)
+        if len(self._buffer) < count:
+            self._buffer = np.zeros(count, dtype=RECORD)
+        records = self._buffer[:count]
+        records['time'] = timestamps
+        records['device'] = device
+        records['sequence'] = sequence
+        records['x'] = samples[:, 0]
+        records['y'] = samples[:, 1]
+        records['z'] = samples[:, 2]
+        self.file.write(records.tobytes())
+        self.records += count
+
+        now = time.time()
+        if now - self._last_flush >= self.flush_interval:
+            self.file.flush()
+            self._last_flush = now
+
+    def close(self):
+        self.file.close()
+
+
+def check_header(path: str):
+    """Raise ValueError unless `path` is a capture this version can read"""
+    with open(path, 'rb') as f:
+        data = f.read(HEADER.size)
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path}: truncated capture header")
+    magic, version, record_size = HEADER.unpack(data)
+    if magic != MAGIC:
+        raise ValueError(f"{path}: not a capture file")
+    if version != VERSION or record_size != RECORD.itemsize:
+        raise ValueError(f"{path}: unsupported capture version {version}")
+
+
+def load_capture(path: str) -> np.ndarray:
+    """Memory-map a capture as a structured array of RECORD"""
+    check_header(path)
+    size = os.path.getsize(path) - HEADER.size
+    count = size // RECORD.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=RECORD)
+    return np.memmap(path, dtype=RECORD, mode='r', offset=HEADER.size, shape=(count,))
@@ -6,17 +6,124 @@ X_THRESHOLD = 0.3    # Left/Right tilt sensitivity (higher = less sensitive)
 Y_THRESHOLD = 0.3    # Forward/Backward tilt sensitivity (higher = less sensitive)
 Z_THRESHOLD = 0.3    # Up/Down movement sensitivity (higher = less sensitive)
 
+# Per-player adaptive calibration (threshold classifier): tracks each player's bias
+# and sets their thresholds from how much their signal varies
+ADAPTIVE_CALIBRATION = True
+CALIBRATION_PATH = "calibration.json"  # Profiles persisted across reconnects and restarts (None disables)
+CALIBRATION_WARMUP = 200          # Samples before a new player's thresholds adapt (the ones above are used until then)
+CALIBRATION_BIAS_ALPHA = 0.002    # Weight of each resting sample in the bias estimate
+CALIBRATION_VARIANCE_ALPHA = 0.001  # Weight of each sample in the variance estimate
+THRESHOLD_SIGMA = 1.0             # Thresholds at this many standard deviations of the player's signal
+MIN_THRESHOLD_SCALE = 0.75        # Adapted thresholds stay between these multiples of the ones above
+MAX_THRESHOLD_SCALE = 2.0
+CALIBRATION_SAVE_INTERVAL = 30.0  # Seconds between saves of changed profiles
+
 # Network configuration
 SERVER_PORT = 5001   # UDP port for receiving accelerometer data
 WEB_PORT = 5000      # HTTP port for web interface
+DISCOVERY_PORT = 5003     # UDP port where Pi clients find the server and get instructions (0 disables it)
+CONTROL_INTERVAL = 5.0    # Seconds between instructions to each client; they double as keepalives
+CLIENT_SAMPLE_RATE = 0    # Sample rate clients are told to use, in Hz (0 leaves each at its own)
+
+# Web serving: "werkzeug" (built in, a thread per connection) or "waitress" (pip install waitress).
+# Every open video feed or telemetry stream holds a thread, so size WEB_THREADS for the viewers.
+WEB_SERVER = "werkzeug"
+WEB_THREADS = 64          # Worker threads of the "waitress" server
+SHUTDOWN_TIMEOUT = 5.0    # Seconds to wait for the background services on shutdown
+
+# Pipeline layout: "threads" runs everything in the server process; "processes" gives the UDP
+# receiver, the classifier and the video renderer a process each, connected through shared
+# memory, so rendering for many viewers cannot delay key presses (see process_pipeline.py)
+PIPELINE_MODE = "threads"
+SHARED_RING_SIZE = 65536     # Samples the receiver process may be ahead of the classifier
+SHARED_FRAME_SIZE = 1 << 20  # Largest encoded frame passed on by the renderer process, in bytes
+RENDERER_NICE = 10           # Scheduling priority drop of the renderer process (0 keeps it)
+
+# UDP receiver settings
+RECEIVER_MODE = "thread"     # "thread" (blocking socket) or "asyncio"
+RECEIVER_BULK_DRAIN = True   # asyncio mode: drain every pending datagram on each wakeup
+RECEIVER_DRAIN_BATCH = 256   # asyncio mode: max datagrams read per wakeup
+UDP_RCVBUF = 1 << 20         # Socket receive buffer in bytes (0 keeps the OS default)
+RECEIVER_STATS_INTERVAL = 10.0  # Seconds between receiver statistics reports
+MAX_SAMPLE_AGE = 0.5         # Drop packets delayed this many seconds beyond a device's usual latency (0 disables)
+
+# Signal filtering, applied to each device's recent samples before classification
+FILTER_WINDOW = 32        # Samples fed to the filter chain
+FILTER_SAMPLE_RATE = 50   # Hz, nominal sensor rate used to design the low/high-pass filters
+FILTER_CHAIN = [("moving_average", {"length": 4})]
+# Available stages, applied in order (an empty list classifies raw samples):
+#   ("moving_average", {"length": 4})
+#   ("exponential", {"alpha": 0.3})
+#   ("lowpass", {"cutoff": 8.0, "q": 0.7071})   # cutoff in Hz
+#   ("highpass", {"cutoff": 0.5, "q": 0.7071})
+
+# Action classifier
+# "threshold": static tilt thresholds below (X_THRESHOLD, Y_THRESHOLD, Z_THRESHOLD)
+# "gesture":   recognizes real jumps, lateral hops and spot jogging
+CLASSIFIER = "threshold"
+
+# Gesture recognition settings (CLASSIFIER = "gesture")
+GESTURE_WINDOW = 64          # Samples analyzed per decision (about 1.3 s at 50 Hz)
+GESTURE_VERTICAL_AXIS = 1    # Axis index (0=x, 1=y, 2=z) that points up when standing
+GESTURE_LATERAL_AXIS = 0     # Axis index that points sideways
+GESTURE_IMPULSE_SAMPLES = 8  # Newest samples searched for a jump/hop peak
+HOP_THRESHOLD = 0.6          # Lateral peak for a hop left/right
+JUMP_THRESHOLD = 0.6         # Vertical peak for a jump
+GESTURE_REFRACTORY = 0.3     # Seconds after a jump/hop before another one can fire
+JOG_MIN_AMPLITUDE = 0.15     # Vertical standard deviation while jogging
+JOG_MIN_HZ = 1.2             # Step cadence range accepted as spot jogging
+JOG_MAX_HZ = 4.0
+GESTURE_MIN_CONFIDENCE = 0.5 # Gestures below this confidence are ignored
 
 # Game control settings
 WAIT_TIME = 0.1      # Minimum time between key presses (seconds)
-PROCESSING_DELAY = 0.05  # Delay in accelerometer processing loop (seconds)
+LATENCY_REPORT_INTERVAL = 10.0  # Seconds between receive-to-enqueue latency reports
+
+# Session capture: append every received sample to this file for replay.py (None disables)
+CAPTURE_PATH = None   # e.g. "captures/session.trcap"
+
+# Multi-device settings
+MAX_DEVICES = 64          # Devices tracked at once; packets from extra devices are ignored
+DEVICE_HISTORY = 256      # Samples kept per device
+DEVICE_IDLE_TIMEOUT = 10.0  # Seconds without data before a device is forgotten
+
+# Key output: any combination of "pyautogui", "uinput" (Linux, needs python-evdev),
+# "websocket" (browser games, needs websockets), "null" and "recording"
+OUTPUT_BACKENDS = ["pyautogui"]
+OUTPUT_QUEUE_SIZE = 64    # Key presses waiting per backend; the oldest are dropped when full
+WEBSOCKET_PORT = 5002     # Port of the "websocket" output
+
+# Keys pressed for each action, per device overrides are keyed by device id or IP address
+KEY_BINDINGS = {"up": "up", "down": "down", "left": "left", "right": "right"}
+DEVICE_KEY_BINDINGS = {
+    # 2: {"up": "w", "down": "s", "left": "a", "right": "d"},
+    # "192.168.1.42": {"up": "i", "down": "k", "left": "j", "right": "l"},
+}
 
 # Visualization settings
 CANVAS_WIDTH = 640
 CANVAS_HEIGHT = 480
+RENDER_FPS = 20      # Target frame rate of the video feed; unchanged frames reuse the last JPEG
+TELEMETRY_HZ = 30     # Update rate of the /telemetry event stream
+FRAME_KEEPALIVE = 1.0  # Resend the last frame after this many idle seconds so closed viewers are noticed
+
+# Runtime settings: thresholds, WAIT_TIME, GESTURE_MIN_CONFIDENCE, MAX_SAMPLE_AGE, CLIENT_SAMPLE_RATE,
+# RENDER_FPS, TELEMETRY_HZ, FRAME_KEEPALIVE and LOG_LEVEL can be changed while the
+# server runs, through POST /config or by editing this JSON file
+SETTINGS_PATH = "settings.json"   # Watched for changes (None disables the watcher)
+SETTINGS_POLL_INTERVAL = 1.0      # Seconds between checks of SETTINGS_PATH
+DEVICE_OVERRIDES = {
+    # 2: {"X_THRESHOLD": 0.2, "WAIT_TIME": 0.2},
+    # "192.168.1.42": {"Y_THRESHOLD": 0.5},
+}
+
+# Logging and diagnostics
+LOG_LEVEL = "INFO"        # DEBUG, INFO, WARNING or ERROR
+LOG_RATE_INTERVAL = 1.0   # Each log message is limited to LOG_RATE_BURST records per interval (0 disables)
+LOG_RATE_BURST = 5
+PROFILER_ENABLED = False  # Serve /profile?seconds=N with collapsed stacks from a sampling profiler
+PROFILER_INTERVAL = 0.005  # Seconds between profiler samples
+PROFILER_MAX_SECONDS = 60
 
 # 3D Plane Control Mapping
 # X-axis: Left/Right movement
@@ -0,0 +1,201 @@
+# Device/session registry for the accelerometer server
+# Every sensor gets its own sample history, action state and key bindings so
+# one server can drive many players at once.
+
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from link import LinkStats
+
+log = logging.getLogger(__name__)
+
+
+class RingBuffer:
+    """Fixed-size circular buffer of xyz samples with receive timestamps"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.samples = np.zeros((capacity, 3), dtype=np.float32)
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.head = 0   # Index of the next write
+        self.size = 0
+
+    def extend(self, samples: np.ndarray, timestamps: np.ndarray):
+        """Append a batch of samples, overwriting the oldest ones when full"""
+        count = len(samples)
+        if count > self.capacity:
+            samples = samples[-self.capacity:]
+            timestamps = timestamps[-self.capacity:]
+            count = self.capacity
+
+        first = min(count, self.capacity - self.head)
+        self.samples[self.head:self.head + first] = samples[:first]
+        self.timestamps[self.head:self.head + first] = timestamps[:first]
+        if first < count:
+            self.samples[:count - first] = samples[first:]
+            self.timestamps[:count - first] = timestamps[first:]
+
+        self.head = (self.head + count) % self.capacity
+        self.size = min(self.size + count, self.capacity)
+
+    def latest(self) -> Tuple[float, float, float]:
+        """Most recent sample, or zeros when empty"""
+        if self.size == 0:
+            return 0.0, 0.0, 0.0
+        x, y, z = self.samples[self.head - 1].tolist()
+        return x, y, z
+
+    def window(self, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Copy of the newest n samples and timestamps, oldest first"""
+        n = min(n, self.size)
+        start = self.head - n
+        if start >= 0:
+            return self.samples[start:self.head].copy(), self.timestamps[start:self.head].copy()
+        return (np.concatenate((self.samples[start:], self.samples[:self.head])),
+                np.concatenate((self.timestamps[start:], self.timestamps[:self.head])))
+
+
+class Device:
+    """State for a single connected sensor"""
+
+    def __init__(self, key, device_id: Optional[int], address, history: int, key_map: Dict[str, str]):
+        self.key = key
+        self.device_id = device_id
+        self.address = address
+        self.key_map = key_map
+        self.history = RingBuffer(history)
+        self.lock = threading.Lock()
+
+        # Action state
+        self.current_action = None
+        self.confidence = 0.0
+        self.thresholds = None      # (x, y, z) thresholds the newest sample was classified with
+        self.gesture_state = None   # Owned by the gesture engine
+        self.calibration = None     # PlayerProfile, owned by the adaptive calibration
+        self.settings = None        # Cached settings Snapshot with this device's overrides
+        self.last_press = 0.0
+        self.pending = False        # Queued for classification
+        self.events = deque(maxlen=16)  # (action, confidence) classified on the device itself
+        self.received_at = 0.0      # perf_counter() of the newest packet
+        self.link = LinkStats()     # Sequence, loss and latency accounting
+
+        # Bookkeeping
+        self.first_seen = self.last_seen = time.time()
+        self.packets = 0
+        self.samples = 0
+
+    @property
+    def name(self) -> str:
+        if self.device_id is not None:
+            return f"device {self.device_id}"
+        return f"{self.address[0]}:{self.address[1]}"
+
+    def add_samples(self, samples: np.ndarray, timestamps: np.ndarray, now: float):
+        """Record a decoded batch of samples"""
+        with self.lock:
+            self.history.extend(samples, timestamps)
+            self.last_seen = now
+            self.packets += 1
+            self.samples += len(samples)
+
+    def seen(self, now: float):
+        """Record a packet that carried no samples (events or heartbeats)"""
+        with self.lock:
+            self.last_seen = now
+            self.packets += 1
+
+    def latest(self) -> Tuple[float, float, float]:
+        with self.lock:
+            return self.history.latest()
+
+    def window(self, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        with self.lock:
+            return self.history.window(n)
+
+
+class DeviceRegistry:
+    """Maps source address or device id to per-device state with bounded memory"""
+
+    def __init__(self, max_devices: int, history: int, idle_timeout: float,
+                 key_bindings: Dict[str, str], device_key_bindings: Optional[Dict] = None):
+        self.max_devices = max_devices
+        self.history = history
+        self.idle_timeout = idle_timeout
+        self.key_bindings = key_bindings
+        self.device_key_bindings = device_key_bindings or {}
+        self.rejected = 0
+        self._devices: Dict[object, Device] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(device_id: Optional[int], address) -> object:
+        """Binary packets identify themselves; legacy JSON senders are keyed by address"""
+        if device_id is not None:
+            return ('id', device_id)
+        return ('addr', address)
+
+    def lookup(self, device_id: Optional[int], address, now: float) -> Optional[Device]:
+        """Find or register the device a packet came from
+
+        Returns None when the registry is full of active devices.
+        """
+        key = self.make_key(device_id, address)
+        device = self._devices.get(key)
+        if device is not None:
+            device.address = address
+            return device
+
+        with self._lock:
+            device = self._devices.get(key)
+            if device is not None:
+                return device
+            if len(self._devices) >= self.max_devices:
+                self._evict_idle_locked(now)
+                if len(self._devices) >= self.max_devices:
+                    self.rejected += 1
+                    return None
+
+            device = Device(key, device_id, address, self.history, self._key_map_for(device_id, address))
+            self._devices[key] = device
+            log.info("New device connected: %s from %s", device.name, address[0])
+            return device
+
+    def _key_map_for(self, device_id: Optional[int], address) -> Dict[str, str]:
+        key_map = dict(self.key_bindings)
+        overrides = self.device_key_bindings.get(device_id)
+        if overrides is None:
+            overrides = self.device_key_bindings.get(address[0], {})
+        key_map.update(overrides)
+        return key_map
+
+    def evict_idle(self, now: float) -> List[Device]:
+        """Forget devices that have not sent anything for idle_timeout seconds"""
+        with self._lock:
+            return self._evict_idle_locked(now)
+
+    def _evict_idle_locked(self, now: float) -> List[Device]:
+        evicted = [d for d in self._devices.values() if now - d.last_seen > self.idle_timeout]
+        for device in evicted:
+            del self._devices[device.key]
+            log.info("Device idle, removed: %s", device.name)
+        return evicted
+
+    def devices(self) -> List[Device]:
+        """Snapshot of the registered devices"""
+        with self._lock:
+            return list(self._devices.values())
+
+    def most_recent(self) -> Optional[Device]:
+        """The device that sent data most recently"""
+        devices = self.devices()
+        if not devices:
+            return None
+        return max(devices, key=lambda d: d.last_seen)
+
+    def __len__(self) -> int:
+        return len(self._devices)
@@ -0,0 +1,126 @@
+# Server discovery and client instructions
+# Pi clients with SERVER_IP = None broadcast a discover datagram to
+# DISCOVERY_PORT and send their samples wherever the answer points. The same
+# socket then sends every known binary client a control datagram each
+# CONTROL_INTERVAL, and right away when its CLIENT_SAMPLE_RATE changes,
+# telling it which sample rate to use. Clients treat these as keepalives and
+# look for the server again when they stop arriving.
+#
+# Run on its own, this module is a stand-in responder that points clients at
+# a server elsewhere, e.g. one in a container that cannot see broadcasts:
+#
+#   python discovery.py --server 192.168.1.50
+
+import argparse
+import logging
+import socket
+import threading
+import time
+from typing import Dict, Tuple
+
+import protocol
+from config import *
+from logs import setup_logging
+
+log = logging.getLogger(__name__)
+
+
+class DiscoveryServer:
+    """Answers discover broadcasts and keeps registered clients instructed
+
+    Without a registry it only answers, pointing clients at `server_address`
+    ("0.0.0.0" for this host) and leaving their sample rate alone.
+    """
+
+    def __init__(self, registry=None, settings=None, port: int = DISCOVERY_PORT, data_port: int = SERVER_PORT,
+                 server_address: str = "0.0.0.0", interval: float = CONTROL_INTERVAL):
+        self.registry = registry
+        self.settings = settings
+        self.port = port
+        self.data_port = data_port
+        self.server_address = server_address
+        self.interval = interval
+        self.sent: Dict[object, Tuple[float, float]] = {}  # Device key -> (sample rate, time) last sent
+        self.requests = 0
+        self._stop = threading.Event()
+
+    def sample_rate(self, device_id, address: str) -> float:
+        """CLIENT_SAMPLE_RATE for a device, with its DEVICE_OVERRIDES"""
+        if self.settings is None:
+            return 0.0
+        overrides = self.settings.overrides.get(device_id) or self.settings.overrides.get(address) or {}
+        return overrides.get("CLIENT_SAMPLE_RATE", self.settings.current.CLIENT_SAMPLE_RATE)
+
+    def answer(self, sock: socket.socket, data: bytes, addr):
+        device_id = protocol.decode_discover(data)
+        if device_id is None:
+            return
+        self.requests += 1
+        rate = self.sample_rate(device_id, addr[0])
+        sock.sendto(protocol.encode_control(self.server_address, self.data_port, rate), addr)
+        log.info("Device %d at %s found the server", device_id, addr[0])
+
+    def instruct(self, sock: socket.socket, now: float):
+        """Send each binary client its sample rate when it changed or the interval passed"""
+        current = set()
+        for device in self.registry.devices():
+            if device.device_id is None:
+                continue    # Legacy JSON senders do not listen
+            current.add(device.key)
+            rate = self.sample_rate(device.device_id, device.address[0])
+            last = self.sent.get(device.key)
+            if last is not None and last[0] == rate and now - last[1] < self.interval:
+                continue
+            try:
+                sock.sendto(protocol.encode_control(self.server_address, self.data_port, rate), device.address)
+            except OSError as e:
+                log.debug("Could not instruct %s: %s", device.name, e)
+            if last is None or last[0] != rate:
+                log.info("Telling %s to sample at %s", device.name, f"{rate:g} Hz" if rate else "its own rate")
+            self.sent[device.key] = (rate, now)
+        for key in set(self.sent) - current:
+            del self.sent[key]
+
+    def run(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(('0.0.0.0', self.port))
+        sock.settimeout(0.25)
+        log.info("Answering server discovery on UDP port %d", self.port)
+        try:
+            while not self._stop.is_set():
+                try:
+                    data, addr = sock.recvfrom(64)
+                    self.answer(sock, data, addr)
+                except socket.timeout:
+                    pass
+                except OSError as e:
+                    log.warning("Discovery error: %s", e)
+                if self.registry is not None:
+                    self.instruct(sock, time.time())
+        finally:
+            sock.close()
+
+    def stop(self):
+        self._stop.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Point Pi clients at a server that cannot answer discovery itself")
+    parser.add_argument('--server', required=True, help="IPv4 address of the accelerometer server")
+    parser.add_argument('--port', type=int, default=SERVER_PORT, help="its UDP sample port")
+    parser.add_argument('--discovery-port', type=int, default=DISCOVERY_PORT)
+    args = parser.parse_args()
+
+    setup_logging(LOG_LEVEL, LOG_RATE_INTERVAL, LOG_RATE_BURST)
+    responder = DiscoveryServer(port=args.discovery_port, data_port=args.port,
+                                server_address=socket.gethostbyname(args.server))
+    print(f"[INFO] Pointing clients at {args.server}:{args.port}, press Ctrl+C to stop")
+    try:
+        responder.run()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# Vectorized signal filters over a device's recent samples
+# Every stage is expressed as an impulse response (kernel). Stages in a chain
+# are combined into one kernel up front, so filtering a window is a single
+# matrix-vector product over all three axes instead of per-sample Python
+# arithmetic. The IIR stages (exponential smoothing and the biquads) are
+# represented by their impulse response truncated to the window length.
+
+import math
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+
+def moving_average_kernel(length: int) -> np.ndarray:
+    """Equal weights over the last `length` samples"""
+    return np.full(length, 1.0 / length)
+
+
+def exponential_kernel(alpha: float, length: int) -> np.ndarray:
+    """Exponential smoothing y[n] = alpha * x[n] + (1 - alpha) * y[n-1]"""
+    return alpha * (1.0 - alpha) ** np.arange(length)
+
+
+def biquad_coefficients(kind: str, cutoff: float, sample_rate: float, q: float = 0.7071) -> Tuple[np.ndarray, np.ndarray]:
+    """Low- or high-pass biquad (b, a) coefficients, normalized so a[0] == 1"""
+    w0 = 2.0 * math.pi * cutoff / sample_rate
+    cos_w0 = math.cos(w0)
+    alpha = math.sin(w0) / (2.0 * q)
+    if kind == "lowpass":
+        b = np.array([(1 - cos_w0) / 2, 1 - cos_w0, (1 - cos_w0) / 2])
+    elif kind == "highpass":
+        b = np.array([(1 + cos_w0) / 2, -(1 + cos_w0), (1 + cos_w0) / 2])
+    else:
+        raise ValueError(f"Unknown biquad type: {kind}")
+    a = np.array([1 + alpha, -2 * cos_w0, 1 - alpha])
+    return b / a[0], a / a[0]
+
+
+def impulse_response(b: np.ndarray, a: np.ndarray, length: int) -> np.ndarray:
+    """First `length` samples of an IIR filter's impulse response"""
+    h = np.zeros(length)
+    for n in range(length):
+        acc = b[n] if n < len(b) else 0.0
+        for k in range(1, min(len(a), n + 1)):
+            acc -= a[k] * h[n - k]
+        h[n] = acc
+    return h
+
+
+def make_kernel(name: str, params: Dict, sample_rate: float, length: int) -> np.ndarray:
+    """Kernel for one configured filter stage"""
+    if name == "moving_average":
+        return moving_average_kernel(min(int(params.get("length", 4)), length))
+    if name == "exponential":
+        return exponential_kernel(float(params.get("alpha", 0.3)), length)
+    if name in ("lowpass", "highpass"):
+        b, a = biquad_coefficients(name, float(params["cutoff"]), sample_rate, float(params.get("q", 0.7071)))
+        return impulse_response(b, a, length)
+    raise ValueError(f"Unknown filter stage: {name}")
+
+
+class FilterChain:
+    """A sequence of filter stages combined into a single kernel
+
+    kernel[k] is the weight of the sample k steps in the past.
+    """
+
+    def __init__(self, stages: Sequence[Tuple[str, Dict]], sample_rate: float, window: int):
+        self.stages = list(stages)
+        self.window = window
+        kernel = np.array([1.0])
+        for name, params in self.stages:
+            kernel = np.convolve(kernel, make_kernel(name, params, sample_rate, window))[:window]
+        self.kernel = kernel.astype(np.float32)
+
+    @property
+    def identity(self) -> bool:
+        return len(self.kernel) == 1 and self.kernel[0] == 1.0
+
+    def latest(self, window: np.ndarray) -> Tuple[float, float, float]:
+        """Filtered value at the newest sample of a (n, 3) oldest-first window"""
+        n = min(len(window), len(self.kernel))
+        if n == 0:
+            return 0.0, 0.0, 0.0
+        x, y, z = (self.kernel[:n] @ window[:-n - 1:-1]).tolist()
+        return x, y, z
+
+    def apply(self, window: np.ndarray) -> np.ndarray:
+        """Filtered value at every sample of a (n, 3) oldest-first window"""
+        n = len(window)
+        if n == 0 or self.identity:
+            return window.copy()
+        kernel = self.kernel[:n]
+        return np.stack([np.convolve(window[:, axis], kernel)[:n] for axis in range(3)], axis=1)
+
+    def describe(self) -> str:
+        if not self.stages:
+            return "none"
+        return " -> ".join(name for name, _ in self.stages)
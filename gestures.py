@@ -0,0 +1,117 @@
+# Gesture recognition over windowed accelerometer samples
+# Detects the motions the game is designed around instead of static tilt:
+#   hop left/right - impulse on the lateral axis, direction from its sign
+#   jump           - single large impulse on the vertical axis
+#   spot jog       - periodic vertical motion at running cadence (zero crossings)
+# Each check is a handful of vectorized NumPy operations over the window, so
+# the cost per sample is fixed and small enough to run for many players.
+
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+
+class Gesture(NamedTuple):
+    action: Optional[str]
+    confidence: float
+
+
+NO_GESTURE = Gesture(None, 0.0)
+
+
+class GestureState:
+    """Per-device memory so one impulse or step is reported only once"""
+
+    def __init__(self):
+        self.last_impulse = 0.0   # Timestamp of the last impulse peak that fired
+        self.last_step = 0.0      # Timestamp of the last jog step that fired
+
+
+class GestureEngine:
+    """Recognizes hops, jumps and spot jogging from a device's recent samples"""
+
+    def __init__(self, window: int, vertical_axis: int, lateral_axis: int,
+                 impulse_samples: int, hop_threshold: float, jump_threshold: float,
+                 jog_min_amplitude: float, jog_min_hz: float, jog_max_hz: float,
+                 refractory: float = 0.3):
+        self.window = window
+        self.vertical_axis = vertical_axis
+        self.lateral_axis = lateral_axis
+        self.impulse_samples = impulse_samples
+        self.hop_threshold = hop_threshold
+        self.jump_threshold = jump_threshold
+        self.jog_min_amplitude = jog_min_amplitude
+        self.jog_min_hz = jog_min_hz
+        self.jog_max_hz = jog_max_hz
+        self.refractory = refractory
+
+    def detect(self, state: GestureState, samples: np.ndarray, timestamps: np.ndarray) -> Gesture:
+        """Classify a (n, 3) oldest-first window of filtered samples"""
+        if len(samples) < self.impulse_samples + 2:
+            return NO_GESTURE
+
+        # Remove the slow baseline (posture, residual gravity) from the window
+        centered = samples - samples.mean(axis=0)
+
+        # Hops take priority: a lateral impulse means the player left their lane
+        gesture = self._impulse(state, centered[:, self.lateral_axis], timestamps,
+                                self.hop_threshold, "right", "left")
+        if gesture.action is not None:
+            return gesture
+
+        gesture = self._impulse(state, centered[:, self.vertical_axis], timestamps,
+                                self.jump_threshold, "up", None)
+        if gesture.action is not None:
+            return gesture
+
+        return self._jog(state, centered[:, self.vertical_axis], timestamps)
+
+    def _impulse(self, state: GestureState, signal: np.ndarray, timestamps: np.ndarray,
+                 threshold: float, positive: Optional[str], negative: Optional[str]) -> Gesture:
+        """Find a completed peak above threshold among the newest samples"""
+        recent = signal[-self.impulse_samples:]
+        index = int(np.argmax(np.abs(recent)))
+        # The peak must be complete on both sides: the newest sample may still be
+        # rising and the oldest one may be the tail of an impulse already reported
+        if index == 0 or index == len(recent) - 1:
+            return NO_GESTURE
+
+        peak = float(recent[index])
+        action = positive if peak > 0 else negative
+        if action is None or abs(peak) < threshold:
+            return NO_GESTURE
+
+        peak_time = float(timestamps[len(signal) - len(recent) + index])
+        if peak_time <= state.last_impulse + self.refractory:
+            return NO_GESTURE
+        state.last_impulse = peak_time
+        return Gesture(action, min(1.0, abs(peak) / (2.0 * threshold)))
+
+    def _jog(self, state: GestureState, signal: np.ndarray, timestamps: np.ndarray) -> Gesture:
+        """Detect steady up/down motion at jogging cadence, one action per step"""
+        amplitude = float(signal.std())
+        if amplitude < self.jog_min_amplitude:
+            return NO_GESTURE
+
+        # Upward zero crossings mark the start of each step
+        rising = np.flatnonzero((signal[:-1] < 0) & (signal[1:] >= 0)) + 1
+        if len(rising) < 2:
+            return NO_GESTURE
+        step_times = timestamps[rising]
+        periods = np.diff(step_times)
+        mean_period = float(periods.mean())
+        if mean_period <= 0:
+            return NO_GESTURE
+        cadence = 1.0 / mean_period
+        if not self.jog_min_hz <= cadence <= self.jog_max_hz:
+            return NO_GESTURE
+
+        newest_step = float(step_times[-1])
+        if newest_step <= state.last_step:
+            return NO_GESTURE
+        state.last_step = newest_step
+
+        # Regular steps and a clear amplitude both raise the confidence
+        regularity = 1.0 - min(1.0, float(periods.std()) / mean_period) if len(periods) > 1 else 0.5
+        strength = min(1.0, amplitude / (2.0 * self.jog_min_amplitude))
+        return Gesture("down", regularity * strength)
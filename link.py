@@ -0,0 +1,156 @@
+# Per-device accounting of the UDP link
+# Tracks packet sequence numbers to count loss, reordering and duplicates, and
+# compares client timestamps with the receive time to estimate clock offset
+# and one-way latency.
+#
+# Without round trips the true one-way delay cannot be separated from the
+# clock offset. The offset is estimated as the smallest (receive - send)
+# difference over the recent packets, i.e. the packet that waited least in
+# queues is assumed to have had no queueing delay. Latency is reported relative
+# to that baseline, which is what grows when an access point gets congested.
+
+from collections import deque
+from typing import Dict, Optional
+
+SEQUENCE_MODULO = 1 << 32
+
+
+class SequenceResult:
+    """Outcome of tracking one packet's sequence number"""
+    NEW = 'new'
+    REORDERED = 'reordered'     # Older than the newest packet, arrived late
+    DUPLICATE = 'duplicate'
+    RESET = 'reset'             # Sender restarted its sequence
+
+
+class LinkStats:
+    """Sequence and timing statistics of one device's packets
+
+    Sequence numbers are tracked with a sliding window of `window` packets
+    behind the newest one, like a replay window: a bit per recently seen
+    sequence tells duplicates from late arrivals. A jump back by more than
+    `reset_gap` is taken as the sender restarting, and so is any jump back
+    that comes with a newer client timestamp or from another source port: a
+    restarted client counts from zero again but its clock keeps going.
+    """
+
+    def __init__(self, window: int = 64, reset_gap: int = 1024, delay_window: int = 256):
+        self.window = window
+        self.reset_gap = reset_gap
+        self.highest = None         # Newest sequence number seen
+        self.sent = None            # Client timestamp of that packet
+        self.source = None          # Port it came from
+        self.seen = 0               # Bit i set: highest - i was received
+        self.received = 0
+        self.lost = 0               # Gaps not (yet) filled by late packets
+        self.reordered = 0
+        self.duplicates = 0
+        self.stale = 0              # Packets discarded as too late to use
+        self.resets = 0
+        self.delays = deque(maxlen=delay_window)   # receive - send, in seconds
+        self.offset = None          # Estimated server clock - client clock
+        self.latency = 0.0          # Newest delay above the baseline
+
+    def track(self, sequence: int, sent: Optional[float] = None, source=None) -> str:
+        """Record a sequence number; returns one of the SequenceResult values
+
+        `sent` is the packet's client timestamp and `source` its sending port,
+        when known; both help to tell a restarted sender from late packets.
+        """
+        if self.highest is None:
+            self._restart(sequence, sent, source)
+            self.received += 1
+            return SequenceResult.NEW
+
+        # Signed distance from the newest sequence, tolerating 32-bit wraparound
+        diff = (sequence - self.highest) % SEQUENCE_MODULO
+        if diff >= SEQUENCE_MODULO // 2:
+            diff -= SEQUENCE_MODULO
+
+        if diff > 0:
+            self.lost += diff - 1
+            self.seen = ((self.seen << diff) | 1) & ((1 << self.window) - 1) if diff < self.window else 1
+            self.highest = sequence
+            self.sent = sent
+            self.source = source
+            self.received += 1
+            return SequenceResult.NEW
+
+        back = -diff
+        if (back >= self.reset_gap
+                or (sent is not None and self.sent is not None and sent > self.sent)
+                or (source is not None and self.source is not None and source != self.source)):
+            self.resets += 1
+            self._restart(sequence, sent, source)
+            self.received += 1
+            self.delays.clear()
+            self.offset = None
+            return SequenceResult.RESET
+        if back < self.window and self.seen & (1 << back):
+            self.duplicates += 1
+            return SequenceResult.DUPLICATE
+        if back < self.window:
+            self.seen |= 1 << back
+        # A late packet fills a gap that was counted as lost
+        self.lost = max(0, self.lost - 1)
+        self.reordered += 1
+        self.received += 1
+        return SequenceResult.REORDERED
+
+    def _restart(self, sequence: int, sent: Optional[float], source):
+        self.highest = sequence
+        self.sent = sent
+        self.source = source
+        self.seen = 1
+
+    def observe(self, sent: float, received: float) -> float:
+        """Record the client send time of a packet; returns its delay above the baseline"""
+        delay = received - sent
+        expiring = self.delays[0] if len(self.delays) == self.delays.maxlen else None
+        self.delays.append(delay)
+        if self.offset is None or delay < self.offset:
+            self.offset = delay
+        elif expiring == self.offset:
+            # The baseline left the window; re-estimate so clock drift is followed
+            self.offset = min(self.delays)
+        self.latency = delay - self.offset
+        return self.latency
+
+    def to_server_time(self, client_time: float) -> float:
+        """Map a client timestamp onto the server clock"""
+        return client_time + (self.offset or 0.0)
+
+    @property
+    def loss_rate(self) -> float:
+        expected = self.received + self.lost
+        return self.lost / expected if expected else 0.0
+
+    def latency_percentile(self, p: float) -> Optional[float]:
+        """Percentile (0-100) of the recent delays above the baseline, in seconds"""
+        if not self.delays:
+            return None
+        ordered = sorted(self.delays)
+        index = min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))
+        return ordered[index] - self.offset
+
+    def snapshot(self) -> Dict:
+        return format_link(self.received, self.lost, self.reordered, self.duplicates, self.stale, self.resets,
+                           self.offset, self.latency_percentile(50), self.latency_percentile(99))
+
+
+def format_link(received: int, lost: int, reordered: int, duplicates: int, stale: int, resets: int,
+                offset: Optional[float], p50: Optional[float], p99: Optional[float]) -> Dict:
+    """Link statistics as reported by /link; times in seconds, None when unknown"""
+    expected = received + lost
+    return {
+        "received": received,
+        "lost": lost,
+        "loss_rate": round(lost / expected if expected else 0.0, 4),
+        "reordered": reordered,
+        "duplicates": duplicates,
+        "stale": stale,
+        "resets": resets,
+        "clock_offset_ms": round(offset * 1000, 2) if offset is not None else None,
+        "latency_p50_ms": round(p50 * 1000, 2) if p50 is not None else None,
+        "latency_p99_ms": round(p99 * 1000, 2) if p99 is not None else None,
+    }
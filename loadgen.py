@@ -0,0 +1,320 @@
+# Synthetic accelerometer traffic generator
+# Simulates many players at once without any hardware, for load tests and for
+# sizing the server before an event. Every simulated player sways and jitters
+# like a real sensor and performs jumps, hops, slides and jogging at random
+# moments. Packets go out at a fixed rate per device with optional random
+# loss and network jitter; the jitter delays packets, so they also arrive
+# out of order.
+#
+#   python loadgen.py --devices 50 --rate 50 --duration 60
+#   python loadgen.py --host 192.168.1.10 --devices 8 --loss 0.02 --jitter 0.01
+#   python loadgen.py --devices 200 --batch 5 --processes 4
+#
+# benchmark.py runs it against an in-process server and reports the results.
+
+import argparse
+import heapq
+import json
+import math
+import multiprocessing
+import socket
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+import protocol
+from config import GESTURE_LATERAL_AXIS, GESTURE_VERTICAL_AXIS, SERVER_PORT
+
+# Gesture shapes: (seconds, function of the time since the start -> (axis, value) pairs)
+# Amplitudes are in the same normalized units the Raspberry Pi sends.
+SLIDE_AXIS = 2
+
+
+def _pulse(s: float, length: float, amplitude: float) -> float:
+    return amplitude * math.sin(math.pi * s / length) if 0.0 <= s < length else 0.0
+
+
+GESTURES = {
+    "jump": (0.4, lambda s: ((GESTURE_VERTICAL_AXIS, _pulse(s, 0.25, 1.1) + _pulse(s - 0.25, 0.15, -0.5)),)),
+    "hop_left": (0.3, lambda s: ((GESTURE_LATERAL_AXIS, _pulse(s, 0.25, -0.9)),)),
+    "hop_right": (0.3, lambda s: ((GESTURE_LATERAL_AXIS, _pulse(s, 0.25, 0.9)),)),
+    "slide": (0.5, lambda s: ((SLIDE_AXIS, _pulse(s, 0.5, -0.8)),)),
+    "jog": (2.0, lambda s: ((GESTURE_VERTICAL_AXIS, 0.35 * math.sin(2 * math.pi * 2.5 * s)),)),
+}
+
+
+class SimulatedPlayer:
+    """Motion of one player: sensor bias, body sway, noise and random gestures"""
+
+    def __init__(self, device_id: int, rng: np.random.Generator, gestures: Sequence[str],
+                 gestures_per_minute: float, start: float):
+        self.device_id = device_id
+        self.rng = rng
+        self.gestures = list(gestures)
+        self.gesture_interval = 60.0 / gestures_per_minute if gestures_per_minute > 0 else math.inf
+        self.bias = rng.normal(0.0, 0.03, 3)
+        self.sway_hz = rng.uniform(0.2, 0.5, 3)
+        self.sway_phase = rng.uniform(0.0, 2 * math.pi, 3)
+        self.sway_amplitude = rng.uniform(0.01, 0.04, 3)
+        self.noise = 0.015
+        self.sequence = 0
+        self.gesture = None          # (name, start time)
+        self.next_gesture = start + self._pause()
+        self.performed = Counter()
+
+    def _pause(self) -> float:
+        if not self.gestures or math.isinf(self.gesture_interval):
+            return math.inf
+        return float(self.rng.exponential(self.gesture_interval))
+
+    def samples(self, times: np.ndarray) -> np.ndarray:
+        """(n, 3) samples taken at `times`"""
+        values = (self.bias
+                  + self.sway_amplitude * np.sin(2 * math.pi * self.sway_hz * times[:, None] + self.sway_phase)
+                  + self.rng.normal(0.0, self.noise, (len(times), 3)))
+        for row, t in enumerate(times.tolist()):
+            if self.gesture is None and t >= self.next_gesture:
+                name = self.gestures[int(self.rng.integers(len(self.gestures)))]
+                self.gesture = (name, t)
+                self.performed[name] += 1
+            if self.gesture is not None:
+                name, started = self.gesture
+                length, shape = GESTURES[name]
+                if t - started >= length:
+                    self.gesture = None
+                    self.next_gesture = t + self._pause()
+                    continue
+                for axis, value in shape(t - started):
+                    values[row, axis] += value
+        return values.astype(np.float32)
+
+
+class LoadReport:
+    """What a generator sent; reports of several processes add up with merge()"""
+
+    def __init__(self):
+        self.devices = 0
+        self.packets = 0          # Datagrams put on the wire
+        self.samples = 0
+        self.lost = 0             # Datagrams dropped on purpose to simulate loss
+        self.late = 0             # Datagrams sent more than one period after they were due
+        self.max_lag = 0.0        # Worst lateness in seconds
+        self.duration = 0.0
+        self.gestures = Counter()
+
+    def merge(self, other: "LoadReport") -> "LoadReport":
+        self.devices += other.devices
+        self.packets += other.packets
+        self.samples += other.samples
+        self.lost += other.lost
+        self.late += other.late
+        self.max_lag = max(self.max_lag, other.max_lag)
+        self.duration = max(self.duration, other.duration)
+        self.gestures.update(other.gestures)
+        return self
+
+    @property
+    def packets_per_sec(self) -> float:
+        return self.packets / self.duration if self.duration else 0.0
+
+    def summary(self) -> str:
+        gestures = ", ".join(f"{name}={count}" for name, count in sorted(self.gestures.items())) or "none"
+        return (f"{self.devices} devices, {self.packets} packets ({self.packets_per_sec:.0f}/s), "
+                f"{self.samples} samples, {self.lost} dropped on purpose, {self.late} late "
+                f"(max {self.max_lag * 1000:.1f} ms), gestures: {gestures}")
+
+
+class LoadGenerator:
+    """Sends the packets of `devices` simulated players from one thread
+
+    Each device sends `batch` samples every batch / rate seconds. Send times
+    are kept in a heap, so one thread keeps hundreds of devices on schedule.
+    Binary devices share one socket; JSON senders are told apart by their
+    address, so each gets its own.
+    """
+
+    def __init__(self, host: str, port: int, devices: int, rate: float = 50.0, batch: int = 1,
+                 loss: float = 0.0, jitter: float = 0.0, gestures: Sequence[str] = tuple(GESTURES),
+                 gestures_per_minute: float = 20.0, wire_format: str = "binary",
+                 first_device_id: int = 1, seed: Optional[int] = None):
+        if wire_format not in ("binary", "json"):
+            raise ValueError(f"Unknown wire format: {wire_format}")
+        if wire_format == "json" and batch != 1:
+            raise ValueError("JSON packets carry a single sample, use --batch 1")
+        if not 0 < batch <= protocol.max_samples():
+            raise ValueError(f"Batch must be between 1 and {protocol.max_samples()}")
+        unknown = [name for name in gestures if name not in GESTURES]
+        if unknown:
+            raise ValueError(f"Unknown gestures: {', '.join(unknown)}")
+        check_device_ids(first_device_id, devices)
+        self.address = (host, port)
+        self.devices = devices
+        self.rate = rate
+        self.batch = batch
+        self.loss = loss
+        self.jitter = jitter
+        self.gestures = gestures
+        self.gestures_per_minute = gestures_per_minute
+        self.wire_format = wire_format
+        self.first_device_id = first_device_id
+        self.rng = np.random.default_rng(seed)
+
+    def _packet(self, player: SimulatedPlayer, times: np.ndarray) -> bytes:
+        samples = player.samples(times)
+        sequence = player.sequence
+        player.sequence += 1
+        if self.wire_format == "json":
+            x, y, z = samples[0].tolist()
+            return json.dumps({"x": x, "y": y, "z": z, "timestamp": float(times[0]),
+                               "sequence": sequence}).encode('utf-8')
+        return protocol.encode(samples, sequence, player.device_id, float(times[0]), 1.0 / self.rate)
+
+    def run(self, duration: float) -> LoadReport:
+        report = LoadReport()
+        report.devices = self.devices
+        interval = 1.0 / self.rate
+        period = self.batch * interval
+        offsets = np.arange(self.batch - 1, -1, -1) * interval
+
+        start = time.time()
+        players = [SimulatedPlayer(self.first_device_id + i, np.random.default_rng(self.rng.integers(1 << 32)),
+                                   self.gestures, self.gestures_per_minute, start)
+                   for i in range(self.devices)]
+        if self.wire_format == "json":
+            sockets = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in players]
+        else:
+            sockets = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM)] * len(players)
+
+        # Spread the devices over one period instead of sending in lockstep
+        due = [(start + period + offset, i) for i, offset in enumerate(self.rng.uniform(0, period, self.devices))]
+        heapq.heapify(due)
+        delayed = []    # (send time, order, index, datagram) held back by the simulated jitter
+        order = 0
+        end = start + duration
+
+        try:
+            while True:
+                now = time.time()
+                if now >= end:
+                    break
+                while delayed and delayed[0][0] <= now:
+                    _, _, i, data = heapq.heappop(delayed)
+                    sockets[i].sendto(data, self.address)
+                    report.packets += 1
+
+                scheduled, i = due[0]
+                if scheduled <= now:
+                    lag = now - scheduled
+                    if lag > period:
+                        report.late += 1
+                    report.max_lag = max(report.max_lag, lag)
+                    heapq.heapreplace(due, (scheduled + period, i))
+
+                    # The newest sample of the batch is taken at the scheduled time
+                    data = self._packet(players[i], scheduled - offsets)
+                    report.samples += self.batch
+                    if self.loss and self.rng.random() < self.loss:
+                        report.lost += 1
+                    elif self.jitter:
+                        order += 1
+                        heapq.heappush(delayed, (now + self.rng.exponential(self.jitter), order, i, data))
+                    else:
+                        sockets[i].sendto(data, self.address)
+                        report.packets += 1
+                    continue
+
+                wake = min(due[0][0], delayed[0][0]) if delayed else due[0][0]
+                time.sleep(max(0.0, min(wake, end) - now))
+
+            # Packets still held back by the jitter arrive late rather than never
+            for _, _, i, data in sorted(delayed):
+                sockets[i].sendto(data, self.address)
+                report.packets += 1
+        finally:
+            for sock in set(sockets):
+                sock.close()
+
+        report.duration = time.time() - start
+        for player in players:
+            report.gestures.update(player.performed)
+        return report
+
+
+def _run_worker(results, options: Dict, duration: float):
+    results.put(LoadGenerator(**options).run(duration))
+
+
+def check_device_ids(first_device_id: int, devices: int):
+    """Raise ValueError unless every simulated device id fits the u16 on the wire"""
+    last = first_device_id + devices - 1
+    if first_device_id < 0 or last > protocol.MAX_DEVICE_ID:
+        raise ValueError(f"Device ids {first_device_id}..{last} do not fit 0..{protocol.MAX_DEVICE_ID}; "
+                         f"lower --first-device-id or --devices")
+
+
+def run_processes(host: str, port: int, devices: int, duration: float, processes: int = 1,
+                  **options) -> LoadReport:
+    """Split the devices over several generator processes and add up their reports
+
+    One process tops out at a few thousand packets per second; use more
+    when the report shows late packets.
+    """
+    processes = max(1, min(processes, devices))
+    seed = options.pop("seed", None)
+    first = options.pop("first_device_id", 1)
+    check_device_ids(first, devices)
+    results = multiprocessing.Queue()
+    workers: List[multiprocessing.Process] = []
+    for n in range(processes):
+        count = devices // processes + (1 if n < devices % processes else 0)
+        worker_options = dict(options, host=host, port=port, devices=count, first_device_id=first,
+                              seed=None if seed is None else seed + n)
+        first += count
+        worker = multiprocessing.Process(target=_run_worker, args=(results, worker_options, duration),
+                                         name=f"loadgen-{n}", daemon=True)
+        worker.start()
+        workers.append(worker)
+
+    report = LoadReport()
+    for _ in workers:
+        report.merge(results.get())
+    for worker in workers:
+        worker.join()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send synthetic accelerometer traffic to the server")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--devices', type=int, default=10, help="simulated players")
+    parser.add_argument('--rate', type=float, default=50.0, help="samples per second per device")
+    parser.add_argument('--batch', type=int, default=1, help="samples per datagram (binary only)")
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds to send for")
+    parser.add_argument('--loss', type=float, default=0.0, help="fraction of datagrams dropped at random")
+    parser.add_argument('--jitter', type=float, default=0.0, help="mean extra network delay in seconds")
+    parser.add_argument('--gestures', nargs='+', choices=sorted(GESTURES), default=sorted(GESTURES))
+    parser.add_argument('--gesture-rate', type=float, default=20.0, help="gestures per minute per player")
+    parser.add_argument('--format', choices=['binary', 'json'], default='binary')
+    parser.add_argument('--first-device-id', type=int, default=1)
+    parser.add_argument('--processes', type=int, default=1, help="generator processes to spread devices over")
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+    try:
+        check_device_ids(args.first_device_id, args.devices)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print(f"[INFO] Sending {args.devices} devices x {args.rate:g} Hz to {args.host}:{args.port} "
+          f"for {args.duration:g}s")
+    report = run_processes(args.host, args.port, args.devices, args.duration, args.processes,
+                           rate=args.rate, batch=args.batch, loss=args.loss, jitter=args.jitter,
+                           gestures=args.gestures, gestures_per_minute=args.gesture_rate,
+                           wire_format=args.format, first_device_id=args.first_device_id, seed=args.seed)
+    print(f"[INFO] Sent {report.summary()}")
+
+
+if __name__ == "__main__":
+    main()
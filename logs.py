@@ -0,0 +1,75 @@
+# Leveled, rate-limited logging for the server
+# The receive and classification threads used to print() every event, and a
+# slow terminal then throttled the hot paths. Records are now handed to a queue
+# and written by a background listener thread, and each message template is
+# limited to a burst of records per interval; the number of suppressed
+# records is reported with the next one that gets through.
+#
+# Log with a constant template and arguments, e.g.
+#   log.info("New device connected: %s from %s", name, host)
+# so that rate limiting can tell messages apart and formatting only happens
+# for records that are actually written.
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+LOG_FORMAT = "[%(levelname)s] %(message)s"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets at most `burst` records of each template through per `interval` seconds"""
+
+    def __init__(self, interval: float = 1.0, burst: int = 5):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._windows: Dict[Tuple[str, int, str], list] = {}   # key -> [window start, count, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.interval <= 0:
+            return True
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+def setup_logging(level: str = "INFO", rate_interval: float = 1.0, rate_burst: int = 5):
+    """Send log records through a queue to a stdout writer thread"""
+    global _listener
+    if _listener is not None:
+        return
+
+    records = queue.Queue(-1)
+    handler = logging.handlers.QueueHandler(records)
+    handler.addFilter(RateLimitFilter(rate_interval, rate_burst))
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(logging.Formatter(LOG_FORMAT))
+    _listener = logging.handlers.QueueListener(records, output)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(getattr(logging, level.upper(), logging.INFO))
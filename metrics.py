@@ -0,0 +1,168 @@
+# Prometheus-style metrics for the server
+# A minimal in-process implementation of counters, gauges and histograms,
+# rendered in the Prometheus text exposition format by /metrics. Updating a
+# metric is a couple of integer additions with no locking, so each metric
+# should be updated from a single thread (the one owning that hot path).
+# Values that already exist elsewhere (receiver counters, viewer counts) are
+# registered as callbacks and read only when /metrics is scraped.
+
+import math
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Seconds, from 10 microseconds up to one second
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                   0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _format_labels(labels: Dict[str, str], extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels.items())
+    if extra is not None:
+        items.append(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonically increasing count"""
+
+    def __init__(self, labels: Dict[str, str]):
+        self.labels = labels
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+    def samples(self, name: str) -> List[str]:
+        return [f"{name}{_format_labels(self.labels)} {_format_value(self.value)}"]
+
+
+class Histogram:
+    """Distribution of observations over fixed buckets"""
+
+    def __init__(self, labels: Dict[str, str], buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)    # Last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name: str) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(self.labels, ('le', _format_value(bound)))} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(self.labels)} {_format_value(self.sum)}")
+        lines.append(f"{name}_count{_format_labels(self.labels)} {self.count}")
+        return lines
+
+
+class CallbackHistogram(Histogram):
+    """Histogram whose (bucket counts, sum, count) are read from a function at scrape time"""
+
+    def __init__(self, labels: Dict[str, str], function: Callable[[], Tuple[Sequence[int], float, int]],
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(labels, buckets)
+        self.function = function
+
+    def samples(self, name: str) -> List[str]:
+        counts, self.sum, self.count = self.function()
+        self.counts = list(counts)
+        return super().samples(name)
+
+
+class CallbackMetric:
+    """Gauge or counter whose value is read from a function at scrape time"""
+
+    def __init__(self, labels: Dict[str, str], function: Callable[[], float]):
+        self.labels = labels
+        self.function = function
+
+    def samples(self, name: str) -> List[str]:
+        return [f"{name}{_format_labels(self.labels)} {_format_value(self.function())}"]
+
+
+class MetricsRegistry:
+    """Named metric families, each with one metric per label set"""
+
+    def __init__(self):
+        self._families: Dict[str, Tuple[str, str, Dict[tuple, object]]] = {}
+
+    def _get(self, kind: str, name: str, help: str, labels: Optional[Dict[str, str]], factory):
+        labels = labels or {}
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = (kind, help, {})
+        elif family[0] != kind:
+            raise ValueError(f"Metric {name} already registered as a {family[0]}")
+        key = tuple(sorted(labels.items()))
+        metric = family[2].get(key)
+        if metric is None:
+            metric = family[2][key] = factory(labels)
+        return metric
+
+    def counter(self, name: str, help: str, labels: Optional[Dict[str, str]] = None) -> Counter:
+        return self._get("counter", name, help, labels, Counter)
+
+    def histogram(self, name: str, help: str, labels: Optional[Dict[str, str]] = None,
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._get("histogram", name, help, labels, lambda l: Histogram(l, buckets))
+
+    def gauge_function(self, name: str, help: str, function: Callable[[], float],
+                       labels: Optional[Dict[str, str]] = None):
+        metric = self._get("gauge", name, help, labels, lambda l: CallbackMetric(l, function))
+        metric.function = function
+        return metric
+
+    def counter_function(self, name: str, help: str, function: Callable[[], float],
+                         labels: Optional[Dict[str, str]] = None):
+        metric = self._get("counter", name, help, labels, lambda l: CallbackMetric(l, function))
+        metric.function = function
+        return metric
+
+    def histogram_function(self, name: str, function: Callable[[], Tuple[Sequence[int], float, int]],
+                           labels: Optional[Dict[str, str]] = None) -> CallbackHistogram:
+        """Serve a registered histogram from `function` instead, e.g. one kept by another process"""
+        kind, _, metrics = self._families[name]
+        if kind != "histogram":
+            raise ValueError(f"Metric {name} is a {kind}, not a histogram")
+        labels = labels or {}
+        key = tuple(sorted(labels.items()))
+        current = metrics.get(key)
+        metric = metrics[key] = CallbackHistogram(labels, function,
+                                                  current.buckets if current is not None else LATENCY_BUCKETS)
+        return metric
+
+    def find(self, name: str, labels: Optional[Dict[str, str]] = None):
+        """The metric registered under a name and label set, or None"""
+        family = self._families.get(name)
+        if family is None:
+            return None
+        return family[2].get(tuple(sorted((labels or {}).items())))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for name, (kind, help, metrics) in self._families.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for metric in list(metrics.values()):
+                lines.extend(metric.samples(name))
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry served by /metrics
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,297 @@
+# Key output backends and the dispatch queue in front of them
+# The engine used to call pyautogui.press() inline, so a slow OS input layer
+# delayed the classification of the next sample. Key presses are now queued
+# and sent by one worker thread per backend, so sensing never waits on output
+# and a slow backend never holds up the others.
+#
+# Backends (OUTPUT_BACKENDS in config.py):
+#   "pyautogui" - synthetic key presses for the focused desktop window
+#   "uinput"    - Linux kernel input device through python-evdev, works
+#                 without a display server and regardless of focus
+#   "websocket" - pushes {"key": ...} messages to browsers connected on
+#                 WEBSOCKET_PORT, for browser-hosted runners
+#   "null"      - discards key presses, for benchmarks
+#   "recording" - keeps every key press in memory, for tests and replays
+
+import abc
+import asyncio
+import json
+import logging
+import queue
+import threading
+import time
+from typing import Dict, List, Sequence, Tuple
+
+from metrics import REGISTRY
+from pipeline import LatencyStats
+
+log = logging.getLogger(__name__)
+
+
+class KeyOutput(abc.ABC):
+    """A way of delivering key presses to the game"""
+
+    name = "output"
+
+    @abc.abstractmethod
+    def press(self, key: str):
+        """Deliver one key press"""
+
+    def close(self):
+        pass
+
+
+class PyAutoGUIOutput(KeyOutput):
+    """Key presses for the focused window through pyautogui"""
+
+    name = "pyautogui"
+
+    def __init__(self):
+        import pyautogui
+        # By default each key press is followed by a 0.1 second pause
+        pyautogui.PAUSE = 0.0
+        self.pyautogui = pyautogui
+
+    def press(self, key: str):
+        self.pyautogui.press(key)
+
+
+class UinputOutput(KeyOutput):
+    """Key presses from a virtual Linux input device (needs python-evdev and /dev/uinput access)"""
+
+    name = "uinput"
+
+    def __init__(self, keys: Sequence[str]):
+        try:
+            from evdev import UInput, ecodes
+        except ImportError:
+            raise RuntimeError('The "uinput" output needs python-evdev: pip install evdev')
+        self.ecodes = ecodes
+        self.codes = {key: self._code(key) for key in keys}
+        self.device = UInput({ecodes.EV_KEY: list(self.codes.values())}, name="temple-run-accelerometer")
+
+    def _code(self, key: str) -> int:
+        code = getattr(self.ecodes, f"KEY_{key.upper()}", None)
+        if code is None:
+            raise ValueError(f"No uinput key code for {key!r}")
+        return code
+
+    def press(self, key: str):
+        code = self.codes.get(key)
+        if code is None:
+            code = self.codes[key] = self._code(key)
+        self.device.write(self.ecodes.EV_KEY, code, 1)
+        self.device.write(self.ecodes.EV_KEY, code, 0)
+        self.device.syn()
+
+    def close(self):
+        self.device.close()
+
+
+class WebSocketOutput(KeyOutput):
+    """Pushes key presses to every connected browser (needs the websockets package)
+
+    Runs its own asyncio loop in a background thread. Each press is sent as
+    {"key": "up", "time": 1700000000.0}; the page turns it into a KeyboardEvent.
+    """
+
+    name = "websocket"
+    startup_timeout = 5.0
+
+    def __init__(self, host: str, port: int):
+        try:
+            import websockets
+        except ImportError:
+            raise RuntimeError('The "websocket" output needs websockets: pip install websockets')
+        self.websockets = websockets
+        self.host = host
+        self.port = port
+        self.clients = set()
+        self.loop = asyncio.new_event_loop()
+        self._ready = threading.Event()
+        self._stopped = None
+        self._error = None
+        self.thread = threading.Thread(target=self._run, name="websocket-output", daemon=True)
+        self.thread.start()
+        if not self._ready.wait(self.startup_timeout):
+            self.close()
+            raise RuntimeError(f"WebSocket output did not start on port {port} within {self.startup_timeout:g} s")
+        if self._error is not None:
+            raise RuntimeError(f"WebSocket output failed to start on port {port}: {self._error}") from self._error
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._serve())
+        except Exception as e:
+            # Typically the port is taken; the constructor reports it
+            self._error = e
+        finally:
+            self._ready.set()
+
+    async def _serve(self):
+        self._stopped = asyncio.Event()
+        async with self.websockets.serve(self._handler, self.host, self.port):
+            log.info("Key presses pushed to WebSocket clients on port %d", self.port)
+            self._ready.set()
+            await self._stopped.wait()
+
+    async def _handler(self, websocket, *args):
+        self.clients.add(websocket)
+        try:
+            # Browsers only listen; wait for them to go away
+            async for _ in websocket:
+                pass
+        except Exception:
+            pass
+        finally:
+            self.clients.discard(websocket)
+
+    async def _send(self, message: str):
+        clients = list(self.clients)
+        if clients:
+            await asyncio.gather(*(client.send(message) for client in clients), return_exceptions=True)
+
+    def press(self, key: str):
+        message = json.dumps({"key": key, "time": time.time()})
+        # Block until sent so the reported dispatch latency includes the push
+        asyncio.run_coroutine_threadsafe(self._send(message), self.loop).result()
+
+    def close(self):
+        if self._stopped is not None:
+            self.loop.call_soon_threadsafe(self._stopped.set)
+        self.thread.join(timeout=1.0)
+
+
+class NullOutput(KeyOutput):
+    """Discards key presses"""
+
+    name = "null"
+
+    def press(self, key: str):
+        pass
+
+
+class RecordingOutput(KeyOutput):
+    """Remembers every key press with its time"""
+
+    name = "recording"
+
+    def __init__(self):
+        self.presses: List[Tuple[float, str]] = []
+
+    def press(self, key: str):
+        self.presses.append((time.time(), key))
+
+
+def dispatch_histogram(backend: str):
+    return REGISTRY.histogram("temple_run_output_dispatch_seconds",
+                              "Time from queueing a key press to its delivery by a backend", {"backend": backend})
+
+
+class OutputDispatcher:
+    """Queues key presses and sends them to every backend from worker threads
+
+    press() never blocks: when a backend falls more than `queue_size` presses
+    behind, its oldest queued press is dropped, since a stale key press is
+    worse than none. Dispatch latency (queued to delivered) is tracked per
+    backend.
+    """
+
+    def __init__(self, backends: Sequence[KeyOutput], queue_size: int = 64):
+        self.backends = list(backends)
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in self.backends]
+        self.latency: Dict[str, LatencyStats] = {b.name: LatencyStats() for b in self.backends}
+        self.dropped: Dict[str, int] = {b.name: 0 for b in self.backends}
+        self.errors: Dict[str, int] = {b.name: 0 for b in self.backends}
+        self._histograms = {b.name: dispatch_histogram(b.name) for b in self.backends}
+        for backend in self.backends:
+            name = backend.name
+            REGISTRY.counter_function("temple_run_output_dropped_total", "Key presses dropped by a full output queue",
+                                      lambda name=name: self.dropped[name], {"backend": name})
+            REGISTRY.counter_function("temple_run_output_errors_total", "Key presses a backend failed to deliver",
+                                      lambda name=name: self.errors[name], {"backend": name})
+        self.threads = []
+
+    def start(self):
+        for backend, pending in zip(self.backends, self.queues):
+            thread = threading.Thread(target=self._work, args=(backend, pending),
+                                      name=f"output-{backend.name}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def press(self, key: str):
+        """Queue a key press for every backend"""
+        queued = time.perf_counter()
+        for backend, pending in zip(self.backends, self.queues):
+            self._put(backend, pending, (key, queued))
+
+    def _put(self, backend: KeyOutput, pending: queue.Queue, item):
+        """Queue without blocking, dropping the oldest queued press when full"""
+        while True:
+            try:
+                pending.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    pending.get_nowait()
+                    self.dropped[backend.name] += 1
+                except queue.Empty:
+                    pass
+
+    def _work(self, backend: KeyOutput, pending: queue.Queue):
+        latency = self.latency[backend.name]
+        histogram = self._histograms[backend.name]
+        while True:
+            item = pending.get()
+            if item is None:
+                break
+            key, queued = item
+            try:
+                backend.press(key)
+            except Exception as e:
+                self.errors[backend.name] += 1
+                log.error("%s output failed to press %s: %s", backend.name, key, e)
+                continue
+            elapsed = time.perf_counter() - queued
+            latency.add(elapsed)
+            histogram.observe(elapsed)
+
+    def summary(self) -> str:
+        return ", ".join(f"{name} {stats.summary()}" for name, stats in self.latency.items()) or "no outputs"
+
+    def stop(self):
+        """Deliver what is queued, then stop the workers and close the backends
+
+        Never blocks on a stuck backend: with its queue full, the oldest press
+        makes way for the stop marker, and its worker gets a second to finish.
+        """
+        for backend, pending in zip(self.backends, self.queues):
+            self._put(backend, pending, None)
+        for thread in self.threads:
+            thread.join(timeout=1.0)
+        for backend in self.backends:
+            backend.close()
+
+
+def create_output(name: str, keys: Sequence[str], websocket_host: str = "0.0.0.0",
+                  websocket_port: int = 5002) -> KeyOutput:
+    """Build one backend selected in OUTPUT_BACKENDS"""
+    if name == "pyautogui":
+        return PyAutoGUIOutput()
+    if name == "uinput":
+        return UinputOutput(keys)
+    if name == "websocket":
+        return WebSocketOutput(websocket_host, websocket_port)
+    if name == "null":
+        return NullOutput()
+    if name == "recording":
+        return RecordingOutput()
+    raise ValueError(f"Unknown output backend: {name}")
+
+
+def create_dispatcher(names: Sequence[str], keys: Sequence[str], queue_size: int = 64,
+                      websocket_port: int = 5002) -> OutputDispatcher:
+    """Build the backends and the dispatcher in front of them"""
+    backends = [create_output(name, keys, websocket_port=websocket_port) for name in names]
+    return OutputDispatcher(backends, queue_size)
@@ -0,0 +1,253 @@
+# Event-driven action engine
+# Classifies a device's samples as soon as they arrive instead of polling on a
+# fixed delay, and measures the latency from datagram receipt to queueing the
+# key press for the outputs; outputs.py measures the rest of the way.
+
+import logging
+import queue
+import time
+from collections import deque
+from typing import Callable, Optional
+
+import config
+from calibration import AdaptiveCalibration
+from config import *
+from filters import FilterChain
+from gestures import GestureEngine, GestureState
+from metrics import REGISTRY
+from settings import RuntimeSettings
+
+log = logging.getLogger(__name__)
+
+CLASSIFY_SECONDS = REGISTRY.histogram("temple_run_classify_seconds",
+                                      "Time to filter and classify a device's newest samples")
+PRESS_SECONDS = REGISTRY.histogram("temple_run_keypress_dispatch_seconds",
+                                   "Time spent in the key press call")
+ENQUEUE_LATENCY = REGISTRY.histogram("temple_run_receive_to_enqueue_seconds",
+                                     "Time from datagram receipt to queueing its key press for the outputs")
+
+
+def classify(x, y, z, thresholds=None):
+    """Determine the game action for a single accelerometer sample
+
+    `thresholds` is an (x, y, z) tuple of per-player thresholds; the global
+    ones from config.py are used when it is None.
+    """
+    if thresholds is None:
+        x_threshold, y_threshold, z_threshold = X_THRESHOLD, Y_THRESHOLD, Z_THRESHOLD
+    else:
+        x_threshold, y_threshold, z_threshold = thresholds
+    # X-axis controls left/right movement
+    if x > x_threshold:
+        return "right"
+    elif x < -x_threshold:
+        return "left"
+    # Y-axis controls forward movement (jump)
+    elif y > y_threshold:
+        return "up"
+    # Z-axis controls downward movement (slide)
+    elif z < -z_threshold:
+        return "down"
+    return None
+
+
+class LatencyStats:
+    """Keeps the most recent latency measurements and reports percentiles"""
+
+    def __init__(self, size: int = 1000):
+        self.values = deque(maxlen=size)
+        self.count = 0
+
+    def add(self, seconds: float):
+        self.values.append(seconds)
+        self.count += 1
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Percentile (0-100) of the recent measurements in seconds"""
+        if not self.values:
+            return None
+        ordered = sorted(self.values)
+        index = min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def summary(self) -> str:
+        if not self.values:
+            return "no samples"
+        p50, p90, p99 = (self.percentile(p) * 1000 for p in (50, 90, 99))
+        return f"p50={p50:.2f}ms p90={p90:.2f}ms p99={p99:.2f}ms (n={self.count})"
+
+
+class ActionEngine:
+    """Runs the classifier whenever a device receives new samples
+
+    The receive path calls notify() after storing samples; run() blocks on a
+    queue and wakes up immediately. A device is queued at most once at a time,
+    so a burst of packets costs one classification of the newest sample.
+    Thresholds, WAIT_TIME and GESTURE_MIN_CONFIDENCE are read from `settings`
+    for every sample, so changes apply immediately.
+    """
+
+    def __init__(self, registry, press: Callable[[str], None], chain: Optional[FilterChain] = None,
+                 gestures: Optional[GestureEngine] = None, settings: Optional[RuntimeSettings] = None,
+                 verbose: bool = True, calibration: Optional[AdaptiveCalibration] = None):
+        self.registry = registry
+        self.press = press
+        self.chain = chain or FilterChain([], 1.0, 1)
+        self.gestures = gestures
+        self.calibration = calibration
+        self.settings = settings or RuntimeSettings.from_module(config)
+        self.verbose = verbose
+        self.queue = queue.Queue()
+        self.latency = LatencyStats()     # Datagram receipt to key press queued
+        self.running = False
+
+    def notify(self, device, received_at: float):
+        """Signal that `device` has new samples (received_at from time.perf_counter())"""
+        device.received_at = received_at
+        if not device.pending:
+            device.pending = True
+            self.queue.put(device)
+
+    def notify_event(self, device, action: str, confidence: float, received_at: float):
+        """Queue an action that the device classified on its own"""
+        device.events.append((action, confidence))
+        self.notify(device, received_at)
+
+    def notify_heartbeat(self, device, received_at: float):
+        """A packet with neither samples nor actions; the receiver already marked the device seen"""
+
+    def process(self, device, now: Optional[float] = None):
+        """Classify the newest sample of a device and press the key if due
+
+        Returns the action pressed, or None. `now` defaults to the current
+        time; replays pass the capture time.
+        """
+        device.pending = False
+        settings = self.settings.for_device(device)
+        if device.events:
+            return self.process_events(device, now)
+        started = time.perf_counter()
+        if self.gestures is not None:
+            action, confidence = self.detect_gesture(device, settings.GESTURE_MIN_CONFIDENCE)
+            x, y, z = device.latest()
+        else:
+            if self.chain.identity:
+                x, y, z = device.latest()
+            else:
+                samples, _ = device.window(self.chain.window)
+                x, y, z = self.chain.latest(samples)
+            thresholds = (settings.X_THRESHOLD, settings.Y_THRESHOLD, settings.Z_THRESHOLD)
+            if self.calibration is not None:
+                x, y, z, thresholds = self.calibration.apply(device, x, y, z, thresholds)
+            device.thresholds = thresholds
+            action = classify(x, y, z, thresholds)
+            confidence = 1.0 if action is not None else 0.0
+        device.current_action = action
+        device.confidence = confidence
+        CLASSIFY_SECONDS.observe(time.perf_counter() - started)
+
+        # Press the key if action is available and enough time has passed for this device
+        if now is None:
+            now = time.time()
+        if action is not None and now - device.last_press > settings.WAIT_TIME:
+            self.dispatch(device, action, now)
+            if self.verbose:
+                log.info("Accelerometer Action: %s %s (%.0f%%) (x=%.2f, y=%.2f, z=%.2f)",
+                         device.name, action, confidence * 100, x, y, z)
+            return action
+        return None
+
+    def dispatch(self, device, action: str, now: float):
+        """Press the key bound to `action` and record the timings"""
+        started = time.perf_counter()
+        self.press(device.key_map[action])
+        pressed = time.perf_counter()
+        device.last_press = now
+        PRESS_SECONDS.observe(pressed - started)
+        ENQUEUE_LATENCY.observe(pressed - device.received_at)
+        self.latency.add(pressed - device.received_at)
+
+    def process_events(self, device, now: Optional[float] = None):
+        """Press the keys for actions classified on the device, honoring WAIT_TIME"""
+        if now is None:
+            now = time.time()
+        wait_time = self.settings.for_device(device).WAIT_TIME
+        pressed = None
+        while device.events:
+            action, confidence = device.events.popleft()
+            device.current_action = action
+            device.confidence = confidence
+            if now - device.last_press > wait_time:
+                self.dispatch(device, action, now)
+                pressed = action
+                if self.verbose:
+                    log.info("Accelerometer Action: %s %s (%.0f%%) (device event)",
+                             device.name, action, confidence * 100)
+        return pressed
+
+    def detect_gesture(self, device, min_confidence: float = 0.0):
+        """Run the gesture engine over the filtered sample window of a device"""
+        samples, timestamps = device.window(self.gestures.window)
+        if device.gesture_state is None:
+            device.gesture_state = GestureState()
+        action, confidence = self.gestures.detect(device.gesture_state, self.chain.apply(samples), timestamps)
+        if confidence < min_confidence:
+            return None, confidence
+        return action, confidence
+
+    def run(self):
+        """Main loop, also evicts idle devices and reports latency periodically"""
+        self.running = True
+        last_eviction = last_report = last_save = time.time()
+        reported = 0
+
+        while self.running:
+            try:
+                device = self.queue.get(timeout=1.0)
+            except queue.Empty:
+                device = None
+            if device is not None:
+                self.process(device)
+
+            now = time.time()
+            if now - last_eviction > DEVICE_IDLE_TIMEOUT:
+                self.registry.evict_idle(now)
+                last_eviction = now
+            if now - last_report > LATENCY_REPORT_INTERVAL and self.latency.count != reported:
+                log.info("Receive-to-enqueue latency: %s", self.latency.summary())
+                reported = self.latency.count
+                last_report = now
+            if self.calibration is not None and now - last_save > CALIBRATION_SAVE_INTERVAL:
+                self.calibration.save()
+                last_save = now
+
+        if self.calibration is not None:
+            self.calibration.save()
+
+    def stop(self):
+        self.running = False
+
+
+def create_engine(registry, press: Callable[[str], None], classifier: str = CLASSIFIER,
+                  verbose: bool = True, calibration_path: Optional[str] = CALIBRATION_PATH,
+                  settings: Optional[RuntimeSettings] = None) -> ActionEngine:
+    """Build the filter chain, the classifier and the engine from config.py"""
+    chain = FilterChain(FILTER_CHAIN, FILTER_SAMPLE_RATE, FILTER_WINDOW)
+
+    # Recognizes jumps, hops and spot jogging when the classifier is "gesture"
+    gestures = None
+    if classifier == "gesture":
+        gestures = GestureEngine(GESTURE_WINDOW, GESTURE_VERTICAL_AXIS, GESTURE_LATERAL_AXIS,
+                                 GESTURE_IMPULSE_SAMPLES, HOP_THRESHOLD, JUMP_THRESHOLD,
+                                 JOG_MIN_AMPLITUDE, JOG_MIN_HZ, JOG_MAX_HZ, GESTURE_REFRACTORY)
+    elif classifier != "threshold":
+        raise ValueError(f"Unknown CLASSIFIER: {classifier}")
+
+    # Per-player bias tracking and thresholds, for the threshold classifier
+    calibration = None
+    if ADAPTIVE_CALIBRATION and gestures is None:
+        calibration = AdaptiveCalibration((X_THRESHOLD, Y_THRESHOLD, Z_THRESHOLD), CALIBRATION_WARMUP,
+                                          CALIBRATION_BIAS_ALPHA, CALIBRATION_VARIANCE_ALPHA, THRESHOLD_SIGMA,
+                                          MIN_THRESHOLD_SCALE, MAX_THRESHOLD_SCALE, calibration_path)
+
+    return ActionEngine(registry, press, chain, gestures, settings, verbose, calibration)
@@ -0,0 +1,665 @@
+# Multi-process pipeline (PIPELINE_MODE = "processes")
+# In the default threaded mode, UDP parsing, classification and the OpenCV
+# render/encode loop share one interpreter and its GIL, so under load JPEG
+# encoding delays the input path. Here each of them gets its own process:
+#
+#   receiver    UDP socket -> decode -> sample ring; discovery responder
+#   classifier  sample ring -> filters, classifier, calibration -> key output
+#               and the device state table
+#   renderer    device state table -> rendered, JPEG-encoded frame slot
+#   web (this)  Flask, telemetry and the frame broadcaster, reading the tables
+#
+# Data moves through shared memory (see sharedmem.py), never through pickles:
+# the receiver appends fixed-size sample records to a ring the classifier
+# drains, and state is republished as whole tables readers copy in one go.
+# Only runtime setting changes, which are rare, travel through queues. Input
+# latency therefore does not depend on how many viewers are attached.
+# Each process also copies its timing histograms to shared memory a few times
+# a second, and the web process serves those on /metrics.
+
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import struct
+import threading
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+import config
+import protocol
+from config import *
+from broadcast import Broadcaster
+from devices import DeviceRegistry
+from logs import setup_logging
+from metrics import LATENCY_BUCKETS, REGISTRY
+from link import format_link
+from profiler import SamplingProfiler
+from reports import ServiceReports
+from settings import RuntimeSettings, SettingsWatcher
+from sharedmem import FrameSlot, SampleRing, SeqlockTable, SharedCounters, attach
+
+log = logging.getLogger(__name__)
+
+# One record per sample; the last record of each datagram marks its end
+KIND_SAMPLE = 0
+KIND_END = 1        # Last sample of a datagram, the classifier runs after it
+KIND_EVENT = 2      # Action classified on the device: x is the action code, y the confidence
+KIND_HEARTBEAT = 3  # Packet without samples or actions, only keeps the device alive
+
+SAMPLE_RECORD = np.dtype([
+    ('kind', 'u1'), ('port', 'u2'), ('device', 'i4'), ('address', 'u4'),
+    ('x', 'f4'), ('y', 'f4'), ('z', 'f4'),
+    ('time', 'f8'),         # Sampling time on the server clock
+    ('received', 'f8'),     # perf_counter() at receipt; the clock is system wide
+])
+
+DEVICE_RECORD = np.dtype([
+    ('active', 'u1'), ('port', 'u2'), ('device', 'i4'), ('address', 'u4'),
+    ('action', 'u1'), ('confidence', 'f4'), ('x', 'f4'), ('y', 'f4'), ('z', 'f4'),
+    ('last_seen', 'f8'), ('packets', 'i8'), ('samples', 'i8'),
+    ('thresholds', 'f4', (3,)),     # Ones in use; NaN before the first classification
+])
+
+LINK_RECORD = np.dtype([
+    ('active', 'u1'), ('port', 'u2'), ('device', 'i4'), ('address', 'u4'),
+    ('received', 'i8'), ('lost', 'i8'), ('reordered', 'i8'), ('duplicates', 'i8'),
+    ('stale', 'i8'), ('resets', 'i8'), ('loss_rate', 'f4'),
+    ('offset', 'f8'), ('latency', 'f4'), ('p50', 'f4'), ('p99', 'f4'),   # Seconds, NaN when unknown
+])
+
+HISTOGRAM_RECORD = np.dtype([
+    ('counts', 'i8', (len(LATENCY_BUCKETS) + 1,)), ('sum', 'f8'), ('count', 'i8'),
+])
+
+# Histograms (name, labels) each process keeps, in the order of its shared table rows
+HISTOGRAMS = {
+    "receiver": (("temple_run_parse_seconds", {}),),
+    "classifier": (("temple_run_classify_seconds", {}), ("temple_run_keypress_dispatch_seconds", {}),
+                   ("temple_run_receive_to_enqueue_seconds", {})) + tuple(
+        ("temple_run_output_dispatch_seconds", {"backend": name}) for name in OUTPUT_BACKENDS),
+    "renderer": (("temple_run_frame_render_seconds", {}), ("temple_run_frame_encode_seconds", {})),
+}
+
+RECEIVER_COUNTERS = ("packets", "samples", "events", "bytes", "invalid", "duplicates", "stale",
+                     "rejected", "overruns", "wakeups", "packets_per_sec")
+CLASSIFIER_COUNTERS = ("keypresses", "latency_p99", "ring_missed") + tuple(
+    f"output_{value}_{name}" for name in OUTPUT_BACKENDS for value in ("p99", "dropped", "errors"))
+CONTROL_COUNTERS = ("viewers",)
+
+PUBLISH_INTERVAL = 0.05     # Seconds between state table updates
+
+
+def _pack_address(address) -> Tuple[int, int]:
+    return struct.unpack('!I', socket.inet_aton(address[0]))[0], address[1]
+
+
+def _identity(device) -> Tuple[int, int, int]:
+    """(device id or -1, packed address, port): how both processes name a device in shared memory"""
+    address, port = _pack_address(device.address)
+    return device.device_id if device.device_id is not None else -1, address, port
+
+
+def _unpack_address(packed: int, port: int) -> Tuple[str, int]:
+    return socket.inet_ntoa(struct.pack('!I', packed)), port
+
+
+def _device_name(device_id: int, packed: int, port: int) -> str:
+    if device_id >= 0:
+        return f"device {device_id}"
+    return "%s:%d" % _unpack_address(packed, port)
+
+
+def _histogram_state(table: SeqlockTable, index: int):
+    row = table.snapshot()[index]
+    return row['counts'].tolist(), float(row['sum']), int(row['count'])
+
+
+def _nan_to_none(value: float):
+    return None if np.isnan(value) else float(value)
+
+
+class ChildProcess:
+    """Common plumbing of the pipeline processes: logging, settings, metrics and stopping"""
+
+    role = None     # Key of this process's histograms in HISTOGRAMS
+
+    def __init__(self, specs: Dict, control, stop):
+        setup_logging(LOG_LEVEL, LOG_RATE_INTERVAL, LOG_RATE_BURST)
+        self.shared = {key: attach(spec) for key, spec in specs.items()}
+        self.control = control
+        self.stop_event = stop
+        self.parent = multiprocessing.parent_process()
+        self.settings = RuntimeSettings.from_module(config)
+        self.settings.subscribe(lambda snapshot: logging.getLogger().setLevel(snapshot.LOG_LEVEL))
+
+    def stopping(self) -> bool:
+        """Stop when told to, or when the web process is gone without telling us"""
+        return self.stop_event.is_set() or not self.parent.is_alive()
+
+    def apply_control(self):
+        """Apply setting changes forwarded by the web process"""
+        while True:
+            try:
+                message = self.control.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                self.settings.update(message["settings"], message["DEVICE_OVERRIDES"])
+            except ValueError as e:
+                log.error("Ignoring forwarded settings: %s", e)
+
+    def publish_histograms(self):
+        """Copy this process's histograms to shared memory for /metrics"""
+        table = np.zeros(len(HISTOGRAMS[self.role]), HISTOGRAM_RECORD)
+        for row, (name, labels) in zip(table, HISTOGRAMS[self.role]):
+            histogram = REGISTRY.find(name, labels)
+            if histogram is not None:
+                row['counts'], row['sum'], row['count'] = histogram.counts, histogram.sum, histogram.count
+        self.shared[f"{self.role}_histograms"].publish(table)
+
+    def close(self):
+        for block in self.shared.values():
+            block.close()
+
+
+class RingSink:
+    """Takes the engine's place in the receiver process and forwards samples to the ring"""
+
+    def __init__(self, ring: SampleRing, wake):
+        self.ring = ring
+        self.wake = wake
+        self.forwarded: Dict[object, int] = {}     # Device -> samples already forwarded
+        self.identities: Dict[object, Tuple[Tuple[str, int], Tuple[int, int, int]]] = {}
+
+    def identity(self, device) -> Tuple[int, int, int]:
+        # A restarted client keeps its device id but sends from a new port
+        cached = self.identities.get(device)
+        if cached is None or cached[0] != device.address:
+            cached = self.identities[device] = (device.address, _identity(device))
+        return cached[1]
+
+    def _records(self, device, count: int) -> np.ndarray:
+        records = np.zeros(count, SAMPLE_RECORD)
+        records['device'], records['address'], records['port'] = self.identity(device)
+        return records
+
+    def notify(self, device, received_at: float):
+        new = device.samples - self.forwarded.get(device, 0)
+        self.forwarded[device] = device.samples
+        samples, timestamps = device.window(new)
+        records = self._records(device, len(samples))
+        records['kind'][-1] = KIND_END
+        records['x'], records['y'], records['z'] = samples[:, 0], samples[:, 1], samples[:, 2]
+        records['time'] = timestamps
+        records['received'] = received_at
+        self.ring.write(records)
+        self.wake.set()
+
+    def notify_event(self, device, action: str, confidence: float, received_at: float):
+        records = self._records(device, 1)
+        records['kind'] = KIND_EVENT
+        records['x'] = protocol.ACTION_CODES[action]
+        records['y'] = confidence
+        records['received'] = received_at
+        self.ring.write(records)
+        self.wake.set()
+
+    def notify_heartbeat(self, device, received_at: float):
+        # Without it the classifier's registry would evict a device that sends only events
+        records = self._records(device, 1)
+        records['kind'] = KIND_HEARTBEAT
+        records['received'] = received_at
+        self.ring.write(records)
+
+    def forget(self, devices):
+        for device in devices:
+            self.forwarded.pop(device, None)
+            self.identities.pop(device, None)
+
+
+class ReceiverProcess(ChildProcess):
+    """UDP receiver writing decoded samples to the ring"""
+
+    role = "receiver"
+
+    def __init__(self, specs, control, stop, wake):
+        super().__init__(specs, control, stop)
+        from capture import CaptureWriter
+        from discovery import DiscoveryServer
+        from receiver import create_receiver
+
+        self.registry = DeviceRegistry(MAX_DEVICES, DEVICE_HISTORY, DEVICE_IDLE_TIMEOUT,
+                                       KEY_BINDINGS, DEVICE_KEY_BINDINGS)
+        self.sink = RingSink(self.shared["samples"], wake)
+        capture = CaptureWriter(CAPTURE_PATH) if CAPTURE_PATH else None
+        self.receiver = create_receiver(RECEIVER_MODE, self.registry, self.sink, SERVER_PORT, UDP_RCVBUF,
+                                        RECEIVER_STATS_INTERVAL, RECEIVER_BULK_DRAIN, RECEIVER_DRAIN_BATCH,
+                                        capture, MAX_SAMPLE_AGE, self.settings)
+        self.discovery = DiscoveryServer(self.registry, self.settings) if DISCOVERY_PORT else None
+
+    def run(self):
+        threads = [threading.Thread(target=self.receiver.run, name="receiver", daemon=True)]
+        if self.discovery is not None:
+            threads.append(threading.Thread(target=self.discovery.run, name="discovery", daemon=True))
+        for thread in threads:
+            thread.start()
+        links = self.shared["links"]
+        counters = self.shared["receiver_stats"]
+        table = np.zeros(links.data.shape, LINK_RECORD)
+        while not self.stopping():
+            self.stop_event.wait(PUBLISH_INTERVAL * 5)
+            self.apply_control()
+            self.sink.forget(self.registry.evict_idle(time.time()))
+
+            stats = self.receiver.stats
+            for name in RECEIVER_COUNTERS:
+                counters.set(name, getattr(stats, name))
+            self.publish_histograms()
+
+            table[:] = 0
+            for row, device in zip(table, self.registry.devices()):
+                link = device.link
+                row['active'] = 1
+                row['device'], row['address'], row['port'] = self.sink.identity(device)
+                row['received'], row['lost'], row['reordered'] = link.received, link.lost, link.reordered
+                row['duplicates'], row['stale'], row['resets'] = link.duplicates, link.stale, link.resets
+                row['loss_rate'] = link.loss_rate
+                known = link.offset is not None
+                row['offset'] = link.offset if known else np.nan
+                row['latency'] = link.latency if known else np.nan
+                p50, p99 = link.latency_percentile(50), link.latency_percentile(99)
+                row['p50'] = p50 if p50 is not None else np.nan
+                row['p99'] = p99 if p99 is not None else np.nan
+            links.publish(table)
+
+        if self.discovery is not None:
+            self.discovery.stop()
+        self.receiver.stop()
+        for thread in threads:
+            thread.join(timeout=2.0)
+        self.close()
+
+
+class ClassifierProcess(ChildProcess):
+    """Drains the sample ring through the engine and presses the keys"""
+
+    role = "classifier"
+
+    def __init__(self, specs, control, stop, wake):
+        super().__init__(specs, control, stop)
+        from outputs import create_dispatcher
+        from pipeline import create_engine
+
+        self.wake = wake
+        self.registry = DeviceRegistry(MAX_DEVICES, DEVICE_HISTORY, DEVICE_IDLE_TIMEOUT,
+                                       KEY_BINDINGS, DEVICE_KEY_BINDINGS)
+        bound_keys = set(KEY_BINDINGS.values())
+        for overrides in DEVICE_KEY_BINDINGS.values():
+            bound_keys.update(overrides.values())
+        self.output = create_dispatcher(OUTPUT_BACKENDS, sorted(bound_keys), OUTPUT_QUEUE_SIZE, WEBSOCKET_PORT)
+        self.engine = create_engine(self.registry, self.output.press, settings=self.settings)
+        self.addresses: Dict[Tuple[int, int], Tuple[str, int]] = {}
+
+    def _lookup(self, device_id: int, packed: int, port: int, now: float):
+        address = self.addresses.get((packed, port))
+        if address is None:
+            address = self.addresses[(packed, port)] = _unpack_address(packed, port)
+        return self.registry.lookup(device_id if device_id >= 0 else None, address, now)
+
+    def consume(self, records: np.ndarray) -> int:
+        """Hand complete datagrams to the engine; returns how many records were used"""
+        ends = np.flatnonzero(records['kind'] != KIND_SAMPLE).tolist()
+        if not ends:
+            return 0
+        now = time.time()
+        xyz = np.stack((records['x'], records['y'], records['z']), axis=1)
+        times = records['time']
+        touched = {}
+        start = 0
+        for end in ends:
+            kind, port, device_id, packed, x, y, _, _, received = records[end].tolist()
+            device = self._lookup(device_id, packed, port, now)
+            if device is not None and kind == KIND_HEARTBEAT:
+                device.seen(now)
+            elif device is not None:
+                if kind == KIND_EVENT:
+                    device.seen(now)
+                    action = protocol.ACTIONS.get(int(x))
+                    if action is not None:
+                        device.events.append((action, y))
+                else:
+                    device.add_samples(xyz[start:end + 1], times[start:end + 1], now)
+                device.received_at = received
+                touched[device.key] = device
+            start = end + 1
+
+        # Like the threaded engine, a burst costs one classification per device
+        for device in touched.values():
+            self.engine.process(device)
+        return ends[-1] + 1
+
+    def publish(self, table: np.ndarray):
+        table[:] = 0
+        for row, device in zip(table, self.registry.devices()):
+            row['active'] = 1
+            row['device'], row['address'], row['port'] = _identity(device)
+            row['action'] = protocol.ACTION_CODES.get(device.current_action, 0)
+            row['confidence'] = device.confidence
+            row['x'], row['y'], row['z'] = device.latest()
+            row['last_seen'], row['packets'], row['samples'] = device.last_seen, device.packets, device.samples
+            row['thresholds'] = device.thresholds if device.thresholds else np.nan
+        self.shared["devices"].publish(table)
+
+        counters = self.shared["classifier_stats"]
+        counters.set("keypresses", self.engine.latency.count)
+        p99 = self.engine.latency.percentile(99)
+        counters.set("latency_p99", p99 if p99 is not None else np.nan)
+        for name, latency in self.output.latency.items():
+            p99 = latency.percentile(99)
+            counters.set(f"output_p99_{name}", p99 if p99 is not None else np.nan)
+            counters.set(f"output_dropped_{name}", self.output.dropped[name])
+            counters.set(f"output_errors_{name}", self.output.errors[name])
+        self.publish_histograms()
+
+    def run(self):
+        ring = self.shared["samples"]
+        counters = self.shared["classifier_stats"]
+        table = np.zeros(self.shared["devices"].data.shape, DEVICE_RECORD)
+        self.output.start()
+        cursor = missed = 0
+        last_publish = last_eviction = last_save = time.time()
+        while not self.stopping():
+            # Clear before reading, so a write after the read always wakes us
+            self.wake.clear()
+            records, end, lost = ring.read(cursor)
+            if lost:
+                missed += lost
+                counters.set("ring_missed", missed)
+                log.warning("Classifier fell behind, %d samples overwritten", lost)
+            used = self.consume(records) if len(records) else 0
+            # An incomplete datagram at the end is read again next time
+            cursor = end - (len(records) - used)
+            if not len(records):
+                self.wake.wait(PUBLISH_INTERVAL)
+
+            now = time.time()
+            if now - last_publish >= PUBLISH_INTERVAL:
+                self.apply_control()
+                self.publish(table)
+                last_publish = now
+            if now - last_eviction > DEVICE_IDLE_TIMEOUT:
+                self.registry.evict_idle(now)
+                last_eviction = now
+            if self.engine.calibration is not None and now - last_save > CALIBRATION_SAVE_INTERVAL:
+                self.engine.calibration.save()
+                last_save = now
+
+        if self.engine.calibration is not None:
+            self.engine.calibration.save()
+        self.output.stop()
+        self.close()
+
+
+class RendererProcess(ChildProcess):
+    """Renders and encodes the video feed from the device table while anyone watches"""
+
+    role = "renderer"
+
+    def run(self):
+        from renderer import FrameRenderer
+        from services import view_info
+
+        # Frames can wait, key presses cannot: let the scheduler favour the other processes
+        if RENDERER_NICE and hasattr(os, "nice"):
+            os.nice(RENDERER_NICE)
+
+        renderer = FrameRenderer(CANVAS_WIDTH, CANVAS_HEIGHT)
+        devices = self.shared["devices"]
+        receiver_stats = self.shared["receiver_stats"]
+        classifier_stats = self.shared["classifier_stats"]
+        control = self.shared["control"]
+        frames = self.shared["frames"]
+        last_frame = None
+        next_frame = time.perf_counter()
+
+        while not self.stopping():
+            self.apply_control()
+            self.publish_histograms()
+            frame_interval = 1.0 / self.settings.current.RENDER_FPS
+            viewers = int(control.get("viewers"))
+            if viewers == 0:
+                self.stop_event.wait(frame_interval)
+                next_frame = time.perf_counter()
+                continue
+
+            current = self.settings.current
+            thresholds = (current.X_THRESHOLD, current.Y_THRESHOLD, current.Z_THRESHOLD)
+            table = devices.snapshot()
+            active = table[table['active'] == 1]
+            if len(active):
+                row = active[np.argmax(active['last_seen'])]
+                action = protocol.ACTIONS.get(int(row['action']))
+                x, y, z = float(row['x']), float(row['y']), float(row['z'])
+                status = f"{_device_name(int(row['device']), int(row['address']), int(row['port']))} " \
+                         f"({len(active)} connected)"
+                if not np.isnan(row['thresholds']).any():
+                    thresholds = row['thresholds'].tolist()
+            else:
+                action = None
+                x = y = z = 0.0
+                status = "Waiting for devices"
+            p99 = classifier_stats.get("latency_p99")
+            stats = receiver_stats.as_dict()
+            drops = int(stats["invalid"] + stats["rejected"] + stats["overruns"])
+            info = view_info(action, x, y, z, status, thresholds, None if np.isnan(p99) else p99,
+                             stats["packets_per_sec"], drops, viewers)
+            frame = renderer.render(action, info)
+            if frame is not last_frame:
+                if not frames.write(frame):
+                    log.warning("Frame of %d bytes does not fit the shared frame slot", len(frame))
+                last_frame = frame
+
+            next_frame += frame_interval
+            delay = next_frame - time.perf_counter()
+            if delay > 0:
+                self.stop_event.wait(delay)
+            else:
+                next_frame = time.perf_counter()
+        self.close()
+
+
+def _process_main(role, specs, control, stop, *args):
+    # Ctrl+C reaches the whole process group; the web process stops us in order
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    role(specs, control, stop, *args).run()
+
+
+class ProcessServices(ServiceReports):
+    """Drop-in replacement for ControllerServices that runs the pipeline in processes"""
+
+    def __init__(self):
+        self.settings = RuntimeSettings.from_module(config)
+        self.settings.subscribe(lambda snapshot: logging.getLogger().setLevel(snapshot.LOG_LEVEL))
+        self.settings.subscribe(self._forward_settings)
+        self.settings_watcher = (SettingsWatcher(self.settings, SETTINGS_PATH, SETTINGS_POLL_INTERVAL)
+                                 if SETTINGS_PATH else None)
+        self.frame_broadcaster = Broadcaster()
+        self.telemetry_broadcaster = Broadcaster()
+        # Profiles the web process only; the others run their own interpreters
+        self.profiler = SamplingProfiler(PROFILER_INTERVAL) if PROFILER_ENABLED else None
+
+        # Spawned rather than forked: the web process already runs threads
+        self.context = multiprocessing.get_context("spawn")
+        self.shared = {
+            "samples": SampleRing(SAMPLE_RECORD, SHARED_RING_SIZE),
+            "devices": SeqlockTable(DEVICE_RECORD, MAX_DEVICES),
+            "links": SeqlockTable(LINK_RECORD, MAX_DEVICES),
+            "frames": FrameSlot(SHARED_FRAME_SIZE),
+            "receiver_stats": SharedCounters(RECEIVER_COUNTERS),
+            "classifier_stats": SharedCounters(CLASSIFIER_COUNTERS),
+            "control": SharedCounters(CONTROL_COUNTERS),
+        }
+        for role, histograms in HISTOGRAMS.items():
+            self.shared[f"{role}_histograms"] = SeqlockTable(HISTOGRAM_RECORD, len(histograms))
+        self.stop_event = self.context.Event()
+        self.wake = self.context.Event()
+        self.controls: List = []
+        self.processes: List = []
+        self.threads: List = []
+        self.started = False
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._register_metrics()
+
+    def _register_metrics(self):
+        """Counters kept by the other processes, read from shared memory at scrape time"""
+        super()._register_metrics()
+        from outputs import dispatch_histogram
+
+        classifier = self.shared["classifier_stats"]
+        REGISTRY.counter_function("temple_run_ring_missed_total",
+                                  "Samples overwritten before the classifier process read them",
+                                  lambda: classifier.get("ring_missed"))
+        for name in OUTPUT_BACKENDS:
+            dispatch_histogram(name)
+            REGISTRY.counter_function("temple_run_output_dropped_total", "Key presses dropped by a full output queue",
+                                      lambda name=name: classifier.get(f"output_dropped_{name}"), {"backend": name})
+            REGISTRY.counter_function("temple_run_output_errors_total", "Key presses a backend failed to deliver",
+                                      lambda name=name: classifier.get(f"output_errors_{name}"), {"backend": name})
+        # The histograms this process registered on import are served from the others' copies
+        for role, histograms in HISTOGRAMS.items():
+            table = self.shared[f"{role}_histograms"]
+            for index, (name, labels) in enumerate(histograms):
+                REGISTRY.histogram_function(name, lambda table=table, index=index: _histogram_state(table, index),
+                                            labels)
+
+    def _forward_settings(self, snapshot):
+        overrides = {str(key): values for key, values in self.settings.overrides.items()}
+        for control in self.controls:
+            control.put({"settings": snapshot.to_dict(), "DEVICE_OVERRIDES": overrides})
+
+    def start(self) -> bool:
+        """Start the pipeline processes and the web-side threads, once"""
+        with self._lock:
+            if self.started:
+                return False
+            self.started = True
+
+        specs = {key: block.spec for key, block in self.shared.items()}
+        roles = [("receiver", ReceiverProcess, (self.wake,)),
+                 ("classifier", ClassifierProcess, (self.wake,)),
+                 ("renderer", RendererProcess, ())]
+        for name, role, extra in roles:
+            control = self.context.Queue()
+            process = self.context.Process(target=_process_main, name=name, daemon=True,
+                                           args=(role, specs, control, self.stop_event) + extra)
+            process.start()
+            self.controls.append(control)
+            self.processes.append(process)
+        log.info("Pipeline running in processes: %s",
+                 ", ".join(f"{p.name} (pid {p.pid})" for p in self.processes))
+
+        services = [("frames", self.relay_frames), ("telemetry", self.produce_telemetry)]
+        if self.settings_watcher is not None:
+            services.append(("settings", self.settings_watcher.run))
+        for name, target in services:
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        # /healthz checks processes and threads alike
+        self.threads.extend(self.processes)
+        return True
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the processes, which flush their key output and save calibration"""
+        with self._lock:
+            if not self.started or self._stopping.is_set():
+                return
+            self._stopping.set()
+
+        log.info("Stopping pipeline processes")
+        self.frame_broadcaster.close()
+        self.telemetry_broadcaster.close()
+        if self.settings_watcher is not None:
+            self.settings_watcher.stop()
+        self.stop_event.set()
+        self.wake.set()
+        deadline = time.monotonic() + timeout
+        for worker in self.threads:
+            worker.join(max(0.0, deadline - time.monotonic()))
+            if worker.is_alive():
+                log.warning("%s did not stop within %.0f seconds", worker.name, timeout)
+                if isinstance(worker, multiprocessing.process.BaseProcess):
+                    worker.terminate()
+        for block in self.shared.values():
+            block.close()
+
+    def relay_frames(self):
+        """Publish frames from the renderer process and tell it how many viewers there are"""
+        frames = self.shared["frames"]
+        control = self.shared["control"]
+        version = 0
+        while not self._stopping.is_set():
+            control.set("viewers", self.frame_broadcaster.subscribers)
+            version, frame = frames.read(version)
+            if frame is not None:
+                self.frame_broadcaster.publish(b'--frame\r\n'
+                    b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+            self._stopping.wait(0.5 / self.settings.current.RENDER_FPS)
+
+    def _links(self) -> Dict[Tuple[int, int, int], np.void]:
+        table = self.shared["links"].snapshot()
+        return {(int(row['device']), int(row['address']), int(row['port'])): row
+                for row in table[table['active'] == 1]}
+
+    def receiver_counts(self):
+        return self.shared["receiver_stats"].as_dict()
+
+    def keypresses(self):
+        return int(self.shared["classifier_stats"].get("keypresses"))
+
+    def latency_p99(self):
+        return _nan_to_none(self.shared["classifier_stats"].get("latency_p99"))
+
+    def output_p99(self):
+        classifier = self.shared["classifier_stats"].as_dict()
+        return {name: float(classifier[f"output_p99_{name}"])
+                for name in OUTPUT_BACKENDS if not np.isnan(classifier[f"output_p99_{name}"])}
+
+    def device_count(self):
+        return int(self.shared["devices"].snapshot()['active'].sum())
+
+    def device_states(self):
+        links = self._links()
+        table = self.shared["devices"].snapshot()
+        states = []
+        for row in table[table['active'] == 1]:
+            identity = (int(row['device']), int(row['address']), int(row['port']))
+            link = links.get(identity)
+            thresholds = row['thresholds']
+            states.append({
+                "name": _device_name(*identity), "id": identity[0] if identity[0] >= 0 else None,
+                "action": protocol.ACTIONS.get(int(row['action'])), "confidence": row['confidence'],
+                "x": row['x'], "y": row['y'], "z": row['z'],
+                "last_seen": row['last_seen'], "packets": row['packets'], "samples": row['samples'],
+                "thresholds": None if np.isnan(thresholds).any() else thresholds.tolist(),
+                "loss": link['loss_rate'] if link is not None else 0.0,
+                "latency": _nan_to_none(link['latency']) if link is not None else None,
+            })
+        return states
+
+    def link_states(self):
+        states = []
+        for (device_id, packed, port), row in self._links().items():
+            link = format_link(int(row['received']), int(row['lost']), int(row['reordered']),
+                               int(row['duplicates']), int(row['stale']), int(row['resets']),
+                               _nan_to_none(row['offset']), _nan_to_none(row['p50']), _nan_to_none(row['p99']))
+            states.append(dict(link, name=_device_name(device_id, packed, port),
+                               id=device_id if device_id >= 0 else None,
+                               address=_unpack_address(packed, port)[0]))
+        return states
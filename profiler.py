@@ -0,0 +1,92 @@
+# Opt-in sampling profiler for the running server
+# A background thread snapshots the stack of every other thread at a fixed
+# interval with sys._current_frames() and counts identical stacks. The result
+# is printed in the collapsed-stack format understood by flamegraph.pl and
+# speedscope. Sampling costs the profiled threads nothing beyond the GIL
+# hand-offs, so it can be switched on while players are reporting lag.
+
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+
+class SamplingProfiler:
+    """Counts the stacks of all threads sampled every `interval` seconds"""
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self.started = 0.0
+        self.duration = 0.0
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def start(self):
+        """Start sampling, discarding the previous profile"""
+        with self._lock:
+            if self._running:
+                return
+            self.stacks = Counter()
+            self.samples = 0
+            self.started = time.time()
+            self.duration = 0.0
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            thread = self._thread
+        thread.join()
+        self.duration = time.time() - self.started
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        next_sample = time.perf_counter()
+        while self._running:
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+                    frame = frame.f_back
+                name = names.get(ident)
+                if name is None:
+                    thread = next((t for t in threading.enumerate() if t.ident == ident), None)
+                    name = names[ident] = thread.name if thread is not None else str(ident)
+                stack.append(name)
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+            next_sample += self.interval
+            delay = next_sample - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_sample = time.perf_counter()
+
+    def collapsed(self, limit: Optional[int] = None) -> str:
+        """Profile as 'thread;outer;...;inner count' lines, most frequent first"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common(limit))
+
+    def profile(self, seconds: float) -> str:
+        """Sample for `seconds` and return the collapsed stacks"""
+        self.start()
+        time.sleep(seconds)
+        self.stop()
+        return self.collapsed()
@@ -0,0 +1,238 @@
+# Wire format for accelerometer sample packets
+# Shared by accelerometer_server.py and the Python test clients.
+# The Raspberry Pi client carries its own copy of the packing code so it can be
+# deployed without this file; keep raspberry_pi/accelerometer_client.py in sync.
+#
+# Binary frame (little endian):
+#   header  magic 'TR' | version u8 | dtype u8 | sequence u32 | device id u16 |
+#           sample count u16 | timestamp f64 | interval f32
+#   samples count x (x, y, z) as int16 (scaled by INT16_SCALE) or float32
+#   events  count x (action code u8, confidence u8) when dtype is DTYPE_EVENT;
+#           devices that classify on their own send these instead of samples,
+#           and an empty event packet works as a heartbeat
+#
+# `timestamp` is the client clock at the first sample of the batch and
+# `interval` the spacing between samples, so sample i was taken at
+# timestamp + i * interval.
+#
+# Legacy datagrams are plain JSON: {"x": 0.0, "y": 0.0, "z": 0.0, "timestamp": ...},
+# optionally with a "sequence" number
+#
+# Control datagrams go between the Pi and DISCOVERY_PORT, never to SERVER_PORT:
+#   discover  magic | version | DTYPE_DISCOVER | device id u16
+#             broadcast by clients looking for the server
+#   control   magic | version | DTYPE_CONTROL | server address 4s | data port u16 |
+#             sample rate f32
+#             the answer to a discover, and repeated to every known device as
+#             an instruction and keepalive; address 0.0.0.0 stands for the
+#             sender's own, sample rate 0 leaves the client at its own rate
+
+import json
+import math
+import socket
+import struct
+from typing import NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+MAGIC = b'TR'
+VERSION = 1
+
+DTYPE_INT16 = 0
+DTYPE_FLOAT32 = 1
+DTYPE_EVENT = 2
+DTYPE_DISCOVER = 16
+DTYPE_CONTROL = 17
+
+EVENT = struct.Struct('<BB')
+ACTION_CODES = {"up": 1, "down": 2, "left": 3, "right": 4}
+ACTIONS = {code: action for action, code in ACTION_CODES.items()}
+
+HEADER = struct.Struct('<2sBBIHHdf')
+HEADER_SIZE = HEADER.size
+DISCOVER = struct.Struct('<2sBBH')
+CONTROL = struct.Struct('<2sBB4sHf')
+
+# Device ids are sent as u16
+MAX_DEVICE_ID = 0xFFFF
+
+# int16 counts per unit of acceleration; covers the +-4.0 range
+INT16_SCALE = 8192.0
+
+# Largest UDP payload that fits in a single Ethernet frame
+MAX_DATAGRAM = 1472
+MAX_SAMPLES = (MAX_DATAGRAM - HEADER_SIZE) // 6
+
+FLOAT32_MAX = float(np.finfo(np.float32).max)
+
+_SAMPLE_DTYPES = {
+    DTYPE_INT16: np.dtype('<i2'),
+    DTYPE_FLOAT32: np.dtype('<f4'),
+}
+
+
+class PacketHeader(NamedTuple):
+    """Metadata of a decoded datagram; the samples live in the caller's buffer"""
+    format: str                 # 'binary', 'event' or 'json'
+    sequence: Optional[int]     # None for JSON without a "sequence" field
+    device_id: Optional[int]    # None for legacy JSON
+    count: int
+    timestamp: Optional[float]  # client clock at the first sample
+    interval: float
+
+
+def allocate_buffer() -> np.ndarray:
+    """Allocate a sample buffer large enough for any single datagram"""
+    return np.zeros((MAX_SAMPLES, 3), dtype=np.float32)
+
+
+def encode(samples: Sequence[Tuple[float, float, float]], sequence: int, device_id: int,
+           timestamp: float, interval: float = 0.0, dtype: int = DTYPE_INT16) -> bytes:
+    """Pack a batch of (x, y, z) samples into one binary datagram"""
+    count = len(samples)
+    if not 0 < count <= max_samples(dtype):
+        raise ValueError(f"Batch of {count} samples does not fit in one datagram")
+
+    values = np.asarray(samples, dtype=np.float32).reshape(count, 3)
+    if dtype == DTYPE_INT16:
+        values = np.clip(np.rint(values * INT16_SCALE), -32768, 32767)
+    body = values.astype(_SAMPLE_DTYPES[dtype]).tobytes()
+
+    header = HEADER.pack(MAGIC, VERSION, dtype, sequence & 0xFFFFFFFF, device_id,
+                         count, timestamp, interval)
+    return header + body
+
+
+def encode_events(events: Sequence[Tuple[str, float]], sequence: int, device_id: int,
+                  timestamp: float) -> bytes:
+    """Pack (action, confidence) events into one datagram; no events makes a heartbeat"""
+    body = b''.join(EVENT.pack(ACTION_CODES[action], int(round(max(0.0, min(1.0, confidence)) * 255)))
+                    for action, confidence in events)
+    header = HEADER.pack(MAGIC, VERSION, DTYPE_EVENT, sequence & 0xFFFFFFFF, device_id,
+                         len(events), timestamp, 0.0)
+    return header + body
+
+
+def encode_discover(device_id: int) -> bytes:
+    return DISCOVER.pack(MAGIC, VERSION, DTYPE_DISCOVER, device_id)
+
+
+def decode_discover(data: bytes) -> Optional[int]:
+    """Device id of a discover datagram, or None if it is not one"""
+    if len(data) != DISCOVER.size:
+        return None
+    magic, version, dtype, device_id = DISCOVER.unpack(data)
+    if magic != MAGIC or version != VERSION or dtype != DTYPE_DISCOVER:
+        return None
+    return device_id
+
+
+def encode_control(address: str, port: int, sample_rate: float) -> bytes:
+    """Tell a client where to send and at which rate; address "0.0.0.0" means the sender"""
+    return CONTROL.pack(MAGIC, VERSION, DTYPE_CONTROL, socket.inet_aton(address), port, sample_rate)
+
+
+def decode_control(data: bytes) -> Optional[Tuple[str, int, float]]:
+    """(address, port, sample rate) of a control datagram, or None if it is not one"""
+    if len(data) != CONTROL.size:
+        return None
+    magic, version, dtype, address, port, sample_rate = CONTROL.unpack(data)
+    if magic != MAGIC or version != VERSION or dtype != DTYPE_CONTROL:
+        return None
+    return socket.inet_ntoa(address), port, sample_rate
+
+
+def max_samples(dtype: int = DTYPE_INT16) -> int:
+    """Number of samples of the given type that fit in one datagram"""
+    return (MAX_DATAGRAM - HEADER_SIZE) // (3 * _SAMPLE_DTYPES[dtype].itemsize)
+
+
+def decode_into(data: bytes, out: np.ndarray) -> PacketHeader:
+    """Decode a binary or legacy JSON datagram, writing samples into `out`
+
+    `out` must be a float32 array of shape (MAX_SAMPLES, 3), normally from
+    allocate_buffer(). For event packets out[:count, 0] holds the action codes
+    and out[:count, 1] the confidence. Raises ValueError for malformed datagrams,
+    including samples or times that are not finite numbers.
+    """
+    if data[:2] == MAGIC:
+        return _decode_binary(data, out)
+    return _decode_json(data, out)
+
+
+def _decode_binary(data: bytes, out: np.ndarray) -> PacketHeader:
+    if len(data) < HEADER_SIZE:
+        raise ValueError("Truncated packet header")
+
+    _, version, dtype, sequence, device_id, count, timestamp, interval = HEADER.unpack_from(data)
+    if version != VERSION:
+        raise ValueError(f"Unsupported protocol version {version}")
+    if not (math.isfinite(timestamp) and math.isfinite(interval)):
+        raise ValueError("Non-finite packet time")
+    if dtype == DTYPE_EVENT:
+        return _decode_events(data, out, sequence, device_id, count, timestamp)
+    sample_dtype = _SAMPLE_DTYPES.get(dtype)
+    if sample_dtype is None:
+        raise ValueError(f"Unknown sample type {dtype}")
+    if count == 0:
+        raise ValueError("Empty sample packet")
+    if count > len(out) or len(data) < HEADER_SIZE + count * 3 * sample_dtype.itemsize:
+        raise ValueError("Truncated sample payload")
+
+    view = np.frombuffer(data, dtype=sample_dtype, count=count * 3, offset=HEADER_SIZE)
+    view = view.reshape(count, 3)
+    if dtype == DTYPE_INT16:
+        np.multiply(view, 1.0 / INT16_SCALE, out=out[:count], casting='unsafe')
+    else:
+        out[:count] = view
+        # float32 can carry NaN and infinities, which would poison the filters
+        if not np.isfinite(out[:count]).all():
+            raise ValueError("Non-finite sample value")
+
+    return PacketHeader('binary', sequence, device_id, count, timestamp, interval)
+
+
+def _decode_events(data: bytes, out: np.ndarray, sequence: int, device_id: int,
+                   count: int, timestamp: float) -> PacketHeader:
+    if count > len(out) or len(data) < HEADER_SIZE + count * EVENT.size:
+        raise ValueError("Truncated event payload")
+
+    view = np.frombuffer(data, dtype=np.uint8, count=count * EVENT.size, offset=HEADER_SIZE)
+    view = view.reshape(count, EVENT.size)
+    out[:count, 0] = view[:, 0]
+    np.multiply(view[:, 1], 1.0 / 255, out=out[:count, 1], casting='unsafe')
+    return PacketHeader('event', sequence, device_id, count, timestamp, 0.0)
+
+
+def _decode_json(data: bytes, out: np.ndarray) -> PacketHeader:
+    try:
+        message = json.loads(data.decode('utf-8'))
+    except RecursionError:
+        raise ValueError("JSON packet nested too deeply") from None
+    if not isinstance(message, dict):
+        raise ValueError("JSON packet is not an object")
+
+    sample = [_json_number(message.get(key, 0.0), key) for key in ('x', 'y', 'z')]
+    if max(abs(value) for value in sample) > FLOAT32_MAX:
+        raise ValueError("Sample value out of range")
+    out[0] = sample
+    timestamp = message.get('timestamp')
+    if timestamp is not None:
+        timestamp = _json_number(timestamp, 'timestamp')
+    sequence = message.get('sequence')
+    if not isinstance(sequence, int) or isinstance(sequence, bool):
+        sequence = None
+    return PacketHeader('json', sequence, None, 1, timestamp, 0.0)
+
+
+def _json_number(value, key: str) -> float:
+    """A JSON field as a finite float; raises ValueError otherwise"""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"JSON field {key!r} is not a number")
+    try:
+        value = float(value)
+    except OverflowError:
+        raise ValueError(f"JSON field {key!r} is out of range") from None
+    if not math.isfinite(value):
+        raise ValueError(f"JSON field {key!r} is not finite")
+    return value
@@ -4,27 +4,87 @@ Raspberry Pi Accelerometer Client for Temple Run
 Uses BerryPi accelerometer card to send movement data to the main server
 """
 
+import os
 import time
+import queue
+import select
 import socket
 import json
+import struct
 import threading
-from typing import Dict, Any
+from collections import deque
+from typing import Dict, Any, List, Optional, Tuple
 import smbus2 as smbus
 
 # Configuration
-SERVER_IP = "192.168.1.100"  # Change to your computer's IP address
-SERVER_PORT = 5001
-SAMPLE_RATE = 50  # Hz (50 samples per second)
+SERVER_IP = None  # None finds the server on the local network, or set your computer's IP address
+SERVER_PORT = 5001  # Used with a fixed SERVER_IP; a discovered server tells its own port
+DISCOVERY_PORT = 5003  # Where the server answers discovery broadcasts (DISCOVERY_PORT in its config.py)
+DISCOVERY_RETRY = 1.0  # Seconds before the first repeated broadcast, doubling each time
+DISCOVERY_MAX_RETRY = 30.0  # Longest wait between broadcasts
+SERVER_TIMEOUT = 20.0  # Seconds without instructions from a discovered server before looking for it again
+SAMPLE_RATE = 50  # Hz (50 samples per second, up to 1000 in FIFO mode)
 BUS_NUMBER = 1  # I2C bus number (usually 1 for Raspberry Pi)
+READ_MODE = "burst"  # "burst" (one 6-byte read per sample) or "fifo" (sensor buffers samples, drained in bulk)
+FIFO_DRAIN_INTERVAL = 0.01  # Seconds between FIFO drains in FIFO mode
+SCHEDULE_POLICY = "skip"  # Missed sample deadlines: "skip" them or "catchup" by reading back-to-back
+MAX_CATCHUP = 5  # Most missed samples read back-to-back in "catchup" mode
+SEND_QUEUE_SIZE = 256  # Samples waiting to be sent; the oldest are dropped when full
+PRINT_INTERVAL = 0.5  # Seconds between console value updates (0 disables them)
+STATS_INTERVAL = 10.0  # Seconds between sampling statistics reports (0 disables them)
+DEVICE_ID = 1  # Unique per Pi when several players share one server
+CALIBRATION_FILE = "accelerometer_calibration.json"  # Offsets saved after the first calibration (None recalibrates every start)
+RECALIBRATE = False  # Ignore the saved offsets and calibrate again
+WIRE_FORMAT = "binary"  # "binary" (compact, batched) or "json" (legacy)
+BATCH_SIZE = 1  # Samples per datagram in binary mode (each extra sample adds 1/SAMPLE_RATE latency)
+TRANSMIT_MODE = "raw"  # "raw" (every sample), "changes" (significant changes and heartbeats) or "events" (classify on the Pi, binary only)
+PREPROCESS_ALPHA = 0.5  # Exponential smoothing before the deadband in "changes" and "events" modes (1.0 disables it)
+DEADBAND = 0.05  # Smallest change on any axis that is sent in "changes" mode
+HEARTBEAT_INTERVAL = 1.0  # Seconds between packets while nothing changes
+IDLE_TIMEOUT = 30.0  # Seconds without motion before sampling drops to IDLE_SAMPLE_RATE (0 disables idle mode)
+IDLE_SAMPLE_RATE = 5  # Hz while idle; the first moving sample switches straight back
+IDLE_MOTION_THRESHOLD = 0.05  # Change on any axis that counts as motion
+I2C_RETRIES = 3  # Retries of a failed I2C read, after 2, 4, 8... ms
+I2C_RETRY_DELAY = 0.002  # Seconds before the first retry
+I2C_MAX_BACKOFF = 5.0  # Longest pause between attempts to reinitialize a sensor that keeps failing
+
+# On-device classification for "events" mode, keep in sync with config.py on the server
+X_THRESHOLD = 0.3
+Y_THRESHOLD = 0.3
+Z_THRESHOLD = 0.3
+ACTION_WAIT_TIME = 0.1  # Seconds between repeated events, like WAIT_TIME on the server
+
+# Binary wire format, must match protocol.py on the server
+PACKET_MAGIC = b'TR'
+PACKET_VERSION = 1
+PACKET_DTYPE_INT16 = 0
+PACKET_DTYPE_EVENT = 2
+PACKET_DTYPE_DISCOVER = 16
+PACKET_DTYPE_CONTROL = 17
+PACKET_HEADER = struct.Struct('<2sBBIHHdf')  # magic, version, dtype, sequence, device id, count, timestamp, interval
+PACKET_SAMPLE = struct.Struct('<hhh')
+PACKET_EVENT = struct.Struct('<BB')  # action code, confidence scaled to 0..255
+PACKET_DISCOVER = struct.Struct('<2sBBH')  # magic, version, dtype, device id
+PACKET_CONTROL = struct.Struct('<2sBB4sHf')  # magic, version, dtype, server address, data port, sample rate
+PACKET_ACTION_CODES = {"up": 1, "down": 2, "left": 3, "right": 4}
+PACKET_INT16_SCALE = 8192.0
+PACKET_MAX_SAMPLES = (1472 - PACKET_HEADER.size) // PACKET_SAMPLE.size
 
 # BerryPi Accelerometer I2C Address (MPU6050)
 MPU6050_ADDR = 0x68
 
 # MPU6050 Register Addresses
+SMPLRT_DIV = 0x19
 PWR_MGMT_1 = 0x6B
 CONFIG = 0x1A
 GYRO_CONFIG = 0x1B
 ACCEL_CONFIG = 0x1C
+FIFO_EN = 0x23
+INT_ENABLE = 0x38
+INT_STATUS = 0x3A
+USER_CTRL = 0x6A
+FIFO_COUNTH = 0x72
+FIFO_R_W = 0x74
 ACCEL_XOUT_H = 0x3B
 ACCEL_YOUT_H = 0x3D
 ACCEL_ZOUT_H = 0x3F
@@ -33,12 +93,52 @@ GYRO_XOUT_H = 0x43
 GYRO_YOUT_H = 0x45
 GYRO_ZOUT_H = 0x47
 
+# MPU6050 register bits and limits
+DLPF_CFG_184HZ = 0x01  # Digital low-pass filter on, 1 kHz internal sample rate
+ACCEL_FIFO_EN = 0x08
+USER_CTRL_FIFO_EN = 0x40
+USER_CTRL_FIFO_RESET = 0x04
+INT_DATA_RDY = 0x01
+INT_FIFO_OFLOW = 0x10
+FIFO_SIZE = 1024
+I2C_BLOCK_MAX = 30  # Largest SMBus block read that holds whole samples (5 x 6 bytes)
+
+# Raw sample layout of ACCEL_XOUT_H..ACCEL_ZOUT_L and of each FIFO entry
+RAW_SAMPLE = struct.Struct('>hhh')
+# MPU6050 sensitivity: 16384 LSB/g for ±2g range, scaled by 2 to the -1.0..1.0 range
+RAW_TO_NORMALIZED = 2.0 / 16384.0
+
+def normalize(raw_x: int, raw_y: int, raw_z: int, timestamp: float) -> Dict[str, float]:
+    """Convert raw ±2g readings to the normalized -1.0..1.0 sample format"""
+    return {
+        'x': max(-1.0, min(1.0, raw_x * RAW_TO_NORMALIZED)),
+        'y': max(-1.0, min(1.0, raw_y * RAW_TO_NORMALIZED)),
+        'z': max(-1.0, min(1.0, raw_z * RAW_TO_NORMALIZED)),
+        'timestamp': timestamp
+    }
+
+class SensorError(Exception):
+    """The accelerometer could not be read, even after retrying"""
+
 class BerryPiAccelerometer:
-    """BerryPi Accelerometer interface using MPU6050"""
+    """BerryPi Accelerometer interface using MPU6050
     
-    def __init__(self, bus_number: int = 1, address: int = MPU6050_ADDR):
-        self.bus = smbus.SMBus(bus_number)
+    `bus` can be any object with the smbus2 SMBus methods used here
+    (write_byte_data, read_byte_data, read_i2c_block_data), e.g. a fake for tests.
+    """
+    
+    def __init__(self, bus_number: int = 1, address: int = MPU6050_ADDR, bus=None,
+                 read_mode: str = "burst", sample_rate: int = SAMPLE_RATE):
+        if read_mode not in ("burst", "fifo"):
+            raise ValueError(f"Unknown READ_MODE: {read_mode}")
+        self.bus = bus if bus is not None else smbus.SMBus(bus_number)
         self.address = address
+        self.read_mode = read_mode
+        self.sample_rate = sample_rate
+        self.sample_period = 1.0 / sample_rate
+        self.fifo_overflows = 0
+        self.i2c_errors = 0  # Failed transfers, including those a retry recovered
+        self.next_sample_time = None
         self.initialize_sensor()
         
     def initialize_sensor(self):
@@ -56,56 +156,149 @@ class BerryPiAccelerometer:
             self.bus.write_byte_data(self.address, GYRO_CONFIG, 0x00)
             time.sleep(0.1)
             
-            print("[INFO] BerryPi accelerometer initialized successfully")
+            # Let the sensor itself sample at SAMPLE_RATE: 1 kHz / (1 + divider)
+            divider = max(0, min(255, round(1000 / self.sample_rate) - 1))
+            self.bus.write_byte_data(self.address, CONFIG, DLPF_CFG_184HZ)
+            self.bus.write_byte_data(self.address, SMPLRT_DIV, divider)
+            self.bus.write_byte_data(self.address, INT_ENABLE, INT_DATA_RDY | INT_FIFO_OFLOW)
+            
+            if self.read_mode == "fifo":
+                self.reset_fifo()
+            
+            print(f"[INFO] BerryPi accelerometer initialized successfully ({self.read_mode} mode, {1000 / (1 + divider):.0f} Hz)")
             
         except Exception as e:
             print(f"[ERROR] Failed to initialize accelerometer: {e}")
             raise
     
-    def read_raw_data(self, register: int) -> int:
-        """Read raw 16-bit data from sensor register"""
-        high = self.bus.read_byte_data(self.address, register)
-        low = self.bus.read_byte_data(self.address, register + 1)
-        value = (high << 8) | low
-        
-        # Convert to signed 16-bit
-        if value > 32767:
-            value -= 65536
-        return value
+    def transfer(self, operation, *args):
+        """Run an idempotent SMBus call, retrying I2C errors with exponential backoff"""
+        delay = I2C_RETRY_DELAY
+        for attempt in range(I2C_RETRIES + 1):
+            try:
+                return operation(self.address, *args)
+            except OSError as e:
+                self.i2c_errors += 1
+                error = e
+            if attempt < I2C_RETRIES:
+                time.sleep(delay)
+                delay *= 2
+        raise SensorError(f"I2C transfer failed {I2C_RETRIES + 1} times: {error}") from error
+    
+    def set_sample_rate(self, sample_rate: float):
+        """Change the sensor's own sample rate while running"""
+        divider = max(0, min(255, round(1000 / sample_rate) - 1))
+        self.transfer(self.bus.write_byte_data, SMPLRT_DIV, divider)
+        self.sample_rate = sample_rate
+        self.sample_period = 1.0 / sample_rate
+        if self.read_mode == "fifo":
+            try:
+                self.reset_fifo()
+            except OSError as e:
+                raise SensorError(f"FIFO reset failed: {e}") from e
     
     def read_accelerometer(self) -> Dict[str, float]:
-        """Read accelerometer data and return normalized values"""
+        """Read accelerometer data and return normalized values; raises SensorError"""
+        # ACCEL_XOUT_H..ACCEL_ZOUT_L are contiguous: one 6-byte transaction
+        block = self.transfer(self.bus.read_i2c_block_data, ACCEL_XOUT_H, RAW_SAMPLE.size)
+        accel_x, accel_y, accel_z = RAW_SAMPLE.unpack(bytes(block))
+        return normalize(accel_x, accel_y, accel_z, time.time())
+    
+    def reset_fifo(self):
+        """Clear the FIFO and start buffering accelerometer samples"""
+        self.bus.write_byte_data(self.address, USER_CTRL, 0)
+        self.bus.write_byte_data(self.address, USER_CTRL, USER_CTRL_FIFO_RESET)
+        self.bus.write_byte_data(self.address, FIFO_EN, ACCEL_FIFO_EN)
+        self.bus.write_byte_data(self.address, USER_CTRL, USER_CTRL_FIFO_EN)
+        self.next_sample_time = None
+    
+    def read_fifo(self) -> List[Dict[str, float]]:
+        """Drain every complete sample buffered in the FIFO
+        
+        Samples are timestamped from the sensor's own sample clock, which is
+        resynchronized to the system clock when it drifts by more than a few samples.
+        """
+        now = time.time()
+        if self.transfer(self.bus.read_byte_data, INT_STATUS) & INT_FIFO_OFLOW:
+            # Samples were lost, the FIFO contents are no longer aligned
+            self.fifo_overflows += 1
+            print(f"[WARN] Accelerometer FIFO overflowed ({self.fifo_overflows} total), resetting")
+            self.reset_fifo()
+            return []
+        
+        high, low = self.transfer(self.bus.read_i2c_block_data, FIFO_COUNTH, 2)
+        count = ((high << 8) | low) // RAW_SAMPLE.size
+        if count == 0:
+            return []
+        
+        # FIFO_R_W does not auto-increment, so a block read keeps popping entries.
+        # A failed read may have popped some, so it cannot be retried in place.
+        raw = bytearray()
+        remaining = count * RAW_SAMPLE.size
         try:
-            # Read raw accelerometer data
-            accel_x = self.read_raw_data(ACCEL_XOUT_H)
-            accel_y = self.read_raw_data(ACCEL_YOUT_H)
-            accel_z = self.read_raw_data(ACCEL_ZOUT_H)
-            
-            # Convert to g-force (assuming ±2g range)
-            # MPU6050 sensitivity: 16384 LSB/g for ±2g range
-            x_g = accel_x / 16384.0
-            y_g = accel_y / 16384.0
-            z_g = accel_z / 16384.0
-            
-            # Normalize to -1.0 to 1.0 range
-            # Apply calibration offsets and scaling
-            x_norm = max(-1.0, min(1.0, x_g * 2.0))  # Scale to ±1.0
-            y_norm = max(-1.0, min(1.0, y_g * 2.0))
-            z_norm = max(-1.0, min(1.0, z_g * 2.0))
-            
-            return {
-                'x': x_norm,
-                'y': y_norm,
-                'z': z_norm,
-                'timestamp': time.time()
-            }
-            
-        except Exception as e:
-            print(f"[ERROR] Failed to read accelerometer: {e}")
-            return {'x': 0.0, 'y': 0.0, 'z': 0.0, 'timestamp': time.time()}
+            while remaining > 0:
+                length = min(I2C_BLOCK_MAX, remaining)
+                raw += bytes(self.bus.read_i2c_block_data(self.address, FIFO_R_W, length))
+                remaining -= length
+        except OSError as e:
+            self.i2c_errors += 1
+            try:
+                self.reset_fifo()
+            except OSError:
+                pass
+            raise SensorError(f"FIFO read failed, {count} samples lost: {e}") from e
+        
+        # The oldest buffered sample was taken (count - 1) periods before the newest
+        oldest = now - (count - 1) * self.sample_period
+        if self.next_sample_time is None or abs(self.next_sample_time - oldest) > 3 * self.sample_period:
+            self.next_sample_time = oldest
+        
+        samples = []
+        for accel_x, accel_y, accel_z in RAW_SAMPLE.iter_unpack(raw):
+            samples.append(normalize(accel_x, accel_y, accel_z, self.next_sample_time))
+            self.next_sample_time += self.sample_period
+        return samples
+    
+    def read_samples(self) -> List[Dict[str, float]]:
+        """Read every sample available since the last call; raises SensorError"""
+        if self.read_mode == "fifo":
+            return self.read_fifo()
+        return [self.read_accelerometer()]
     
-    def calibrate(self, samples: int = 100):
-        """Calibrate the accelerometer by taking multiple samples"""
+    def load_calibration(self, path: str) -> bool:
+        """Load offsets saved by a previous calibration; False if there are none"""
+        try:
+            with open(path) as f:
+                offsets = json.load(f)
+            self.x_offset = float(offsets['x'])
+            self.y_offset = float(offsets['y'])
+            self.z_offset = float(offsets['z'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        print(f"[INFO] Loaded calibration from {path}. Offsets: X={self.x_offset:.3f}, Y={self.y_offset:.3f}, Z={self.z_offset:.3f}")
+        return True
+    
+    def save_calibration(self, path: str):
+        """Save the offsets so the next start can skip calibration"""
+        temporary = f"{path}.tmp"
+        try:
+            with open(temporary, 'w') as f:
+                json.dump({'x': self.x_offset, 'y': self.y_offset, 'z': self.z_offset}, f)
+            os.replace(temporary, path)
+        except OSError as e:
+            print(f"[WARN] Could not save calibration to {path}: {e}")
+    
+    def calibrate(self, samples: int = 100, path: str = None, force: bool = False):
+        """Calibrate the accelerometer by taking multiple samples
+        
+        With `path`, offsets saved by an earlier calibration are reused instead
+        of making the player stand still again, unless `force` is set. The
+        server keeps tracking each player's bias while they play, so the saved
+        offsets only need to be roughly right.
+        """
+        if path and not force and self.load_calibration(path):
+            return
+        
         print(f"[INFO] Calibrating accelerometer with {samples} samples...")
         
         x_sum = y_sum = z_sum = 0
@@ -123,63 +316,543 @@ class BerryPiAccelerometer:
         self.z_offset = z_sum / samples
         
         print(f"[INFO] Calibration complete. Offsets: X={self.x_offset:.3f}, Y={self.y_offset:.3f}, Z={self.z_offset:.3f}")
+        if path:
+            self.save_calibration(path)
+        
+        # Drop whatever piled up in the FIFO while calibrating
+        if self.read_mode == "fifo":
+            self.reset_fifo()
+
+def to_int16(value: float) -> int:
+    """Scale a normalized reading to the int16 wire representation"""
+    return max(-32768, min(32767, int(round(value * PACKET_INT16_SCALE))))
+
+class SampleBatcher:
+    """Packs samples into binary datagrams, several samples per packet"""
+    
+    def __init__(self, device_id: int, batch_size: int, interval: float):
+        if not 0 < batch_size <= PACKET_MAX_SAMPLES:
+            raise ValueError(f"BATCH_SIZE must be between 1 and {PACKET_MAX_SAMPLES}")
+        self.device_id = device_id
+        self.batch_size = batch_size
+        self.interval = interval
+        self.sequence = 0  # Shared with event packets so the server sees one stream
+        self.count = 0
+        self.first_timestamp = 0.0
+        # Preallocated packet, header is filled in when the batch is complete
+        self.buffer = bytearray(PACKET_HEADER.size + batch_size * PACKET_SAMPLE.size)
+        
+    def add(self, data: Dict[str, Any]):
+        """Add a sample; returns the finished packet when the batch is full"""
+        if self.count == 0:
+            self.first_timestamp = data['timestamp']
+        offset = PACKET_HEADER.size + self.count * PACKET_SAMPLE.size
+        PACKET_SAMPLE.pack_into(self.buffer, offset,
+                                to_int16(data['x']), to_int16(data['y']), to_int16(data['z']))
+        self.count += 1
+        if self.count < self.batch_size:
+            return None
+        return self.flush()
+    
+    def flush(self):
+        """Finish the current batch, even if it is not full"""
+        if self.count == 0:
+            return None
+        PACKET_HEADER.pack_into(self.buffer, 0, PACKET_MAGIC, PACKET_VERSION, PACKET_DTYPE_INT16,
+                                self.next_sequence(), self.device_id, self.count,
+                                self.first_timestamp, self.interval)
+        packet = bytes(self.buffer[:PACKET_HEADER.size + self.count * PACKET_SAMPLE.size])
+        self.count = 0
+        return packet
+    
+    def next_sequence(self) -> int:
+        sequence = self.sequence
+        self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+        return sequence
+    
+    def events(self, events: List[Tuple[str, float]], timestamp: float) -> bytes:
+        """Pack (action, confidence) events into one datagram; no events makes a heartbeat"""
+        header = PACKET_HEADER.pack(PACKET_MAGIC, PACKET_VERSION, PACKET_DTYPE_EVENT, self.next_sequence(),
+                                    self.device_id, len(events), timestamp, 0.0)
+        body = b''.join(PACKET_EVENT.pack(PACKET_ACTION_CODES[action], int(round(confidence * 255)))
+                        for action, confidence in events)
+        return header + body
+
+class Preprocessor:
+    """Smooths calibrated samples and decides which ones are worth sending
+    
+    A sample is significant when any axis moved more than `deadband` since the
+    last sent one; otherwise only a heartbeat goes out every `heartbeat_interval`.
+    """
+    
+    def __init__(self, alpha: float, deadband: float, heartbeat_interval: float):
+        self.alpha = alpha
+        self.deadband = deadband
+        self.heartbeat_interval = heartbeat_interval
+        self.filtered = None
+        self.last_sent = None
+        self.last_sent_time = 0.0
+        self.suppressed = 0  # Samples not sent because nothing changed
+    
+    def filter(self, data: Dict[str, float]):
+        """Exponential smoothing of x, y and z, in place"""
+        if self.filtered is None:
+            self.filtered = [data['x'], data['y'], data['z']]
+        else:
+            for i, axis in enumerate(('x', 'y', 'z')):
+                self.filtered[i] += self.alpha * (data[axis] - self.filtered[i])
+        data['x'], data['y'], data['z'] = self.filtered
+    
+    def heartbeat_due(self, timestamp: float) -> bool:
+        return timestamp - self.last_sent_time >= self.heartbeat_interval
+    
+    def significant(self, data: Dict[str, float]) -> bool:
+        """True if the sample changed enough (or a heartbeat is due); marks it sent"""
+        changed = self.last_sent is None or any(
+            abs(data[axis] - last) > self.deadband for axis, last in zip(('x', 'y', 'z'), self.last_sent))
+        if not changed and not self.heartbeat_due(data['timestamp']):
+            self.suppressed += 1
+            return False
+        self.mark_sent(data)
+        return True
+    
+    def mark_sent(self, data: Dict[str, float]):
+        self.last_sent = (data['x'], data['y'], data['z'])
+        self.last_sent_time = data['timestamp']
+
+class ActionClassifier:
+    """Threshold classification on the Pi for "events" mode, same rules as the server"""
+    
+    def __init__(self, x_threshold: float, y_threshold: float, z_threshold: float, wait_time: float):
+        self.x_threshold = x_threshold
+        self.y_threshold = y_threshold
+        self.z_threshold = z_threshold
+        self.wait_time = wait_time
+        self.last_event = 0.0
+    
+    def classify(self, data: Dict[str, float]) -> Optional[Tuple[str, float]]:
+        """(action, confidence) for a sample, or None while idle or debounced"""
+        x, y, z = data['x'], data['y'], data['z']
+        if x > self.x_threshold:
+            action, value, threshold = "right", x, self.x_threshold
+        elif x < -self.x_threshold:
+            action, value, threshold = "left", x, self.x_threshold
+        elif y > self.y_threshold:
+            action, value, threshold = "up", y, self.y_threshold
+        elif z < -self.z_threshold:
+            action, value, threshold = "down", z, self.z_threshold
+        else:
+            return None
+        if data['timestamp'] - self.last_event <= self.wait_time:
+            return None
+        self.last_event = data['timestamp']
+        return action, min(1.0, abs(value) / (2.0 * threshold))
+
+class IdleDetector:
+    """Notices when the player stops moving, for the low-rate idle mode
+    
+    Motion is any axis more than `threshold` away from the reference sample,
+    which moves to every sample that counts as motion.
+    """
+    
+    def __init__(self, timeout: float, threshold: float):
+        self.timeout = timeout
+        self.threshold = threshold
+        self.reference = None
+        self.last_motion = 0.0
+        self.idle = False
+    
+    def update(self, data: Dict[str, float]) -> bool:
+        """Feed a calibrated sample; returns True while idle"""
+        moving = self.reference is None or any(
+            abs(data[axis] - reference) > self.threshold for axis, reference in zip(('x', 'y', 'z'), self.reference))
+        if moving:
+            self.reference = (data['x'], data['y'], data['z'])
+            self.last_motion = data['timestamp']
+        self.idle = not moving and data['timestamp'] - self.last_motion >= self.timeout
+        return self.idle
+
+class SamplingStats:
+    """Achieved rate, scheduling jitter and overruns of the acquisition loop"""
+    
+    def __init__(self, size: int = 1000):
+        self.jitter = deque(maxlen=size)  # Seconds each read started after its deadline
+        self.samples = 0
+        self.overruns = 0  # Deadlines missed by more than a whole period
+        self.skipped = 0   # Deadlines given up on under the "skip" policy
+        self.dropped = 0   # Samples dropped because the send queue was full
+        self.sent = 0      # Datagrams sent
+        self.send_errors = 0
+        self.read_errors = 0  # Reads that failed even after retrying
+        self._last_samples = 0
+        self._last_time = time.time()
+    
+    def percentile(self, p: float) -> float:
+        if not self.jitter:
+            return 0.0
+        ordered = sorted(self.jitter)
+        return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+    
+    def report(self) -> str:
+        """Summary since the previous report"""
+        now = time.time()
+        elapsed = now - self._last_time
+        rate = (self.samples - self._last_samples) / elapsed if elapsed > 0 else 0.0
+        self._last_samples = self.samples
+        self._last_time = now
+        return (f"{rate:.1f} Hz achieved, jitter p50={self.percentile(50) * 1000:.2f}ms "
+                f"p99={self.percentile(99) * 1000:.2f}ms, {self.overruns} overruns, "
+                f"{self.skipped} skipped, {self.dropped} dropped, {self.sent} packets sent, "
+                f"{self.read_errors} read errors, {self.send_errors} send errors")
+
+class DeadlineScheduler:
+    """Paces a loop on absolute deadlines so the rate does not drift
+    
+    Deadlines are start + n * period regardless of how long each iteration
+    took. When an iteration overruns, `policy` decides whether the missed
+    deadlines are caught up back-to-back ("catchup") or skipped ("skip").
+    """
+    
+    def __init__(self, period: float, policy: str, stats: SamplingStats, max_catchup: int = MAX_CATCHUP):
+        if policy not in ("skip", "catchup"):
+            raise ValueError(f"Unknown SCHEDULE_POLICY: {policy}")
+        self.period = period
+        self.policy = policy
+        self.stats = stats
+        self.max_catchup = max_catchup
+        self.start = time.perf_counter()
+        self.tick = 0
+    
+    def wait(self):
+        """Sleep until the next deadline and record how late we woke up"""
+        deadline = self.start + self.tick * self.period
+        now = time.perf_counter()
+        if deadline > now:
+            time.sleep(deadline - now)
+            now = time.perf_counter()
+        
+        lateness = now - deadline
+        self.stats.jitter.append(lateness)
+        self.tick += 1
+        
+        if lateness > self.period:
+            self.stats.overruns += 1
+            missed = int(lateness / self.period)
+            if self.policy == "catchup":
+                missed = max(0, missed - self.max_catchup)
+            self.tick += missed
+            self.stats.skipped += missed
 
 class AccelerometerClient:
-    """Client that sends accelerometer data to the main server"""
+    """Client that sends accelerometer data to the main server
     
-    def __init__(self, server_ip: str, server_port: int):
+    A producer thread reads the sensor on a deadline schedule and queues the
+    samples; the main thread sends them, so network latency never delays
+    acquisition. The main thread also listens for the server's control
+    datagrams, which set the sample rate and, with discovery, keep telling
+    the client where the server is.
+    """
+    
+    def __init__(self, server_ip: Optional[str], server_port: int):
         self.server_ip = server_ip
         self.server_port = server_port
+        self.discovery = server_ip is None
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self.socket.setblocking(False)
         self.running = False
+        self.samples = queue.Queue(maxsize=SEND_QUEUE_SIZE)
+        self.stats = SamplingStats()
+        self.sequence = 0  # JSON packets; binary packets are numbered by the batcher
+        self.batcher = None
+        if WIRE_FORMAT == "binary":
+            self.batcher = SampleBatcher(DEVICE_ID, BATCH_SIZE, 1.0 / SAMPLE_RATE)
+        
+        # Active sample rate, SAMPLE_RATE unless the server says otherwise
+        self.sample_rate = SAMPLE_RATE
+        self.idle = IdleDetector(IDLE_TIMEOUT, IDLE_MOTION_THRESHOLD) if IDLE_TIMEOUT else None
+        self.last_control = time.time()
+        self.next_discovery = 0.0
+        self.discovery_delay = DISCOVERY_RETRY
+        self.send_failures = 0  # Consecutive failed sends, reported once per streak
+        
+        if TRANSMIT_MODE not in ("raw", "changes", "events"):
+            raise ValueError(f"Unknown TRANSMIT_MODE: {TRANSMIT_MODE}")
+        if TRANSMIT_MODE == "events" and self.batcher is None:
+            raise ValueError('TRANSMIT_MODE "events" needs WIRE_FORMAT "binary"')
+        self.preprocessor = None
+        self.classifier = None
+        if TRANSMIT_MODE != "raw":
+            self.preprocessor = Preprocessor(PREPROCESS_ALPHA, DEADBAND, HEARTBEAT_INTERVAL)
+        if TRANSMIT_MODE == "events":
+            self.classifier = ActionClassifier(X_THRESHOLD, Y_THRESHOLD, Z_THRESHOLD, ACTION_WAIT_TIME)
         
         # Initialize BerryPi accelerometer
-        self.accelerometer = BerryPiAccelerometer(BUS_NUMBER)
+        self.accelerometer = BerryPiAccelerometer(BUS_NUMBER, read_mode=READ_MODE, sample_rate=SAMPLE_RATE)
+    
+    def send(self, message: Optional[bytes]):
+        """Send a datagram to the server, reporting the first failure of a streak"""
+        if message is None or self.server_ip is None:
+            return
+        try:
+            self.socket.sendto(message, (self.server_ip, self.server_port))
+        except OSError as e:
+            self.stats.send_errors += 1
+            if self.send_failures == 0:
+                print(f"\n[ERROR] Failed to send data: {e}")
+            self.send_failures += 1
+            return
+        self.stats.sent += 1
+        if self.send_failures:
+            print(f"\n[INFO] Sending again after {self.send_failures} failed packets")
+            self.send_failures = 0
+        
+    def send_data(self, data: Dict[str, Any], flush: bool = False):
+        """Send accelerometer data to server (buffered until the batch is full in binary mode)
         
-    def send_data(self, data: Dict[str, Any]):
-        """Send accelerometer data to server"""
+        `flush` sends the sample right away; samples sent on change are not evenly
+        spaced, so they cannot share a batch.
+        """
+        interval = data.pop('interval')
+        if self.batcher is None:
+            data['sequence'] = self.sequence
+            self.sequence = (self.sequence + 1) & 0xFFFFFFFF
+            message = json.dumps(data).encode('utf-8')
+        else:
+            if interval != self.batcher.interval:
+                # The samples of one packet share a spacing, finish the batch at the old rate
+                self.send(self.batcher.flush())
+                self.batcher.interval = interval
+            message = self.batcher.add(data)
+            if flush and message is None:
+                message = self.batcher.flush()
+        self.send(message)
+    
+    def send_event(self, data: Dict[str, Any]):
+        """Classify a sample on the Pi and send the action, or a heartbeat while idle"""
+        event = self.classifier.classify(data)
+        if event is None and not self.preprocessor.heartbeat_due(data['timestamp']):
+            return
+        self.preprocessor.mark_sent(data)
+        self.send(self.batcher.events([event] if event else [], data['timestamp']))
+    
+    def transmit(self, data: Dict[str, Any]):
+        """Send a sample according to TRANSMIT_MODE"""
+        if self.preprocessor is None:
+            self.send_data(data)
+            return
+        self.preprocessor.filter(data)
+        if self.classifier is not None:
+            data.pop('interval')
+            self.send_event(data)
+        elif self.preprocessor.significant(data):
+            self.send_data(data, flush=True)
+    
+    def broadcast_discover(self):
+        """Ask every server on the local network to answer"""
+        message = PACKET_DISCOVER.pack(PACKET_MAGIC, PACKET_VERSION, PACKET_DTYPE_DISCOVER, DEVICE_ID)
         try:
-            message = json.dumps(data)
-            self.socket.sendto(message.encode('utf-8'), (self.server_ip, self.server_port))
-        except Exception as e:
-            print(f"[ERROR] Failed to send data: {e}")
+            self.socket.sendto(message, ('<broadcast>', DISCOVERY_PORT))
+        except OSError as e:
+            print(f"\n[WARN] Discovery broadcast failed: {e}")
     
-    def run(self):
-        """Main loop to read and send accelerometer data"""
-        self.running = True
+    def handle_control(self, data: bytes, sender: str, now: float):
+        """Apply a control datagram: where the server is and which sample rate to use"""
+        if len(data) != PACKET_CONTROL.size:
+            return
+        magic, version, dtype, address, port, rate = PACKET_CONTROL.unpack(data)
+        if magic != PACKET_MAGIC or version != PACKET_VERSION or dtype != PACKET_DTYPE_CONTROL:
+            return
+        address = socket.inet_ntoa(address)
+        if address == "0.0.0.0":
+            address = sender
         
-        # Calibrate the sensor first
-        self.accelerometer.calibrate()
+        searching = self.discovery and (self.server_ip is None or now - self.last_control > SERVER_TIMEOUT)
+        if not searching and self.server_ip not in (sender, address):
+            return  # Only the server we send to may give instructions
+        if self.discovery and (address, port) != (self.server_ip, self.server_port):
+            self.server_ip, self.server_port = address, port
+            print(f"\n[INFO] Server found at {address}:{port}")
+        self.last_control = now
+        self.discovery_delay = DISCOVERY_RETRY
         
-        print(f"[INFO] Starting accelerometer client...")
-        print(f"[INFO] Sending data to {self.server_ip}:{self.server_port}")
-        print(f"[INFO] Sample rate: {SAMPLE_RATE} Hz")
-        print("[INFO] Press Ctrl+C to stop")
+        rate = max(1.0, min(1000.0, rate)) if rate > 0 else SAMPLE_RATE
+        if rate != self.sample_rate:
+            print(f"\n[INFO] Server set the sample rate to {rate:g} Hz")
+            self.sample_rate = rate
+    
+    def poll_server(self, now: float):
+        """Handle pending control datagrams and look for the server when it went quiet"""
+        while True:
+            try:
+                data, (sender, _) = self.socket.recvfrom(64)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                break  # e.g. an ICMP error for an earlier send
+            self.handle_control(data, sender, now)
         
+        if not self.discovery:
+            return
+        if self.server_ip is not None and now - self.last_control <= SERVER_TIMEOUT:
+            return
+        if now >= self.next_discovery:
+            if self.server_ip is not None and self.discovery_delay == DISCOVERY_RETRY:
+                print(f"\n[WARN] No word from the server for {SERVER_TIMEOUT:.0f}s, looking for it again")
+            self.broadcast_discover()
+            self.next_discovery = now + self.discovery_delay
+            self.discovery_delay = min(self.discovery_delay * 2, DISCOVERY_MAX_RETRY)
+    
+    def find_server(self):
+        """Broadcast until a server answers, with growing pauses between tries"""
+        print(f"[INFO] Looking for the server on the local network (UDP port {DISCOVERY_PORT})...")
+        while self.running and self.server_ip is None:
+            self.poll_server(time.time())
+            select.select([self.socket], [], [], max(0.0, self.next_discovery - time.time()))
+    
+    def enqueue(self, data: Dict[str, Any]):
+        """Queue a sample for sending, dropping the oldest one if the sender is behind"""
+        while True:
+            try:
+                self.samples.put_nowait(data)
+                return
+            except queue.Full:
+                try:
+                    self.samples.get_nowait()
+                    self.stats.dropped += 1
+                except queue.Empty:
+                    pass
+    
+    def recover(self, error: Exception, failures: int):
+        """Report a failed read, back off and reinitialize the sensor"""
+        # Reports thin out as the failures go on: 1st, 2nd, 4th, 8th...
+        if failures & (failures - 1) == 0:
+            print(f"\n[ERROR] Accelerometer read failed ({failures} in a row): {error}")
+        time.sleep(min(I2C_MAX_BACKOFF, I2C_RETRY_DELAY * 2 ** (I2C_RETRIES + failures)))
         try:
-            while self.running:
-                # Read accelerometer data
-                data = self.accelerometer.read_accelerometer()
+            self.accelerometer.initialize_sensor()
+        except Exception:
+            pass  # Reported by initialize_sensor, tried again after the next failure
+    
+    def calibrate(self):
+        """Calibrate the sensor (or reuse the saved offsets), riding out I2C errors like acquire()"""
+        failures = 0
+        while self.running:
+            try:
+                self.accelerometer.calibrate(path=CALIBRATION_FILE, force=RECALIBRATE)
+                break
+            except (SensorError, OSError) as e:
+                failures += 1
+                self.recover(e, failures)
+        if failures:
+            print(f"[INFO] Accelerometer recovered after {failures} failed calibration attempts")
+    
+    def acquire(self):
+        """Producer thread: read the sensor on absolute deadlines, at the active or the idle rate"""
+        rate = None
+        scheduler = None
+        failures = 0
+        
+        while self.running:
+            try:
+                wanted = IDLE_SAMPLE_RATE if self.idle is not None and self.idle.idle else self.sample_rate
+                if wanted != rate:
+                    self.accelerometer.set_sample_rate(wanted)
+                    rate = wanted
+                    # In FIFO mode the sensor keeps the sample clock, we only drain it periodically
+                    period = max(FIFO_DRAIN_INTERVAL, 1.0 / rate) if READ_MODE == "fifo" else 1.0 / rate
+                    scheduler = DeadlineScheduler(period, SCHEDULE_POLICY, self.stats)
                 
+                scheduler.wait()
+                # Read accelerometer data (several samples at once in FIFO mode)
+                samples = self.accelerometer.read_samples()
+            except (SensorError, OSError) as e:
+                failures += 1
+                self.stats.read_errors += 1
+                self.recover(e, failures)
+                rate = None  # Reapply the rate and restart the schedule
+                continue
+            if failures:
+                print(f"\n[INFO] Accelerometer recovered after {failures} failed reads")
+                failures = 0
+            
+            for data in samples:
                 # Apply calibration offsets
                 data['x'] -= self.accelerometer.x_offset
                 data['y'] -= self.accelerometer.y_offset
                 data['z'] -= self.accelerometer.z_offset
+                data['interval'] = self.accelerometer.sample_period
+                self.stats.samples += 1
+                if self.idle is not None:
+                    was_idle = self.idle.idle
+                    if self.idle.update(data) != was_idle:
+                        if was_idle:
+                            print(f"\n[INFO] Motion, back to {self.sample_rate:g} Hz")
+                        else:
+                            print(f"\n[INFO] No motion for {IDLE_TIMEOUT:g}s, idling at {IDLE_SAMPLE_RATE:g} Hz")
+                self.enqueue(data)
+        
+        # Wake up the sender so it notices we stopped
+        self.enqueue(None)
+    
+    def run(self):
+        """Main loop: start acquisition and send samples as they are queued"""
+        self.running = True
+        producer = None
+        
+        last_print = last_report = time.time()
+        try:
+            # Calibrate the sensor first (or reuse the saved offsets)
+            self.calibrate()
+            if self.server_ip is None:
+                self.find_server()
+            
+            print(f"[INFO] Starting accelerometer client...")
+            print(f"[INFO] Sending data to {self.server_ip}:{self.server_port}")
+            print(f"[INFO] Sample rate: {self.sample_rate:g} Hz ({SCHEDULE_POLICY} policy for missed samples)")
+            if self.idle is not None:
+                print(f"[INFO] Idle mode: {IDLE_SAMPLE_RATE:g} Hz after {IDLE_TIMEOUT:g}s without motion")
+            print(f"[INFO] Transmit mode: {TRANSMIT_MODE}")
+            print("[INFO] Press Ctrl+C to stop")
+            
+            self.stats = SamplingStats()
+            producer = threading.Thread(target=self.acquire, daemon=True)
+            producer.start()
+            
+            while self.running:
+                # The timeout keeps the server polled while the sensor is idle or failing
+                try:
+                    data = self.samples.get(timeout=0.1)
+                except queue.Empty:
+                    data = {}
+                if data is None:
+                    break
+                now = time.time()
+                self.poll_server(now)
+                if not data:
+                    continue
                 
                 # Send data to server
-                self.send_data(data)
-                
-                # Print current values (for debugging)
-                print(f"X: {data['x']:6.3f}, Y: {data['y']:6.3f}, Z: {data['z']:6.3f}", end='\r')
+                self.transmit(data)
                 
-                # Wait for next sample
-                time.sleep(1.0 / SAMPLE_RATE)
+                # Console output is rate limited, terminal I/O slows down small Pis
+                if PRINT_INTERVAL and now - last_print >= PRINT_INTERVAL:
+                    print(f"X: {data['x']:6.3f}, Y: {data['y']:6.3f}, Z: {data['z']:6.3f}", end='\r')
+                    last_print = now
+                if STATS_INTERVAL and now - last_report >= STATS_INTERVAL:
+                    print(f"\n[INFO] Sampling: {self.stats.report()}")
+                    if self.accelerometer.i2c_errors:
+                        print(f"[INFO] I2C errors so far: {self.accelerometer.i2c_errors}")
+                    last_report = now
                 
         except KeyboardInterrupt:
             print("\n[INFO] Stopping accelerometer client...")
         except Exception as e:
             print(f"\n[ERROR] Unexpected error: {e}")
         finally:
+            self.running = False
+            if producer is not None:
+                producer.join(timeout=1.0)
             self.cleanup()
     
     def cleanup(self):
@@ -192,8 +865,9 @@ class AccelerometerClient:
 def main():
     """Main function"""
     print("=== BerryPi Accelerometer Client for Temple Run ===")
-    print(f"Target server: {SERVER_IP}:{SERVER_PORT}")
+    print(f"Target server: {f'{SERVER_IP}:{SERVER_PORT}' if SERVER_IP else 'found on the local network'}")
     print(f"Sample rate: {SAMPLE_RATE} Hz")
+    print(f"Wire format: {WIRE_FORMAT} (device {DEVICE_ID}, {BATCH_SIZE} sample(s) per packet)")
     print()
     
     # Create and run client
@@ -0,0 +1,351 @@
+# UDP receivers for accelerometer packets
+# Two interchangeable implementations selected by RECEIVER_MODE in config.py:
+#   "thread"  - blocking socket loop in a dedicated thread
+#   "asyncio" - asyncio DatagramProtocol; with RECEIVER_BULK_DRAIN every
+#               wakeup drains all pending datagrams with non-blocking reads
+
+import asyncio
+import logging
+import socket
+import struct
+import sys
+import time
+
+import numpy as np
+
+import protocol
+from capture import capture_id
+from link import SequenceResult
+from metrics import REGISTRY
+
+log = logging.getLogger(__name__)
+
+PARSE_SECONDS = REGISTRY.histogram("temple_run_parse_seconds", "Time to decode one datagram")
+
+# Linux reports the number of datagrams the kernel dropped because the socket
+# buffer was full as ancillary data when SO_RXQ_OVFL is enabled
+SO_RXQ_OVFL = getattr(socket, 'SO_RXQ_OVFL', 40) if sys.platform.startswith('linux') else None
+OVERFLOW_ANCILLARY_SIZE = socket.CMSG_SPACE(4) if hasattr(socket, 'CMSG_SPACE') else 0
+
+
+class ReceiverStats:
+    """Counters for the receive path"""
+
+    def __init__(self):
+        self.packets = 0
+        self.samples = 0
+        self.events = 0         # Action events from devices that classify on their own
+        self.bytes = 0
+        self.invalid = 0        # Datagrams that failed to decode
+        self.duplicates = 0     # Datagrams with a sequence number already received
+        self.stale = 0          # Datagrams discarded as out of order or too old
+        self.rejected = 0       # Datagrams from devices the registry had no room for
+        self.overruns = 0       # Datagrams dropped by the kernel (socket buffer full)
+        self.wakeups = 0        # Times the receiver woke up to read
+        self.packets_per_sec = 0.0
+        self._last_packets = 0
+        self._last_time = time.time()
+
+    @property
+    def drops(self) -> int:
+        return self.invalid + self.rejected + self.overruns
+
+    def update_rate(self, now: float) -> float:
+        """Recompute packets/sec since the previous call"""
+        elapsed = now - self._last_time
+        if elapsed > 0:
+            self.packets_per_sec = (self.packets - self._last_packets) / elapsed
+        self._last_packets = self.packets
+        self._last_time = now
+        return self.packets_per_sec
+
+    def summary(self) -> str:
+        per_wakeup = self.packets / self.wakeups if self.wakeups else 0.0
+        return (f"{self.packets_per_sec:.0f} packets/s, {self.packets} packets, "
+                f"{per_wakeup:.1f} per wakeup, {self.events} events, {self.invalid} invalid, "
+                f"{self.duplicates} duplicates, {self.stale} stale, "
+                f"{self.rejected} rejected, {self.overruns} overruns")
+
+
+class PacketHandler:
+    """Decodes datagrams and hands the samples to the device registry and engine
+
+    Not thread safe: each receiver owns one handler and its decode buffers.
+    Packets that arrive after a newer one from the same device, duplicates and
+    packets delayed more than `max_age` seconds beyond the device's usual
+    latency are dropped, so a late sample can never trigger a key press.
+    With `settings`, max_age follows its current MAX_SAMPLE_AGE instead.
+    """
+
+    def __init__(self, registry, engine, stats: ReceiverStats, capture=None, max_age: float = 0.0,
+                 settings=None):
+        self.registry = registry
+        self.engine = engine
+        self.stats = stats
+        self.capture = capture
+        self.max_age = max_age
+        self.settings = settings
+        # Samples are decoded straight into these buffers; no per-sample objects
+        self.samples = protocol.allocate_buffer()
+        self.timestamps = np.zeros(protocol.MAX_SAMPLES, dtype=np.float64)
+        self.steps_back = np.arange(protocol.MAX_SAMPLES - 1, -1, -1, dtype=np.float64)
+
+    def handle(self, data: bytes, addr, received_at: float):
+        """Process one datagram (received_at from time.perf_counter())"""
+        stats = self.stats
+        stats.packets += 1
+        stats.bytes += len(data)
+
+        try:
+            # Parse binary or legacy JSON data from accelerometer
+            header = protocol.decode_into(data, self.samples)
+        except (ValueError, TypeError, RecursionError):
+            # A malformed datagram is dropped, it never stops the receive loop
+            stats.invalid += 1
+            log.debug("Invalid datagram from %s", addr[0])
+            return
+        finally:
+            PARSE_SECONDS.observe(time.perf_counter() - received_at)
+
+        now = time.time()
+        device = self.registry.lookup(header.device_id, addr, now)
+        if device is None:
+            stats.rejected += 1
+            return
+
+        link = device.link
+        if header.sequence is not None:
+            result = link.track(header.sequence, header.timestamp, addr[1])
+            if result == SequenceResult.DUPLICATE:
+                stats.duplicates += 1
+                return
+            if result == SequenceResult.REORDERED:
+                link.stale += 1
+                stats.stale += 1
+                return
+
+        count = header.count
+        if header.timestamp is not None:
+            # Client time of the newest sample against our receive time
+            newest = header.timestamp + max(0, count - 1) * header.interval
+            max_age = self.settings.current.MAX_SAMPLE_AGE if self.settings is not None else self.max_age
+            if link.observe(newest, now) > max_age > 0:
+                link.stale += 1
+                stats.stale += 1
+                return
+
+        if header.format == 'event':
+            # The device classified on its own, only the actions are sent
+            device.seen(now)
+            stats.events += header.count
+            if header.count == 0:
+                self.engine.notify_heartbeat(device, received_at)
+            for code, confidence in self.samples[:header.count, :2].tolist():
+                action = protocol.ACTIONS.get(int(code))
+                if action is not None:
+                    self.engine.notify_event(device, action, confidence, received_at)
+            return
+
+        timestamps = self.timestamps[:count]
+        if header.timestamp is not None:
+            # Sampling times from the client clock, mapped onto ours
+            np.multiply(self.steps_back[-count:], -header.interval, out=timestamps)
+            timestamps += link.to_server_time(newest)
+        else:
+            # The newest sample of the batch was taken just now, older ones one interval apart
+            np.multiply(self.steps_back[-count:], -header.interval, out=timestamps)
+            timestamps += now
+        device.add_samples(self.samples[:count], timestamps, now)
+        stats.samples += count
+        if self.capture is not None:
+            self.capture.append(capture_id(device), header.sequence or 0, self.samples[:count], timestamps)
+        self.engine.notify(device, received_at)
+
+
+def open_socket(port: int, rcvbuf: int = 0) -> socket.socket:
+    """Bind the UDP socket, optionally enlarging its receive buffer"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if rcvbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        actual = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        log.info("UDP receive buffer: requested %d bytes, got %d", rcvbuf, actual)
+    if SO_RXQ_OVFL is not None:
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+        except OSError:
+            pass
+    sock.bind(('0.0.0.0', port))
+    return sock
+
+
+def read_overruns(ancdata) -> int:
+    """Extract the kernel drop counter from recvmsg ancillary data, or -1"""
+    for level, kind, value in ancdata:
+        if level == socket.SOL_SOCKET and kind == SO_RXQ_OVFL and len(value) >= 4:
+            return struct.unpack('I', value[:4])[0]
+    return -1
+
+
+class ThreadedReceiver:
+    """Blocking receive loop, one datagram per system call"""
+
+    def __init__(self, registry, engine, port: int, rcvbuf: int = 0, stats_interval: float = 10.0,
+                 capture=None, max_age: float = 0.0, settings=None):
+        self.port = port
+        self.rcvbuf = rcvbuf
+        self.stats_interval = stats_interval
+        self.stats = ReceiverStats()
+        self.handler = PacketHandler(registry, engine, self.stats, capture, max_age, settings)
+        self.running = False
+
+    def run(self):
+        sock = open_socket(self.port, self.rcvbuf)
+        sock.settimeout(1.0)
+        use_recvmsg = SO_RXQ_OVFL is not None and hasattr(sock, 'recvmsg')
+        log.info("Accelerometer server listening on port %d (threaded receiver)", self.port)
+
+        self.running = True
+        last_report = time.time()
+        try:
+            while self.running:
+                try:
+                    if use_recvmsg:
+                        data, ancdata, _, addr = sock.recvmsg(protocol.MAX_DATAGRAM, OVERFLOW_ANCILLARY_SIZE)
+                        overruns = read_overruns(ancdata)
+                        if overruns >= 0:
+                            self.stats.overruns = overruns
+                    else:
+                        data, addr = sock.recvfrom(protocol.MAX_DATAGRAM)
+                    self.stats.wakeups += 1
+                    self.handler.handle(data, addr, time.perf_counter())
+                except socket.timeout:
+                    pass
+                except Exception as e:
+                    log.error("Error receiving data: %s", e)
+
+                now = time.time()
+                if now - last_report >= self.stats_interval:
+                    self.stats.update_rate(now)
+                    log.info("Receiver: %s", self.stats.summary())
+                    last_report = now
+        finally:
+            sock.close()
+            if self.handler.capture is not None:
+                self.handler.capture.close()
+
+    def stop(self):
+        self.running = False
+
+
+class SampleProtocol(asyncio.DatagramProtocol):
+    """asyncio protocol feeding datagrams to a PacketHandler"""
+
+    def __init__(self, handler: PacketHandler):
+        self.handler = handler
+
+    def datagram_received(self, data, addr):
+        self.handler.stats.wakeups += 1
+        self.handler.handle(data, addr, time.perf_counter())
+
+    def error_received(self, exc):
+        log.error("Error receiving data: %s", exc)
+
+
+class AsyncioReceiver:
+    """asyncio receiver, optionally draining the socket in bulk on each wakeup
+
+    asyncio's own datagram transport reads a single datagram per readiness
+    event. With bulk draining the socket is registered with add_reader()
+    directly and every wakeup reads up to `drain_batch` datagrams with
+    non-blocking recvmsg() calls until the socket is empty.
+    """
+
+    def __init__(self, registry, engine, port: int, rcvbuf: int = 0, stats_interval: float = 10.0,
+                 bulk_drain: bool = True, drain_batch: int = 256, capture=None, max_age: float = 0.0,
+                 settings=None):
+        self.port = port
+        self.rcvbuf = rcvbuf
+        self.stats_interval = stats_interval
+        self.bulk_drain = bulk_drain
+        self.drain_batch = drain_batch
+        self.stats = ReceiverStats()
+        self.handler = PacketHandler(registry, engine, self.stats, capture, max_age, settings)
+        self.loop = None
+        self._stopped = None
+        self._report_handle = None
+
+    def run(self):
+        """Run the event loop in the calling thread until stop()"""
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        sock = open_socket(self.port, self.rcvbuf)
+        sock.setblocking(False)
+
+        transport = None
+        if self.bulk_drain:
+            self.loop.add_reader(sock.fileno(), self._drain, sock)
+        else:
+            transport, _ = await self.loop.create_datagram_endpoint(
+                lambda: SampleProtocol(self.handler), sock=sock)
+        mode = "bulk drain" if self.bulk_drain else "datagram endpoint"
+        log.info("Accelerometer server listening on port %d (asyncio receiver, %s)", self.port, mode)
+
+        self._report_handle = self.loop.call_later(self.stats_interval, self._report)
+        try:
+            await self._stopped.wait()
+        finally:
+            self._report_handle.cancel()
+            if transport is not None:
+                transport.close()
+            else:
+                self.loop.remove_reader(sock.fileno())
+                sock.close()
+            if self.handler.capture is not None:
+                self.handler.capture.close()
+
+    def _drain(self, sock: socket.socket):
+        """Read every pending datagram, up to drain_batch per wakeup"""
+        self.stats.wakeups += 1
+        use_recvmsg = SO_RXQ_OVFL is not None
+        overruns = -1
+        for _ in range(self.drain_batch):
+            try:
+                if use_recvmsg:
+                    data, ancdata, _, addr = sock.recvmsg(protocol.MAX_DATAGRAM, OVERFLOW_ANCILLARY_SIZE)
+                    if ancdata:
+                        overruns = read_overruns(ancdata)
+                else:
+                    data, addr = sock.recvfrom(protocol.MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                log.error("Error receiving data: %s", e)
+                break
+            self.handler.handle(data, addr, time.perf_counter())
+        if overruns >= 0:
+            self.stats.overruns = overruns
+
+    def _report(self):
+        now = time.time()
+        self.stats.update_rate(now)
+        log.info("Receiver: %s", self.stats.summary())
+        self._report_handle = self.loop.call_later(self.stats_interval, self._report)
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._stopped.set)
+
+
+def create_receiver(mode: str, registry, engine, port: int, rcvbuf: int = 0,
+                    stats_interval: float = 10.0, bulk_drain: bool = True, drain_batch: int = 256,
+                    capture=None, max_age: float = 0.0, settings=None):
+    """Build the receiver selected by RECEIVER_MODE"""
+    if mode == "asyncio":
+        return AsyncioReceiver(registry, engine, port, rcvbuf, stats_interval, bulk_drain, drain_batch,
+                               capture, max_age, settings)
+    if mode == "thread":
+        return ThreadedReceiver(registry, engine, port, rcvbuf, stats_interval, capture, max_age, settings)
+    raise ValueError(f"Unknown RECEIVER_MODE: {mode}")
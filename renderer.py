@@ -0,0 +1,114 @@
+# Visualization renderer for the MJPEG feed
+# Boundary lines, labels and the highlighted region never change for a given
+# action, so they are prerendered once per action. Each frame only restores
+# and redraws the info text, and the JPEG is reused when nothing changed.
+
+import time
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from metrics import REGISTRY
+
+RENDER_SECONDS = REGISTRY.histogram("temple_run_frame_render_seconds", "Time to draw one video frame")
+ENCODE_SECONDS = REGISTRY.histogram("temple_run_frame_encode_seconds", "Time to JPEG-encode one video frame")
+
+ACTIONS = (None, "up", "down", "left", "right")
+
+# Define the boundaries for visualization
+up_boundary = 160
+down_boundary = 320
+left_boundary = 200
+right_boundary = 440
+
+# Info text layout
+INFO_LINE_HEIGHT = 20
+INFO_FONT_SCALE = 0.6
+
+
+def draw_boundaries(canvas: np.ndarray):
+    """Draw the boundary lines"""
+    H, W = canvas.shape[:2]
+    cv2.line(canvas, (0, up_boundary), (W, up_boundary), (255, 255, 255), 2)  # UP
+    cv2.line(canvas, (0, down_boundary), (W, down_boundary), (255, 255, 255), 2)  # DOWN
+    cv2.line(canvas, (left_boundary, up_boundary), (left_boundary, down_boundary), (255, 255, 255), 2)  # LEFT
+    cv2.line(canvas, (right_boundary, up_boundary), (right_boundary, down_boundary), (255, 255, 255), 2)  # RIGHT
+
+
+def render_background(width: int, height: int, action: Optional[str]) -> np.ndarray:
+    """Render everything except the info text for one action"""
+    W, H = width, height
+    canvas = np.zeros((H, W, 3), dtype=np.uint8)
+    draw_boundaries(canvas)
+
+    # Draw labels for 3D plane movement
+    cv2.putText(canvas, "JUMP (+Y)", (W//2 - 40, up_boundary - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+    cv2.putText(canvas, "SLIDE (-Z)", (W//2 - 40, down_boundary + 20), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+    cv2.putText(canvas, "LEFT", (left_boundary - 40, H//2), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+    cv2.putText(canvas, "RIGHT", (right_boundary + 10, H//2), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+
+    # Draw 3D plane movement indicators
+    cv2.putText(canvas, "Leg Forward (+Y)", (W//2 - 60, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 1)
+    cv2.putText(canvas, "Leg Downward (-Z)", (W//2 - 60, H - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 1)
+
+    # Highlight active region based on current action
+    if action == "up":
+        cv2.rectangle(canvas, (0, 0), (W, up_boundary), (0, 255, 0), -1)
+    elif action == "down":
+        cv2.rectangle(canvas, (0, down_boundary), (W, H), (0, 255, 0), -1)
+    elif action == "left":
+        cv2.rectangle(canvas, (0, up_boundary), (left_boundary, down_boundary), (0, 255, 0), -1)
+    elif action == "right":
+        cv2.rectangle(canvas, (right_boundary, up_boundary), (W, down_boundary), (0, 255, 0), -1)
+
+    # Boundary lines stay visible on top of the highlight
+    draw_boundaries(canvas)
+    return canvas
+
+
+class FrameRenderer:
+    """Composes frames from the prerendered backgrounds and encodes them to JPEG"""
+
+    def __init__(self, width: int, height: int):
+        self.backgrounds = {action: render_background(width, height, action) for action in ACTIONS}
+        self.canvas = self.backgrounds[None].copy()
+        self.frames_rendered = 0
+        self.frames_reused = 0
+        self._action = None
+        self._info_rows = 0
+        self._last_key = None
+        self._last_jpeg = b''
+
+    def render(self, action: Optional[str], info: List[Tuple[str, str]]) -> bytes:
+        """Return the JPEG for this state, reusing the previous one if unchanged"""
+        key = (action, tuple(info))
+        if key == self._last_key:
+            self.frames_reused += 1
+            return self._last_jpeg
+
+        started = time.perf_counter()
+        background = self.backgrounds[action]
+        if action != self._action:
+            np.copyto(self.canvas, background)
+            self._action = action
+        else:
+            # Only the info text is dirty, restore just the rows it covers
+            rows = self._info_rows
+            self.canvas[:rows] = background[:rows]
+
+        # Draw the information on the frame
+        for (i, (k, v)) in enumerate(info):
+            text = "{}: {}".format(k, v)
+            cv2.putText(self.canvas, text, (10, (i * INFO_LINE_HEIGHT) + 20),
+                        cv2.FONT_HERSHEY_SIMPLEX, INFO_FONT_SCALE, (0, 0, 255), 2)
+        self._info_rows = min(len(self.canvas), len(info) * INFO_LINE_HEIGHT + 10)
+
+        drawn = time.perf_counter()
+        ret, buffer = cv2.imencode('.jpg', self.canvas)
+        self._last_jpeg = buffer.tobytes()
+        RENDER_SECONDS.observe(drawn - started)
+        ENCODE_SECONDS.observe(time.perf_counter() - drawn)
+        self._last_key = key
+        self.frames_rendered += 1
+        return self._last_jpeg
@@ -0,0 +1,98 @@
+# Replay a session capture through the classifier
+# Pushes every recorded sample through the same filter chain and classifier as
+# the live server, as fast as possible and with key presses recorded instead
+# of sent, and prints the resulting action timeline. Use it to tune thresholds
+# and benchmark the pipeline against real workouts without a Raspberry Pi.
+#
+#   python replay.py captures/session.trcap
+#   python replay.py captures/session.trcap --classifier gesture --output timeline.csv
+#   python replay.py captures/session.trcap --thresholds 0.4 0.35 0.3
+
+import argparse
+import csv
+import time
+from collections import Counter
+
+import numpy as np
+
+import pipeline
+from capture import load_capture
+from config import *
+from devices import DeviceRegistry
+
+
+def replay(records: np.ndarray, classifier: str, thresholds=None):
+    """Run a capture through a fresh engine; returns (timeline, engine, seconds)"""
+    registry = DeviceRegistry(MAX_DEVICES, DEVICE_HISTORY, float('inf'), KEY_BINDINGS, DEVICE_KEY_BINDINGS)
+    # Players start uncalibrated and nothing is written to the live CALIBRATION_PATH
+    engine = pipeline.create_engine(registry, lambda key: None, classifier, verbose=False, calibration_path=None)
+    if thresholds:
+        engine.settings.update(dict(zip(("X_THRESHOLD", "Y_THRESHOLD", "Z_THRESHOLD"), thresholds)))
+
+    # Materialize the columns once instead of touching the memory map per sample
+    samples = np.stack([records['x'], records['y'], records['z']], axis=1)
+    times = np.ascontiguousarray(records['time'])
+    device_ids = records['device'].tolist()
+    start_time = float(times[0]) if len(times) else 0.0
+
+    timeline = []
+    started = time.perf_counter()
+    for i, device_id in enumerate(device_ids):
+        now = float(times[i])
+        device = registry.lookup(device_id, ('replay', device_id), now)
+        device.add_samples(samples[i:i + 1], times[i:i + 1], now)
+        device.received_at = time.perf_counter()
+        action = engine.process(device, now)
+        if action is not None:
+            timeline.append((now - start_time, device_id, action, device.confidence))
+    elapsed = time.perf_counter() - started
+    return timeline, engine, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a session capture through the classifier")
+    parser.add_argument('capture', help="capture file recorded with CAPTURE_PATH")
+    parser.add_argument('--classifier', choices=['threshold', 'gesture'], default=CLASSIFIER)
+    parser.add_argument('--device', type=int, help="only replay this device")
+    parser.add_argument('--thresholds', type=float, nargs=3, metavar=('X', 'Y', 'Z'),
+                        help="override X_THRESHOLD, Y_THRESHOLD and Z_THRESHOLD")
+    parser.add_argument('--no-calibration', action='store_true',
+                        help="classify with the fixed thresholds instead of per-player adaptive ones")
+    parser.add_argument('--output', help="write the action timeline to this CSV file")
+    parser.add_argument('--quiet', action='store_true', help="only print the summary")
+    args = parser.parse_args()
+
+    if args.no_calibration:
+        pipeline.ADAPTIVE_CALIBRATION = False
+
+    records = load_capture(args.capture)
+    if args.device is not None:
+        records = records[records['device'] == args.device]
+    if len(records) == 0:
+        print("[INFO] Nothing to replay")
+        return
+
+    timeline, engine, elapsed = replay(records, args.classifier, args.thresholds)
+
+    if not args.quiet:
+        for offset, device_id, action, confidence in timeline:
+            print(f"{offset:10.3f}s  device {device_id:<6} {action:<6} ({confidence:.0%})")
+
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['time', 'device', 'action', 'confidence'])
+            for offset, device_id, action, confidence in timeline:
+                writer.writerow([f"{offset:.4f}", device_id, action, f"{confidence:.3f}"])
+
+    duration = float(records['time'][-1] - records['time'][0])
+    counts = Counter(action for _, _, action, _ in timeline)
+    print(f"[INFO] Replayed {len(records)} samples ({duration:.1f}s of recording) in {elapsed:.2f}s "
+          f"({len(records) / elapsed:.0f} samples/s)")
+    print(f"[INFO] Classifier: {args.classifier}, filter chain: {engine.chain.describe()}")
+    print("[INFO] Actions: " + (", ".join(f"{action}={count}" for action, count in sorted(counts.items())) or "none"))
+    print(f"[INFO] Classification-to-enqueue time: {engine.latency.summary()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# State reports shared by both pipeline modes
+# ControllerServices (threads) and ProcessServices (processes) keep the
+# pipeline's state in different places: in the objects themselves, or in
+# shared memory tables. Each supplies that raw state through a few methods;
+# the /metrics callbacks, the /telemetry snapshots and stream, and the /link
+# report are built from it here, so both modes report exactly the same way.
+
+import json
+import time
+from typing import Dict, List, Optional
+
+from metrics import REGISTRY
+
+# Receive path counters the reports use, as named in ReceiverStats
+RECEIVER_COUNTS = ("packets", "samples", "bytes", "invalid", "duplicates", "stale", "rejected", "overruns",
+                   "packets_per_sec")
+
+
+class ServiceReports:
+    """Metrics, telemetry and link reports of a running pipeline
+
+    Subclasses implement the methods raising NotImplementedError and have
+    `settings`, `frame_broadcaster`, `telemetry_broadcaster` and a
+    `_stopping` event.
+    """
+
+    def receiver_counts(self) -> Dict[str, float]:
+        """The RECEIVER_COUNTS of the receive path"""
+        raise NotImplementedError
+
+    def keypresses(self) -> int:
+        raise NotImplementedError
+
+    def latency_p99(self) -> Optional[float]:
+        """Receive-to-enqueue p99 in seconds, None before the first key press"""
+        raise NotImplementedError
+
+    def output_p99(self) -> Dict[str, float]:
+        """Dispatch p99 in seconds of each output backend that delivered something"""
+        raise NotImplementedError
+
+    def device_count(self) -> int:
+        raise NotImplementedError
+
+    def device_states(self) -> List[Dict]:
+        """Per device: name, id, action, confidence, x, y, z, last_seen, packets,
+        samples, thresholds (None before classification), loss and latency
+        (seconds, None when unknown)"""
+        raise NotImplementedError
+
+    def link_states(self) -> List[Dict]:
+        """Per device: link.format_link() fields plus name, id and address"""
+        raise NotImplementedError
+
+    def _register_metrics(self):
+        """Values kept elsewhere are read only when /metrics is scraped"""
+        counts = self.receiver_counts
+        REGISTRY.counter_function("temple_run_packets_received_total", "Datagrams received",
+                                  lambda: counts()["packets"])
+        REGISTRY.counter_function("temple_run_samples_received_total", "Accelerometer samples received",
+                                  lambda: counts()["samples"])
+        REGISTRY.counter_function("temple_run_bytes_received_total", "Bytes received", lambda: counts()["bytes"])
+        for reason in ("invalid", "duplicates", "stale", "rejected", "overruns"):
+            REGISTRY.counter_function("temple_run_packets_dropped_total", "Datagrams dropped, by reason",
+                                      lambda reason=reason: counts()[reason], {"reason": reason})
+        REGISTRY.gauge_function("temple_run_devices_connected", "Registered accelerometer devices",
+                                self.device_count)
+        REGISTRY.counter_function("temple_run_keypresses_total", "Key presses sent to the game", self.keypresses)
+        REGISTRY.gauge_function("temple_run_viewers_connected", "Open viewer connections",
+                                lambda: self.frame_broadcaster.subscribers, {"stream": "video_feed"})
+        REGISTRY.gauge_function("temple_run_viewers_connected", "Open viewer connections",
+                                lambda: self.telemetry_broadcaster.subscribers, {"stream": "telemetry"})
+
+    def telemetry_snapshot(self):
+        """Compact state of every device and of the receive path"""
+        current = self.settings.current
+        counts = self.receiver_counts()
+        devices = []
+        for state in self.device_states():
+            thresholds, latency = state["thresholds"], state["latency"]
+            devices.append({
+                "name": state["name"],
+                "id": state["id"],
+                "action": state["action"],
+                "confidence": round(float(state["confidence"]), 2),
+                "x": round(float(state["x"]), 3), "y": round(float(state["y"]), 3), "z": round(float(state["z"]), 3),
+                "last_seen": round(float(state["last_seen"]), 3),
+                "packets": int(state["packets"]),
+                "samples": int(state["samples"]),
+                "thresholds": [round(float(t), 3) for t in thresholds] if thresholds is not None else None,
+                "loss": round(float(state["loss"]), 3),
+                "latency_ms": round(latency * 1000, 1) if latency is not None else None,
+            })
+        p99 = self.latency_p99()
+        return {
+            "devices": devices,
+            "receiver": {
+                "packets_per_sec": round(counts["packets_per_sec"], 1),
+                "packets": int(counts["packets"]),
+                "drops": int(counts["invalid"] + counts["rejected"] + counts["overruns"]),
+                "stale": int(counts["stale"]),
+            },
+            "latency_p99_ms": round(p99 * 1000, 2) if p99 is not None else None,
+            "output_p99_ms": {name: round(p99 * 1000, 2) for name, p99 in self.output_p99().items()},
+            "thresholds": {"x": current.X_THRESHOLD, "y": current.Y_THRESHOLD, "z": current.Z_THRESHOLD},
+            "viewers": self.telemetry_broadcaster.subscribers,
+        }
+
+    def produce_telemetry(self):
+        """Publish state updates as Server-Sent Events whenever something changed"""
+        last_state = None
+
+        while not self._stopping.wait(1.0 / self.settings.current.TELEMETRY_HZ):
+            if self.telemetry_broadcaster.subscribers == 0:
+                last_state = None
+                continue
+
+            state = self.telemetry_snapshot()
+            if state == last_state:
+                continue
+            last_state = state
+            message = json.dumps(dict(state, time=round(time.time(), 3)), separators=(',', ':'))
+            self.telemetry_broadcaster.publish(b"data: " + message.encode('utf-8') + b"\n\n")
+
+    def link_report(self):
+        """Sequence, loss and latency statistics of every device's UDP link"""
+        counts = self.receiver_counts()
+        return {
+            "devices": self.link_states(),
+            "receiver": {name: int(counts[name])
+                         for name in ("packets", "invalid", "duplicates", "stale", "rejected", "overruns")},
+            "max_sample_age": self.settings.current.MAX_SAMPLE_AGE,
+        }
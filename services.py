@@ -0,0 +1,239 @@
+# Background services behind the web interface
+# Owns everything that runs independently of HTTP requests: the UDP receiver,
+# the action engine, the key output workers, the settings watcher, the
+# discovery responder and the frame and telemetry producers. They are built
+# once, started exactly once with start(), whatever server runs the web app
+# and however many times the app is created, and stopped in order by stop()
+# so queued key presses are delivered and calibration profiles are saved.
+
+import logging
+import threading
+import time
+from typing import List
+
+import config
+from config import *
+from broadcast import Broadcaster
+from capture import CaptureWriter
+from devices import DeviceRegistry
+from discovery import DiscoveryServer
+from outputs import create_dispatcher
+from pipeline import create_engine
+from profiler import SamplingProfiler
+from receiver import create_receiver
+from renderer import FrameRenderer
+from reports import RECEIVER_COUNTS, ServiceReports
+from settings import RuntimeSettings, SettingsWatcher
+
+log = logging.getLogger(__name__)
+
+
+def view_info(action, x: float, y: float, z: float, status: str, thresholds, p99, packets_per_sec: float,
+              drops: int, viewers: int):
+    """Info lines shown on the video feed; `thresholds` are the (x, y, z) ones in use"""
+    latency = f"p99 {p99 * 1000:.1f} ms" if p99 is not None else "n/a"
+    return [
+        ("Action", action if action else "None"),
+        ("Accel X", f"{x:.2f}"),
+        ("Accel Y", f"{y:.2f}"),
+        ("Accel Z", f"{z:.2f}"),
+        ("Status", status),
+        ("Thresholds", "X:{:.2f} Y:{:.2f} Z:{:.2f}".format(*thresholds)),
+        ("Latency", latency),
+        ("Packets/s", f"{packets_per_sec:.0f} (drops {drops})"),
+        ("Viewers", str(viewers)),
+        ("3D Plane", "+Y=Jump, -Z=Slide")
+    ]
+
+
+def create_services(mode: str = PIPELINE_MODE):
+    """Build the services for PIPELINE_MODE"""
+    if mode == "processes":
+        from process_pipeline import ProcessServices
+        return ProcessServices()
+    if mode == "threads":
+        return ControllerServices()
+    raise ValueError(f"Unknown PIPELINE_MODE: {mode}")
+
+
+class ControllerServices(ServiceReports):
+    """The receive, classify and output pipeline plus the producers for viewers"""
+
+    def __init__(self):
+        # Settings that can change at runtime; hot paths read the current snapshot per sample
+        self.settings = RuntimeSettings.from_module(config)
+        self.settings.subscribe(lambda snapshot: logging.getLogger().setLevel(snapshot.LOG_LEVEL))
+        self.settings_watcher = (SettingsWatcher(self.settings, SETTINGS_PATH, SETTINGS_POLL_INTERVAL)
+                                 if SETTINGS_PATH else None)
+
+        # Registry of connected accelerometer devices, one entry per player
+        self.registry = DeviceRegistry(MAX_DEVICES, DEVICE_HISTORY, DEVICE_IDLE_TIMEOUT,
+                                       KEY_BINDINGS, DEVICE_KEY_BINDINGS)
+
+        # Key presses are queued and delivered by the OUTPUT_BACKENDS worker threads
+        bound_keys = set(KEY_BINDINGS.values())
+        for overrides in DEVICE_KEY_BINDINGS.values():
+            bound_keys.update(overrides.values())
+        self.output = create_dispatcher(OUTPUT_BACKENDS, sorted(bound_keys), OUTPUT_QUEUE_SIZE, WEBSOCKET_PORT)
+
+        # Filters and classifies samples as they arrive and hands the key presses to the output
+        self.engine = create_engine(self.registry, self.output.press, settings=self.settings)
+
+        # Optional recording of every received sample for replay.py
+        self.capture = CaptureWriter(CAPTURE_PATH) if CAPTURE_PATH else None
+
+        # UDP receiver feeding the registry and the engine
+        self.receiver = create_receiver(RECEIVER_MODE, self.registry, self.engine, SERVER_PORT, UDP_RCVBUF,
+                                        RECEIVER_STATS_INTERVAL, RECEIVER_BULK_DRAIN, RECEIVER_DRAIN_BATCH,
+                                        self.capture, MAX_SAMPLE_AGE, self.settings)
+
+        # Lets Pi clients find the server and tells them which sample rate to use
+        self.discovery = DiscoveryServer(self.registry, self.settings) if DISCOVERY_PORT else None
+
+        # Frames are rendered once by produce_frames() and shared by all viewers
+        self.frame_broadcaster = Broadcaster()
+
+        # Telemetry for client-side rendering, published by produce_telemetry()
+        self.telemetry_broadcaster = Broadcaster()
+
+        # Sampling profiler behind /profile, only when PROFILER_ENABLED
+        self.profiler = SamplingProfiler(PROFILER_INTERVAL) if PROFILER_ENABLED else None
+
+        self.threads: List[threading.Thread] = []
+        self.started = False
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._register_metrics()
+
+    def start(self) -> bool:
+        """Start every background thread; returns False if they are already running"""
+        with self._lock:
+            if self.started:
+                return False
+            self.started = True
+
+        # Start the key output workers before anything can press a key
+        self.output.start()
+        services = [
+            ("engine", self.engine.run),
+            ("receiver", self.receiver.run),
+            ("frames", self.produce_frames),
+            ("telemetry", self.produce_telemetry),
+        ]
+        if self.discovery is not None:
+            services.append(("discovery", self.discovery.run))
+        # Pick up changes to SETTINGS_PATH while running
+        if self.settings_watcher is not None:
+            services.append(("settings", self.settings_watcher.run))
+        for name, target in services:
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return True
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the producers and the pipeline, then flush the key output"""
+        with self._lock:
+            if not self.started or self._stopping.is_set():
+                return
+            self._stopping.set()
+
+        log.info("Stopping background services")
+        self.frame_broadcaster.close()
+        self.telemetry_broadcaster.close()
+        if self.settings_watcher is not None:
+            self.settings_watcher.stop()
+        if self.discovery is not None:
+            self.discovery.stop()
+        self.receiver.stop()
+        self.engine.stop()     # Saves the calibration profiles on its way out
+        deadline = time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+            if thread.is_alive():
+                log.warning("The %s thread did not stop within %.0f seconds", thread.name, timeout)
+        self.output.stop()
+
+    def current_view(self):
+        """Action and info lines to display for the most recently active device"""
+        device = self.registry.most_recent()
+        current = self.settings.current
+        thresholds = (current.X_THRESHOLD, current.Y_THRESHOLD, current.Z_THRESHOLD)
+        if device is not None:
+            action = device.current_action
+            x, y, z = device.latest()
+            status = f"{device.name} ({len(self.registry)} connected)"
+            thresholds = device.thresholds or thresholds
+        else:
+            action = None
+            x = y = z = 0.0
+            status = "Waiting for devices"
+        stats = self.receiver.stats
+        info = view_info(action, x, y, z, status, thresholds, self.engine.latency.percentile(99),
+                         stats.packets_per_sec, stats.drops, self.frame_broadcaster.subscribers)
+        return action, info
+
+    def produce_frames(self):
+        """Render and encode each frame once and publish it to every viewer"""
+        renderer = FrameRenderer(CANVAS_WIDTH, CANVAS_HEIGHT)
+        last_frame = None
+        next_frame = time.perf_counter()
+
+        while not self._stopping.is_set():
+            frame_interval = 1.0 / self.settings.current.RENDER_FPS
+
+            # Nothing to do while nobody is watching
+            if self.frame_broadcaster.subscribers == 0:
+                self._stopping.wait(frame_interval)
+                next_frame = time.perf_counter()
+                continue
+
+            action, info = self.current_view()
+            frame = renderer.render(action, info)  # Times itself, see temple_run_frame_*_seconds
+            if frame is not last_frame:
+                self.frame_broadcaster.publish(b'--frame\r\n'
+                    b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+                last_frame = frame
+
+            # Pace the stream to RENDER_FPS, skipping ahead if we fell behind
+            next_frame += frame_interval
+            delay = next_frame - time.perf_counter()
+            if delay > 0:
+                self._stopping.wait(delay)
+            else:
+                next_frame = time.perf_counter()
+
+    def receiver_counts(self):
+        stats = self.receiver.stats
+        return {name: getattr(stats, name) for name in RECEIVER_COUNTS}
+
+    def keypresses(self):
+        return self.engine.latency.count
+
+    def latency_p99(self):
+        return self.engine.latency.percentile(99)
+
+    def output_p99(self):
+        return {name: latency.percentile(99) for name, latency in self.output.latency.items() if latency.count}
+
+    def device_count(self):
+        return len(self.registry)
+
+    def device_states(self):
+        states = []
+        for device in self.registry.devices():
+            x, y, z = device.latest()
+            link = device.link
+            states.append({
+                "name": device.name, "id": device.device_id,
+                "action": device.current_action, "confidence": device.confidence,
+                "x": x, "y": y, "z": z,
+                "last_seen": device.last_seen, "packets": device.packets, "samples": device.samples,
+                "thresholds": device.thresholds,
+                "loss": link.loss_rate, "latency": link.latency if link.offset is not None else None,
+            })
+        return states
+
+    def link_states(self):
+        return [dict(device.link.snapshot(), name=device.name, id=device.device_id, address=device.address[0])
+                for device in self.registry.devices()]
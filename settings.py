@@ -0,0 +1,244 @@
+# Hot-reloadable runtime settings
+# config.py is read once at start-up. The settings listed in RELOADABLE can
+# also be changed while the server runs, through POST /config or by editing
+# SETTINGS_PATH, without dropping devices or pausing the streams.
+#
+# Readers never lock: every change builds a new immutable Snapshot and swaps
+# it in with a single attribute assignment, so the receive and classify
+# threads just read `settings.current` (or `settings.for_device(device)`) once
+# per sample and see either the old or the new values, never a mix.
+
+import json
+import logging
+import math
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+
+log = logging.getLogger(__name__)
+
+
+def _positive(value) -> float:
+    value = float(value)
+    if not math.isfinite(value) or value <= 0:
+        raise ValueError("must be positive and finite")
+    return value
+
+
+def _non_negative(value) -> float:
+    value = float(value)
+    if not math.isfinite(value) or value < 0:
+        raise ValueError("must be finite and not negative")
+    return value
+
+
+def _fraction(value) -> float:
+    value = float(value)
+    if not 0.0 <= value <= 1.0:
+        raise ValueError("must be between 0 and 1")
+    return value
+
+
+def _log_level(value) -> str:
+    value = str(value).upper()
+    if value not in ("DEBUG", "INFO", "WARNING", "ERROR"):
+        raise ValueError("must be DEBUG, INFO, WARNING or ERROR")
+    return value
+
+
+# Settings that take effect without a restart, with their validators
+RELOADABLE: Dict[str, Callable] = {
+    "X_THRESHOLD": _positive,
+    "Y_THRESHOLD": _positive,
+    "Z_THRESHOLD": _positive,
+    "WAIT_TIME": _non_negative,
+    "GESTURE_MIN_CONFIDENCE": _fraction,
+    "MAX_SAMPLE_AGE": _non_negative,
+    "CLIENT_SAMPLE_RATE": _non_negative,
+    "RENDER_FPS": _positive,
+    "TELEMETRY_HZ": _positive,
+    "FRAME_KEEPALIVE": _positive,
+    "LOG_LEVEL": _log_level,
+}
+
+# Settings that can differ per device (DEVICE_OVERRIDES)
+PER_DEVICE = ("X_THRESHOLD", "Y_THRESHOLD", "Z_THRESHOLD", "WAIT_TIME", "GESTURE_MIN_CONFIDENCE",
+              "CLIENT_SAMPLE_RATE")
+
+
+class Snapshot:
+    """Immutable set of setting values; read them as attributes"""
+
+    __slots__ = ("_values", "version")
+
+    def __init__(self, values: Dict, version: int):
+        object.__setattr__(self, "_values", dict(values))
+        object.__setattr__(self, "version", version)
+
+    def __getattr__(self, name: str):
+        try:
+            return self._values[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Snapshot is read-only, use RuntimeSettings.update()")
+
+    def to_dict(self) -> Dict:
+        return dict(self._values)
+
+
+def _device_key(key):
+    """DEVICE_OVERRIDES keys are device ids or IP addresses; JSON makes ids strings"""
+    if isinstance(key, str) and key.isdigit():
+        return int(key)
+    return key
+
+
+class RuntimeSettings:
+    """The current settings snapshot plus per-device overrides
+
+    `values` are the start-up values of every RELOADABLE setting, normally
+    taken from config.py with from_module().
+    """
+
+    def __init__(self, values: Dict, device_overrides: Optional[Dict] = None):
+        missing = [name for name in RELOADABLE if name not in values]
+        if missing:
+            raise ValueError(f"Missing settings: {', '.join(missing)}")
+        self._write_lock = threading.Lock()
+        self._listeners: List[Callable[[Snapshot], None]] = []
+        self.overrides = self._parse_overrides(device_overrides or {})
+        self.current = Snapshot({name: values[name] for name in RELOADABLE}, 1)
+
+    @classmethod
+    def from_module(cls, module) -> "RuntimeSettings":
+        return cls({name: getattr(module, name) for name in RELOADABLE},
+                   getattr(module, "DEVICE_OVERRIDES", {}))
+
+    def for_device(self, device) -> Snapshot:
+        """Settings for one device, with its overrides applied; cached on the device"""
+        current = self.current
+        cached = device.settings
+        if cached is not None and cached.version == current.version:
+            return cached
+        overrides = self.overrides.get(device.device_id)
+        if overrides is None:
+            overrides = self.overrides.get(device.address[0])
+        snapshot = Snapshot(dict(current.to_dict(), **overrides), current.version) if overrides else current
+        device.settings = snapshot
+        return snapshot
+
+    def subscribe(self, listener: Callable[[Snapshot], None]):
+        """Call `listener` with the new snapshot after every change"""
+        self._listeners.append(listener)
+
+    def validate(self, changes: Dict, allowed=RELOADABLE) -> Dict:
+        """Converted values, or ValueError naming every bad setting"""
+        errors = []
+        validated = {}
+        for name, value in changes.items():
+            validator = RELOADABLE.get(name)
+            if validator is None:
+                errors.append(f"{name} cannot be changed at runtime")
+                continue
+            if name not in allowed:
+                errors.append(f"{name} cannot be set per device")
+                continue
+            try:
+                validated[name] = validator(value)
+            except (TypeError, ValueError) as e:
+                errors.append(f"{name} {e}")
+        if errors:
+            raise ValueError("; ".join(errors))
+        return validated
+
+    def _parse_overrides(self, device_overrides: Dict) -> Dict:
+        if not isinstance(device_overrides, dict):
+            raise ValueError("DEVICE_OVERRIDES is not an object")
+        overrides = {}
+        for key, values in device_overrides.items():
+            if not isinstance(values, dict):
+                raise ValueError(f"DEVICE_OVERRIDES for {key} is not an object")
+            overrides[_device_key(key)] = self.validate(values, PER_DEVICE)
+        return overrides
+
+    def update(self, changes: Dict, device_overrides: Optional[Dict] = None) -> Snapshot:
+        """Validate and apply changes atomically; nothing changes if any value is bad
+
+        `device_overrides`, when given, replaces all per-device overrides.
+        """
+        with self._write_lock:
+            # Everything is validated before anything is swapped in
+            validated = self.validate(changes)
+            overrides = self.overrides
+            if device_overrides is not None:
+                overrides = self._parse_overrides(device_overrides)
+            snapshot = Snapshot(dict(self.current.to_dict(), **validated), self.current.version + 1)
+            self.overrides = overrides
+            self.current = snapshot
+        for listener in self._listeners:
+            listener(snapshot)
+        return snapshot
+
+    def update_from_dict(self, data: Dict) -> Snapshot:
+        """Apply a JSON document: setting names plus an optional DEVICE_OVERRIDES object"""
+        if not isinstance(data, dict):
+            raise ValueError("Settings must be a JSON object")
+        changes = dict(data)
+        device_overrides = changes.pop("DEVICE_OVERRIDES", None)
+        return self.update(changes, device_overrides)
+
+    def load_file(self, path: str) -> Snapshot:
+        with open(path) as f:
+            return self.update_from_dict(json.load(f))
+
+    def describe(self) -> Dict:
+        return {
+            "version": self.current.version,
+            "settings": self.current.to_dict(),
+            "DEVICE_OVERRIDES": {str(key): values for key, values in self.overrides.items()},
+        }
+
+
+class SettingsWatcher:
+    """Reloads a JSON settings file whenever its modification time changes
+
+    Polls instead of using inotify so it works everywhere without extra packages.
+    """
+
+    def __init__(self, settings: RuntimeSettings, path: str, interval: float = 1.0):
+        self.settings = settings
+        self.path = path
+        self.interval = interval
+        self.running = False
+        self._stop = threading.Event()
+        self._mtime = None
+
+    def check(self) -> bool:
+        """Reload if the file changed; returns True when new settings were applied"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        try:
+            snapshot = self.settings.load_file(self.path)
+        except (OSError, ValueError) as e:
+            log.error("Ignoring settings file %s: %s", self.path, e)
+            return False
+        log.info("Reloaded settings from %s (version %d)", self.path, snapshot.version)
+        return True
+
+    def run(self):
+        self.running = True
+        while True:
+            self.check()
+            if self._stop.wait(self.interval):
+                break
+        self.running = False
+
+    def stop(self):
+        self._stop.set()
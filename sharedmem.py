@@ -0,0 +1,205 @@
+# Shared-memory building blocks for the multi-process pipeline
+# Every structure is a NumPy view over a multiprocessing.shared_memory block,
+# so processes exchange samples, device state and frames by copying arrays in
+# place: no pickling and no pipes on the data path. Each structure has exactly
+# one writing process. The parent creates the blocks and passes their `spec`
+# to the children, which attach() by name.
+#
+#   SampleRing     - single-producer, single-consumer ring of fixed-size records
+#   SeqlockTable   - array republished as a whole; readers retry torn copies
+#   FrameSlot      - the newest JPEG frame, same versioning as SeqlockTable
+#   SharedCounters - named float64 values, for statistics and control values
+
+import time
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+HEADER_BYTES = 64   # Keeps the data a cache line away from the counters
+
+
+class SharedBlock:
+    """A shared memory block holding an int64 header and one data array"""
+
+    def __init__(self, header: int, dtype, shape: Tuple[int, ...], name: Optional[str] = None):
+        self.dtype = np.dtype(dtype)
+        self.shape = tuple(shape)
+        self.header_size = header
+        size = HEADER_BYTES + self.dtype.itemsize * int(np.prod(self.shape))
+        self.owner = name is None
+        if self.owner:
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.header = np.ndarray((header,), dtype=np.int64, buffer=self.memory.buf)
+        self.data = np.ndarray(self.shape, dtype=self.dtype, buffer=self.memory.buf, offset=HEADER_BYTES)
+        if self.owner:
+            self.header[:] = 0
+
+    def _arguments(self) -> Tuple:
+        """Constructor arguments, apart from the name"""
+        raise NotImplementedError
+
+    @property
+    def spec(self) -> Tuple:
+        """Picklable description for attach() in another process"""
+        return type(self), self._arguments(), self.memory.name
+
+    def close(self):
+        # The views must go before the buffer can be released
+        self.header = self.data = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+class SampleRing(SharedBlock):
+    """Records written by one process and read by one other
+
+    The header holds the number of records ever written. The writer never
+    waits: when the reader falls a whole ring behind, the oldest records are
+    overwritten and the reader reports how many it missed.
+    """
+
+    def __init__(self, dtype, capacity: int, name: Optional[str] = None):
+        super().__init__(1, dtype, (capacity,), name)
+        self.capacity = capacity
+
+    def _arguments(self):
+        return self.dtype, self.capacity
+
+    def write(self, records: np.ndarray):
+        count = len(records)
+        if count > self.capacity:
+            records = records[-self.capacity:]
+            count = self.capacity
+        written = int(self.header[0])
+        start = written % self.capacity
+        first = min(count, self.capacity - start)
+        self.data[start:start + first] = records[:first]
+        if first < count:
+            self.data[:count - first] = records[first:]
+        # Publish only after the records are in place
+        self.header[0] = written + count
+
+    def read(self, cursor: int, limit: int = 4096) -> Tuple[np.ndarray, int, int]:
+        """Records after `cursor`; returns (records, new cursor, records missed)"""
+        written = int(self.header[0])
+        missed = max(0, written - cursor - self.capacity)
+        cursor += missed
+        end = min(written, cursor + limit)
+        if end <= cursor:
+            return self.data[:0].copy(), cursor, missed
+        start = cursor % self.capacity
+        count = end - cursor
+        first = min(count, self.capacity - start)
+        records = np.concatenate((self.data[start:start + first], self.data[:count - first]))
+
+        # Drop whatever the writer overwrote while we were copying
+        overwritten = int(self.header[0]) - self.capacity - cursor
+        if overwritten > 0:
+            records = records[overwritten:]
+            missed += min(overwritten, count)
+        return records, end, missed
+
+
+class SeqlockTable(SharedBlock):
+    """An array one process republishes and others copy consistently
+
+    The version in the header is odd while the writer is copying; readers
+    retry until they get a copy taken at a single even version.
+    """
+
+    def __init__(self, dtype, rows: int, name: Optional[str] = None):
+        super().__init__(1, dtype, (rows,), name)
+
+    def _arguments(self):
+        return self.dtype, self.shape[0]
+
+    def publish(self, values: np.ndarray):
+        version = int(self.header[0])
+        self.header[0] = version + 1
+        self.data[:] = values
+        self.header[0] = version + 2
+
+    def snapshot(self, attempts: int = 100) -> np.ndarray:
+        copy = self.data.copy()
+        for _ in range(attempts):
+            before = int(self.header[0])
+            if before & 1:
+                time.sleep(0)
+                continue
+            copy[:] = self.data
+            if int(self.header[0]) == before:
+                break
+        return copy
+
+    @property
+    def version(self) -> int:
+        return int(self.header[0])
+
+
+class FrameSlot(SharedBlock):
+    """The newest encoded frame, up to `capacity` bytes"""
+
+    def __init__(self, capacity: int, name: Optional[str] = None):
+        super().__init__(2, np.uint8, (capacity,), name)
+        self.capacity = capacity
+
+    def _arguments(self):
+        return (self.capacity,)
+
+    def write(self, frame: bytes) -> bool:
+        """Publish a frame; False if it does not fit"""
+        if len(frame) > self.capacity:
+            return False
+        version = int(self.header[0])
+        self.header[0] = version + 1
+        self.data[:len(frame)] = np.frombuffer(frame, dtype=np.uint8)
+        self.header[1] = len(frame)
+        self.header[0] = version + 2
+        return True
+
+    def read(self, last_version: int) -> Tuple[int, Optional[bytes]]:
+        """(version, frame) if a frame newer than last_version exists, else (last_version, None)"""
+        for _ in range(100):
+            version = int(self.header[0])
+            if version == last_version or version == 0:
+                return last_version, None
+            if version & 1:
+                time.sleep(0)
+                continue
+            frame = self.data[:int(self.header[1])].tobytes()
+            if int(self.header[0]) == version:
+                return version, frame
+        return last_version, None
+
+
+class SharedCounters(SharedBlock):
+    """Named float64 values, each written by a single process"""
+
+    def __init__(self, names: Sequence[str], name: Optional[str] = None):
+        super().__init__(1, np.float64, (len(names),), name)
+        self.names = tuple(names)
+        self.index: Dict[str, int] = {key: i for i, key in enumerate(self.names)}
+        if self.owner:
+            self.data[:] = 0.0
+
+    def _arguments(self):
+        return (self.names,)
+
+    def set(self, key: str, value: float):
+        self.data[self.index[key]] = value
+
+    def get(self, key: str) -> float:
+        return float(self.data[self.index[key]])
+
+    def as_dict(self) -> Dict[str, float]:
+        return dict(zip(self.names, self.data.tolist()))
+
+
+def attach(spec: Tuple):
+    """Attach to a structure created by another process, from its spec"""
+    kind, arguments, name = spec
+    return kind(*arguments, name=name)
@@ -0,0 +1,102 @@
+import math
+
+import numpy as np
+
+from calibration import AdaptiveCalibration
+from devices import Device, DeviceRegistry
+from pipeline import classify, create_engine
+
+BASE = (0.3, 0.3, 0.3)
+
+
+def make_device(device_id: int = 1) -> Device:
+    return Device(('id', device_id), device_id, ('10.0.0.2', 40000), 16, {})
+
+
+def rest(calibration, device, count: int, base=BASE):
+    for i in range(count):
+        wobble = 0.02 if i % 2 else -0.02
+        result = calibration.apply(device, wobble, 0.0, wobble, base)
+    return result
+
+
+def test_held_tilt_is_not_absorbed_into_the_bias():
+    calibration = AdaptiveCalibration(BASE, warmup=200)
+    device = make_device()
+    rest(calibration, device, 100)
+    for _ in range(400):
+        x, _, _, _ = calibration.apply(device, 0.5, 0.0, 0.0, BASE)
+
+    bias = device.calibration.axes[0].mean
+    assert abs(bias) < 0.05
+    assert abs(x - 0.5) < 0.05
+
+
+def test_resting_player_keeps_thresholds_near_the_configured_ones():
+    calibration = AdaptiveCalibration(BASE, warmup=200, min_scale=0.75, max_scale=2.0)
+    device = make_device()
+    _, _, _, thresholds = rest(calibration, device, 400)
+
+    assert thresholds == (0.75 * 0.3,) * 3
+
+
+def test_large_movements_raise_thresholds_up_to_the_limit():
+    calibration = AdaptiveCalibration(BASE, warmup=200, min_scale=0.75, max_scale=2.0)
+    device = make_device()
+    for i in range(400):
+        swing = 1.5 if i % 2 else -1.5
+        _, _, _, thresholds = calibration.apply(device, swing, swing, swing, BASE)
+
+    assert thresholds == (2.0 * 0.3,) * 3
+
+
+def test_runtime_thresholds_bound_adapted_ones():
+    calibration = AdaptiveCalibration(BASE, warmup=200, min_scale=0.75, max_scale=2.0)
+    device = make_device()
+    rest(calibration, device, 400)
+
+    # X_THRESHOLD raised to 0.9 at runtime, after warming up
+    _, _, _, thresholds = calibration.apply(device, 0.0, 0.0, 0.0, (0.9, 0.3, 0.3))
+    assert thresholds[0] == 0.75 * 0.9
+    assert classify(0.5, 0.0, 0.0, thresholds) is None
+
+
+def test_engine_follows_runtime_and_device_thresholds_after_warmup():
+    registry = DeviceRegistry(4, 64, float('inf'), {"right": "right", "left": "left", "up": "up", "down": "down"})
+    presses = []
+    engine = create_engine(registry, presses.append, "threshold", verbose=False, calibration_path=None)
+    device = registry.lookup(1, ('10.0.0.2', 40000), 0.0)
+
+    def feed(x, count, start):
+        for i in range(count):
+            now = start + i
+            device.add_samples(np.array([[x, 0.0, 0.0]], dtype=np.float32), np.array([now]), now)
+            engine.process(device, now)
+
+    feed(0.0, 400, 0.0)
+    engine.settings.update({"X_THRESHOLD": 0.9})
+    feed(0.5, 20, 1000.0)
+    assert presses == []
+    assert device.thresholds[0] == 0.75 * 0.9
+
+    engine.settings.update({}, {"1": {"X_THRESHOLD": 0.3}})
+    feed(0.5, 20, 2000.0)
+    assert presses == ["right"] * 20
+
+
+def test_non_finite_samples_leave_the_profile_untouched(tmp_path):
+    path = str(tmp_path / "calibration.json")
+    calibration = AdaptiveCalibration(BASE, warmup=200, path=path)
+    device = make_device()
+    rest(calibration, device, 400)
+    before = device.calibration.to_dict()
+
+    for value in (float('nan'), float('inf')):
+        calibration.apply(device, value, 0.0, 0.0, BASE)
+    assert device.calibration.to_dict()["bias"] == before["bias"]
+    assert device.calibration.to_dict()["variance"] == before["variance"]
+
+    _, _, _, thresholds = calibration.apply(device, 0.0, 0.0, 0.0, BASE)
+    assert all(math.isfinite(t) for t in thresholds)
+    calibration.save()
+    assert all(math.isfinite(v) for v in AdaptiveCalibration(BASE, path=path).profiles["id:1"].to_dict()["bias"])
@@ -0,0 +1,78 @@
+import time
+
+import protocol
+from devices import DeviceRegistry
+from link import LinkStats, SequenceResult
+from receiver import PacketHandler, ReceiverStats
+
+
+class RecordingEngine:
+    def __init__(self):
+        self.notified = 0
+        self.heartbeats = 0
+
+    def notify(self, device, received_at):
+        self.notified += 1
+
+    def notify_event(self, device, action, confidence, received_at):
+        self.notified += 1
+
+    def notify_heartbeat(self, device, received_at):
+        self.heartbeats += 1
+
+
+def test_late_and_duplicate_packets():
+    link = LinkStats()
+    for sequence in (0, 1, 3):
+        assert link.track(sequence, sent=sequence * 0.01) == SequenceResult.NEW
+    assert link.track(2, sent=0.02) == SequenceResult.REORDERED
+    assert link.track(2, sent=0.02) == SequenceResult.DUPLICATE
+    assert link.lost == 0
+
+
+def test_restart_with_newer_timestamp_is_a_reset():
+    link = LinkStats()
+    for sequence in range(300):
+        link.track(sequence, sent=100.0 + sequence * 0.01, source=40000)
+    assert link.track(0, sent=104.0, source=40000) == SequenceResult.RESET
+    assert link.track(1, sent=104.01, source=40000) == SequenceResult.NEW
+
+
+def test_restart_from_another_port_is_a_reset():
+    link = LinkStats()
+    for sequence in range(300):
+        link.track(sequence, source=40000)
+    assert link.track(0, source=40001) == SequenceResult.RESET
+
+
+def test_restarted_client_is_not_dropped():
+    registry = DeviceRegistry(4, 256, 30.0, {})
+    engine = RecordingEngine()
+    stats = ReceiverStats()
+    handler = PacketHandler(registry, engine, stats)
+    start = time.time()
+    sample = [(0.0, 0.0, 1.0)]
+
+    for sequence in range(300):
+        handler.handle(protocol.encode(sample, sequence, 7, start + sequence * 0.01),
+                       ('10.0.0.2', 40000), time.perf_counter())
+    # The client restarts: same device id, new port, sequence from zero
+    for sequence in range(200):
+        handler.handle(protocol.encode(sample, sequence, 7, start + 5.0 + sequence * 0.01),
+                       ('10.0.0.2', 40001), time.perf_counter())
+
+    assert engine.notified == 500
+    assert stats.stale == 0 and stats.duplicates == 0
+    assert registry.lookup(7, ('10.0.0.2', 40001), time.time()).link.resets == 1
+
+
+def test_malformed_datagrams_are_counted_as_invalid():
+    engine = RecordingEngine()
+    stats = ReceiverStats()
+    handler = PacketHandler(DeviceRegistry(4, 256, 30.0, {}), engine, stats)
+    for data in (b'{"x": {}}', b'{"x": [1]}', b'{"x": null}', b'[' * 1400, b'TR\x01'):
+        handler.handle(data, ('10.0.0.3', 40000), time.perf_counter())
+    handler.handle(b'{"x": 0.5, "y": 0.0, "z": 0.0}', ('10.0.0.3', 40000), time.perf_counter())
+
+    assert stats.invalid == 5
+    assert engine.notified == 1
@@ -0,0 +1,47 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from outputs import KeyOutput, OutputDispatcher, WebSocketOutput
+
+
+class StuckOutput(KeyOutput):
+    name = "stuck"
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def press(self, key: str):
+        self.release.wait()
+
+
+def test_stop_does_not_block_on_a_stuck_backend():
+    backend = StuckOutput()
+    dispatcher = OutputDispatcher([backend], queue_size=4)
+    dispatcher.start()
+    for _ in range(10):
+        dispatcher.press("up")
+
+    started = time.monotonic()
+    dispatcher.stop()
+    backend.release.set()
+    assert time.monotonic() - started < 5.0
+
+
+def test_websocket_output_reports_a_taken_port():
+    pytest.importorskip("websockets")
+    with socket.socket() as taken:
+        taken.bind(("127.0.0.1", 0))
+        taken.listen()
+        with pytest.raises(RuntimeError):
+            WebSocketOutput("127.0.0.1", taken.getsockname()[1])
+
+
+def test_key_output_requires_press():
+    class Silent(KeyOutput):
+        pass
+
+    with pytest.raises(TypeError):
+        Silent()
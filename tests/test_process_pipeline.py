@@ -0,0 +1,40 @@
+import threading
+import time
+
+import protocol
+from devices import DeviceRegistry
+from process_pipeline import KIND_HEARTBEAT, SAMPLE_RECORD, RingSink, _identity
+from receiver import PacketHandler, ReceiverStats
+from sharedmem import SampleRing
+
+
+def test_ring_records_follow_a_restarted_client_to_its_new_port():
+    ring = SampleRing(SAMPLE_RECORD, 64)
+    try:
+        sink = RingSink(ring, threading.Event())
+        registry = DeviceRegistry(4, 16, 30.0, {})
+        device = registry.lookup(7, ('10.0.0.2', 40000), 0.0)
+        sink.notify_event(device, "up", 1.0, 0.0)
+
+        registry.lookup(7, ('10.0.0.2', 40001), 1.0)
+        sink.notify_event(device, "up", 1.0, 1.0)
+
+        records, _, _ = ring.read(0)
+        assert records['port'].tolist() == [40000, 40001]
+        assert sink.identity(device) == _identity(device)
+    finally:
+        ring.close()
+
+
+def test_heartbeats_reach_the_ring():
+    ring = SampleRing(SAMPLE_RECORD, 64)
+    try:
+        registry = DeviceRegistry(4, 16, 30.0, {})
+        handler = PacketHandler(registry, RingSink(ring, threading.Event()), ReceiverStats())
+        handler.handle(protocol.encode_events([], 1, 7, time.time()), ('10.0.0.2', 40000), time.perf_counter())
+
+        records, _, _ = ring.read(0)
+        assert records['kind'].tolist() == [KIND_HEARTBEAT]
+        assert records['device'].tolist() == [7]
+    finally:
+        ring.close()
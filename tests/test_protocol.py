@@ -0,0 +1,50 @@
+import json
+
+import numpy as np
+import pytest
+
+import protocol
+
+
+def decode(data: bytes):
+    out = protocol.allocate_buffer()
+    return protocol.decode_into(data, out), out
+
+
+def test_json_sample():
+    header, out = decode(json.dumps({"x": 0.5, "y": -1, "z": 0.0, "timestamp": 12.5, "sequence": 3}).encode())
+    assert header.format == 'json' and header.sequence == 3 and header.timestamp == 12.5
+    assert out[0].tolist() == [0.5, -1.0, 0.0]
+
+
+@pytest.mark.parametrize("message", [
+    {"x": None}, {"x": {}}, {"y": [1, 2]}, {"z": "0.1"}, {"x": True},
+    {"x": 1e300}, {"x": 10 ** 400}, {"x": 0.1, "timestamp": "now"},
+])
+def test_json_fields_must_be_finite_numbers(message):
+    with pytest.raises(ValueError):
+        decode(json.dumps(message).encode())
+
+
+@pytest.mark.parametrize("data", [b'{"x": NaN}', b'{"y": Infinity}', b'{"x": 0, "timestamp": -Infinity}',
+                                  b'[1, 2, 3]', b'not json', b'\xff\xfe'])
+def test_malformed_json_is_a_value_error(data):
+    with pytest.raises(ValueError):
+        decode(data)
+
+
+@pytest.mark.parametrize("value", [np.nan, np.inf, -np.inf])
+def test_non_finite_float32_samples_are_rejected(value):
+    data = protocol.encode([(0.0, value, 0.0)], 1, 7, 100.0, dtype=protocol.DTYPE_FLOAT32)
+    with pytest.raises(ValueError):
+        decode(data)
+
+
+def test_non_finite_packet_time_is_rejected():
+    with pytest.raises(ValueError):
+        decode(protocol.encode([(0.0, 0.0, 0.0)], 1, 7, float('nan')))
+
+
+def test_deeply_nested_json_is_a_value_error():
+    with pytest.raises(ValueError):
+        decode(b'[' * 1400)
@@ -0,0 +1,18 @@
+import pytest
+
+import config
+from settings import RuntimeSettings
+
+
+@pytest.mark.parametrize("changes", [
+    {"X_THRESHOLD": "nan"},
+    {"X_THRESHOLD": float('nan')},
+    {"RENDER_FPS": float('inf')},
+    {"WAIT_TIME": "inf"},
+    {"MAX_SAMPLE_AGE": float('nan')},
+])
+def test_non_finite_values_are_rejected(changes):
+    settings = RuntimeSettings.from_module(config)
+    with pytest.raises(ValueError):
+        settings.update(changes)
+    assert settings.current.version == 1
@@ -0,0 +1,16 @@
+# WSGI entry point for production servers
+# Runs a single process: the UDP receiver binds SERVER_PORT, so more than one
+# worker process would fight over it. Use threads for concurrent viewers, and
+# no --preload, since threads started before the fork would not survive it.
+#
+#   gunicorn --workers 1 --threads 64 --bind 0.0.0.0:5000 wsgi:application
+#   waitress-serve --threads 64 --port 5000 wsgi:application
+
+import atexit
+
+from accelerometer_server import create_app
+
+application = create_app()
+
+# Deliver queued key presses and save calibration profiles when the server exits
+atexit.register(application.extensions["temple_run"].stop)